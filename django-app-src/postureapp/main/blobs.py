@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from main.models import PhotoBlobs, PoorPostures
+from PIL import Image
+import hashlib
+import os
+import io
+
+
+# hamming distance under which two frames of the same video are treated as the same photo,
+# None turns the perceptual matching off and only exact duplicates are merged
+NEAR_DUPLICATE_DISTANCE = getattr(settings, 'PHOTO_NEAR_DUPLICATE_DISTANCE', 6)
+
+
+def exact_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def perceptual_hash(content: bytes) -> str:
+    '''
+    64 bits difference hash: the image is shrunk to 9x8 greyscale pixels and each bit
+    tells whether a pixel is brighter than its right neighbour. JPEG noise and small
+    movements barely change it, unlike the exact hash.
+    '''
+    image = Image.open(io.BytesIO(content)).convert('L').resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = list(image.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
+
+
+def image_width(content: bytes) -> int:
+    '''width in pixels read from the image header, None when the content isn't a readable image'''
+    try:
+        return Image.open(io.BytesIO(content)).width
+    except (OSError, ValueError):
+        return None
+
+
+def hamming_distance(hash1: str, hash2: str) -> int:
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count('1')
+
+
+def blob_name(sha256: str, filename: str) -> str:
+    '''content addressed storage path, fanned out on the first two hex digits'''
+    extension = os.path.splitext(filename)[1].lower() or '.jpg'
+    return f'poor_postures/{sha256[:2]}/{sha256}{extension}'
+
+
+def _near_duplicate(user, session_start, phash: str):
+    '''returns a blob of the same video whose photo looks the same, if any'''
+    if NEAR_DUPLICATE_DISTANCE is None or session_start is None or not phash:
+        return None
+    candidates = PhotoBlobs.objects.filter(
+        poorpostures__subject=user, 
+        poorpostures__session_start=session_start, 
+        archived=False
+    ).exclude(phash='').distinct()
+    for blob in candidates:
+        if hamming_distance(blob.phash, phash) <= NEAR_DUPLICATE_DISTANCE:
+            return blob
+    return None
+
+
+def _get_or_store_blob(content: bytes, sha256: str, phash: str, filename: str) -> tuple:
+    blob = PhotoBlobs.objects.filter(sha256=sha256).first()
+    if blob and blob.archived:
+        # the file was archived by compact_photos, the new photo brings it back
+        if not default_storage.exists(blob.image.name):
+            default_storage.save(blob.image.name, ContentFile(content))
+        PhotoBlobs.objects.filter(pk=blob.pk).update(archived=False)
+        blob.archived = False
+    if blob:
+        return blob, False
+    name = blob_name(sha256, filename)
+    # the file may already exist if a previous attempt failed after writing it
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    try:
+        with transaction.atomic():
+            blob = PhotoBlobs.objects.create(sha256=sha256, phash=phash, image=name, size=len(content), width=image_width(content))
+        return blob, True
+    except IntegrityError:
+        # another upload stored the same image at the same time
+        return PhotoBlobs.objects.get(sha256=sha256), False
+
+
+def store_posture_photo(user, file, session_start=None) -> tuple:
+    '''
+    stores an uploaded incorrect posture photo, reusing the blob of an identical image
+    or of a near-identical one taken during the same video.
+
+    :param user: owner of the photo
+    :param file: uploaded file
+    :param session_start: start of the monitoring video, enables near-duplicate matching
+    :returns: the new PoorPostures row and whether a new blob was written
+    '''
+    content = file.read()
+    sha256 = exact_hash(content)
+    try:
+        phash = perceptual_hash(content) if NEAR_DUPLICATE_DISTANCE is not None else ''
+    except (OSError, ValueError):
+        # not a readable image, it can still be stored by its exact hash
+        phash = ''
+
+    blob = _near_duplicate(user, session_start, phash)
+    created = False
+    if blob is None:
+        blob, created = _get_or_store_blob(content, sha256, phash, file.name)
+
+    posture = PoorPostures.objects.create(
+        subject=user, 
+        posture_photo=blob.image.name, 
+        blob=blob, 
+        session_start=session_start
+    )
+    return posture, created
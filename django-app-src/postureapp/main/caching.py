@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from main.models import Videos
+from main.utils import get_latest_notifications, keyset_page
+
+
+# seconds a cached read lives at most, the post_save handlers in main/signals.py drop it as soon as its rows change
+CACHE_TIMEOUT = getattr(settings, 'VIEW_CACHE_TIMEOUT', 3600)
+
+
+# cache keys of the data read on every request
+def notifications_key(user_id: int) -> str:
+    return f'main:notifications:{user_id}'
+
+
+def history_key(user_id: int) -> str:
+    return f'main:history:{user_id}'
+
+
+def cached_notifications(user: object) -> dict:
+    '''back and neck alert counts of a user, read from the database once per change'''
+    key = notifications_key(user.pk)
+    notifications = cache.get(key)
+    if notifications is None:
+        notifications = get_latest_notifications(user)
+        cache.set(key, notifications, CACHE_TIMEOUT)
+    return notifications
+
+
+def cached_history(user: object, page_size: int) -> tuple:
+    '''
+    first page of the history, the one every visit of the history page starts from.
+    older pages are rarely visited and read from the database.
+
+    :returns: the videos of the page and the cursor of the next one
+    '''
+    key = history_key(user.pk)
+    page = cache.get(key)
+    if page is None:
+        # the timelines aren't shown and can't be pickled as the memoryviews PostgreSQL returns
+        videos = Videos.objects.filter(subject=user).defer('neck_timeline', 'back_timeline')
+        page = keyset_page(videos, field='end_time', page_size=page_size)
+        cache.set(key, page, CACHE_TIMEOUT)
+    return page
+
+
+# invalidation, called by the signal handlers
+def invalidate_home(user_id: int) -> None:
+    cache.delete(make_template_fragment_key('home', [user_id]))
+
+
+def invalidate_notifications(user_id: int) -> None:
+    cache.delete(notifications_key(user_id))
+
+
+def invalidate_history(user_id: int) -> None:
+    cache.delete(history_key(user_id))
+
+
+def invalidate_testimonials() -> None:
+    cache.delete(make_template_fragment_key('testimonials'))
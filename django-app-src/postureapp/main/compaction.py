@@ -0,0 +1,308 @@
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef, ProtectedError
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from main.models import PoorPostures, PhotoBlobs, PhotoArchives
+from main.thumbnails import VARIANT_WIDTHS, variant_name, get_variant
+from PIL import Image, ImageDraw
+import tempfile
+import datetime
+import zipfile
+import shutil
+import os
+import io
+
+
+# photos older than archive_after_days are packed into per-session archives and deleted, archives
+# included, after delete_after_days (None keeps them). users maps an email to its own rules.
+PHOTO_RETENTION = getattr(settings, 'PHOTO_RETENTION', {'archive_after_days': 30, 'delete_after_days': None, 'users': {}})
+# thumbnails per row of a contact sheet, each as wide as the smallest variant
+CONTACT_SHEET_COLUMNS = 4
+CONTACT_SHEET_WIDTH = VARIANT_WIDTHS[0]
+# storage folders swept for orphaned files
+MEDIA_FOLDERS = ('poor_postures', 'thumbnails', 'photo_archives', 'contact_sheets')
+
+
+def retention_rules(user: object) -> tuple:
+    '''(archive after, delete after) in days for a user, None disables the step'''
+    rules = dict(PHOTO_RETENTION)
+    rules.update(PHOTO_RETENTION.get('users', {}).get(user.email, {}))
+    return rules.get('archive_after_days'), rules.get('delete_after_days')
+
+
+def _replace(name: str, content) -> str:
+    '''saves a file under exactly this name, a run interrupted after writing it rewrites the same file'''
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, content)
+
+
+def _delete_files(photo_name: str) -> None:
+    '''deletes an original photo and its variants'''
+    for name in [photo_name] + [variant_name(photo_name, width) for width in VARIANT_WIDTHS]:
+        if default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def _delete_unused_photos(names: set) -> None:
+    '''
+    deletes the files of photos stored before blobs existed: the original once only archived photos use it,
+    its variants too once no photo does
+    '''
+    rows = PoorPostures.objects.filter(posture_photo__in=names)
+    remaining = set(rows.values_list('posture_photo', flat=True))
+    unarchived = set(rows.filter(archive__isnull=True).values_list('posture_photo', flat=True))
+    for name in names - unarchived:
+        if PhotoBlobs.objects.filter(image=name).exists():
+            continue
+        if name not in remaining:
+            _delete_files(name)
+        elif default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def _ensure_variants(photo_name: str) -> bool:
+    '''generates the missing variants from the original, False when the original is gone'''
+    try:
+        for width in VARIANT_WIDTHS:
+            get_variant(photo_name, width)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def contact_sheet(photos: list) -> bytes:
+    '''
+    JPEG grid of the smallest variant of each photo labelled with the time it was taken
+
+    :param photos: PoorPostures rows whose variants exist
+    '''
+    cell_height = CONTACT_SHEET_WIDTH * 3 // 4
+    rows = (len(photos) + CONTACT_SHEET_COLUMNS - 1) // CONTACT_SHEET_COLUMNS
+    columns = min(len(photos), CONTACT_SHEET_COLUMNS)
+    sheet = Image.new('RGB', (columns * CONTACT_SHEET_WIDTH, rows * cell_height), 'white')
+    draw = ImageDraw.Draw(sheet)
+    for index, photo in enumerate(photos):
+        x = index % CONTACT_SHEET_COLUMNS * CONTACT_SHEET_WIDTH
+        y = index // CONTACT_SHEET_COLUMNS * cell_height
+        name = variant_name(photo.posture_photo.name, CONTACT_SHEET_WIDTH)
+        if default_storage.exists(name):
+            with default_storage.open(name, 'rb') as f:
+                thumbnail = Image.open(f)
+                thumbnail.thumbnail((CONTACT_SHEET_WIDTH, cell_height))
+                sheet.paste(thumbnail.convert('RGB'), (x, y))
+        draw.text((x + 4, y + 4), timezone.localtime(photo.date_created).strftime('%H:%M:%S'), fill='yellow')
+    buffer = io.BytesIO()
+    sheet.save(buffer, format='JPEG', quality=80, optimize=True)
+    return buffer.getvalue()
+
+
+def pack_photos(user: object, session_start, photos: list) -> PhotoArchives:
+    '''
+    writes the originals of one session into a zip and a contact sheet, then points the photos at them.
+    the zip is built in a temporary file so only one photo is in memory at a time.
+
+    :param session_start: start of the video, None for photos uploaded without it
+    :param photos: PoorPostures rows of the session, not archived yet
+    '''
+    stamp = timezone.localtime(session_start or photos[0].date_created)
+    # named after the first photo so a rerun after a crash replaces the same files
+    base = f'{user.pk}/{stamp:%Y%m%d-%H%M%S}-{photos[0].pk}'
+    packed = []
+    with tempfile.TemporaryFile() as tmp:
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_STORED) as archive:
+            for photo in photos:
+                name = photo.posture_photo.name
+                # thumbnails are made before the original can go
+                if not _ensure_variants(name):
+                    continue
+                member = f'{photo.pk}-{timezone.localtime(photo.date_created):%Y%m%d-%H%M%S}{os.path.splitext(name)[1]}'
+                with default_storage.open(name, 'rb') as f, archive.open(member, 'w') as target:
+                    shutil.copyfileobj(f, target)
+                packed.append(photo)
+        size = tmp.tell()
+        tmp.seek(0)
+        archive_name = _replace(f'photo_archives/{base}.zip', File(tmp))
+    sheet_name = _replace(f'contact_sheets/{base}.jpg', ContentFile(contact_sheet(photos)))
+
+    with transaction.atomic():
+        archive = PhotoArchives.objects.create(
+            subject=user,
+            session_start=session_start,
+            archive=archive_name,
+            contact_sheet=sheet_name,
+            photos=len(packed),
+            size=size
+        )
+        # update() leaves the auto_now date_created of the photos untouched. photos whose original was already
+        # missing are archived too, with nothing in the zip, so they aren't retried on every run
+        PoorPostures.objects.filter(pk__in=[photo.pk for photo in photos]).update(archive=archive)
+    # originals shared through a blob are released by release_blobs once every photo using them is archived
+    _delete_unused_photos({photo.posture_photo.name for photo in photos if photo.blob_id is None})
+    return archive
+
+
+def archive_sessions(user: object, before: datetime.datetime, batch_size: int=100, limit: int=None, dry_run: bool=False) -> tuple:
+    '''
+    packs the user's photos taken before a date, one archive per session (per day for photos without a session)
+    and per batch_size photos. the work left is read from the database, so an interrupted run resumes where it stopped.
+
+    :param limit: maximum number of sessions packed in this call
+    :returns: number of archives and of photos packed, or that would be with dry_run
+    '''
+    pending = PoorPostures.objects.filter(subject=user, date_created__lt=before, archive__isnull=True)
+    sessions = pending.annotate(day=TruncDate('date_created')).values_list('session_start', 'day').distinct().order_by('day', 'session_start')
+    if limit:
+        sessions = sessions[:limit]
+    archives = photos = 0
+    for session_start, day in list(sessions):
+        session = pending.filter(session_start=session_start, date_created__date=day).order_by('date_created', 'pk')
+        if dry_run:
+            count = session.count()
+            archives += (count + batch_size - 1) // batch_size
+            photos += count
+            continue
+        while True:
+            batch = list(session[:batch_size])
+            if not batch:
+                break
+            pack_photos(user, session_start, batch)
+            archives += 1
+            photos += len(batch)
+    return archives, photos
+
+
+def expire_photos(user: object, before: datetime.datetime, batch_size: int=100, dry_run: bool=False) -> int:
+    '''
+    deletes the user's photos taken before a date along with the archives left empty
+
+    :returns: number of photos deleted, or that would be with dry_run
+    '''
+    expired = PoorPostures.objects.filter(subject=user, date_created__lt=before)
+    if dry_run:
+        return expired.count()
+    deleted = 0
+    while True:
+        batch = list(expired.values_list('pk', 'archive', 'posture_photo', 'blob')[:batch_size])
+        if not batch:
+            break
+        PoorPostures.objects.filter(pk__in=[pk for pk, _, _, _ in batch]).delete()
+        deleted += len(batch)
+        _delete_unused_photos({name for _, _, name, blob in batch if blob is None})
+        archive_ids = {archive for _, archive, _, _ in batch if archive is not None}
+        empty = PhotoArchives.objects.filter(pk__in=archive_ids).exclude(Exists(PoorPostures.objects.filter(archive=OuterRef('pk'))))
+        for archive in empty:
+            default_storage.delete(archive.archive.name)
+            default_storage.delete(archive.contact_sheet.name)
+            archive.delete()
+    return deleted
+
+
+def release_blobs(batch_size: int=100, dry_run: bool=False) -> tuple:
+    '''
+    deletes the files of blobs that no photo uses anymore and the originals of blobs whose photos are all
+    archived, the thumbnails of the latter are kept for the feed
+
+    :returns: number of blobs deleted and of originals released
+    '''
+    used = PoorPostures.objects.filter(blob=OuterRef('pk'))
+    unused = PhotoBlobs.objects.exclude(Exists(used))
+    archived = PhotoBlobs.objects.filter(Exists(used), archived=False).exclude(Exists(used.filter(archive__isnull=True)))
+    if dry_run:
+        return unused.count(), archived.count()
+
+    deleted = last = 0
+    while True:
+        batch = list(unused.filter(pk__gt=last).order_by('pk')[:batch_size])
+        if not batch:
+            break
+        for blob in batch:
+            last = blob.pk
+            try:
+                blob.delete()
+            except ProtectedError:
+                # a photo identical to it was uploaded meanwhile
+                continue
+            _delete_files(blob.image.name)
+            deleted += 1
+
+    released = 0
+    while True:
+        batch = list(archived[:batch_size])
+        if not batch:
+            break
+        for blob in batch:
+            if _ensure_variants(blob.image.name) and default_storage.exists(blob.image.name):
+                default_storage.delete(blob.image.name)
+            PhotoBlobs.objects.filter(pk=blob.pk).update(archived=True)
+            released += 1
+    return deleted, released
+
+
+def _walk(folder: str):
+    '''storage names of every file under a folder, directory by directory'''
+    try:
+        directories, files = default_storage.listdir(folder)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield f'{folder}/{name}'
+    for directory in directories:
+        yield from _walk(f'{folder}/{directory}')
+
+
+def _referenced(folder: str, names: list) -> set:
+    '''names of a batch that belong to a row'''
+    if folder == 'poor_postures':
+        return set(PhotoBlobs.objects.filter(image__in=names).values_list('image', flat=True)) | \
+            set(PoorPostures.objects.filter(posture_photo__in=names).values_list('posture_photo', flat=True))
+    if folder == 'photo_archives':
+        return set(PhotoArchives.objects.filter(archive__in=names).values_list('archive', flat=True))
+    if folder == 'contact_sheets':
+        return set(PhotoArchives.objects.filter(contact_sheet__in=names).values_list('contact_sheet', flat=True))
+    # a variant belongs to the original with the same file name, stored by blob_name or before blobs existed
+    # every width of a photo has the same file name, each original maps to all of its variants
+    originals = {}
+    for name in names:
+        filename = os.path.basename(name)
+        originals.setdefault(f'poor_postures/{filename[:2]}/{filename}', set()).add(name)
+        originals.setdefault(f'poor_postures/{filename}', set()).add(name)
+    found = _referenced('poor_postures', list(originals))
+    return set().union(*(originals[original] for original in found))
+
+
+def delete_orphans(grace: datetime.timedelta=datetime.timedelta(hours=1), batch_size: int=500, dry_run: bool=False) -> int:
+    '''
+    deletes the media files no row refers to, checked batch_size files at a time. files younger than grace
+    are left alone, an upload writes its file before creating its row.
+
+    :returns: number of orphaned files deleted, or that would be with dry_run
+    '''
+    cutoff = timezone.now() - grace
+    deleted = 0
+    for folder in MEDIA_FOLDERS:
+        batch = []
+        for name in _walk(folder):
+            batch.append(name)
+            if len(batch) == batch_size:
+                deleted += _delete_orphaned(folder, batch, cutoff, dry_run)
+                batch = []
+        if batch:
+            deleted += _delete_orphaned(folder, batch, cutoff, dry_run)
+    return deleted
+
+
+def _delete_orphaned(folder: str, names: list, cutoff: datetime.datetime, dry_run: bool) -> int:
+    referenced = _referenced(folder, names)
+    deleted = 0
+    for name in names:
+        if name in referenced or default_storage.get_modified_time(name) > cutoff:
+            continue
+        if not dry_run:
+            default_storage.delete(name)
+        deleted += 1
+    return deleted
@@ -0,0 +1,115 @@
+from channels.generic.websocket import WebsocketConsumer
+from asgiref.sync import async_to_sync
+from django.contrib.auth import authenticate
+from main.utils import record_alert, monitor_group
+import json
+
+
+# MoveNet keypoints sent by the device: 17 (y, x, score) rows packed as float16
+KEYPOINTS_BYTES = 17 * 3 * 2
+
+
+# persistent channel of a Jetson Nano: authenticated once, then alerts, heartbeats and keypoints
+class DeviceConsumer(WebsocketConsumer):
+    '''
+    * The first message authenticates the device with the same email and password as the HTTP endpoints,
+      so the password is only hashed once per connection instead of once per alert.
+    * Alerts are stored like /main/my-endpoint/ does and acknowledged with their id.
+    * Alerts, heartbeats and keypoints are fanned out to the user's open monitoring pages.
+    * Frames that aren't json objects and alerts missing their fields get an error frame back and are dropped.
+    '''
+    def connect(self):
+        self.user = None
+        self.accept()
+
+    def disconnect(self, code):
+        if self.user is not None:
+            self._fan_out({'type': 'device.status', 'online': False})
+
+    def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            # keypoints are forwarded untouched, the page unpacks them
+            if self.user is not None and len(bytes_data) == KEYPOINTS_BYTES:
+                self._fan_out({'type': 'posture.keypoints', 'keypoints': bytes_data})
+            return
+
+        # a malformed frame is answered with an error instead of tearing the connection down
+        try:
+            message = json.loads(text_data)
+        except (TypeError, ValueError):
+            message = None
+        if not isinstance(message, dict):
+            self._error('messages must be json objects')
+            return
+
+        if self.user is None:
+            self._authenticate(message)
+        elif message.get('type') == 'alert':
+            try:
+                alert = message['alert']
+                level = int(message.get('level', 0))
+                alert_types = alert.split(',')
+            except (KeyError, TypeError, ValueError, AttributeError):
+                self._error('alerts need an alert string and an integer level', message.get('id'))
+                return
+            notification = record_alert(self.user, alert_types)
+            self.send(text_data=json.dumps({'type': 'ack', 'id': message.get('id')}))
+            self._fan_out({
+                'type': 'posture.alert', 
+                'alert': alert, 
+                'level': level,
+                'back_alert': notification.back_alert, 
+                'neck_alert': notification.neck_alert,
+            })
+        elif message.get('type') == 'heartbeat':
+            self.send(text_data=json.dumps({'type': 'heartbeat', 'time': message.get('time')}))
+            self._fan_out({'type': 'device.status', 'online': True})
+
+    def _authenticate(self, message: dict) -> None:
+        user = None
+        if message.get('type') == 'auth':
+            user = authenticate(None, email=message.get('email'), password=message.get('password'))
+        if user is None:
+            self.send(text_data=json.dumps({'type': 'auth', 'status': 'incorrect email or password'}))
+            self.close(code=4001)
+            return
+        self.user = user
+        self.send(text_data=json.dumps({'type': 'auth', 'status': 'user identified'}))
+        self._fan_out({'type': 'device.status', 'online': True})
+
+    def _error(self, error: str, message_id=None) -> None:
+        self.send(text_data=json.dumps({'type': 'error', 'error': error, 'id': message_id}))
+
+    def _fan_out(self, event: dict) -> None:
+        async_to_sync(self.channel_layer.group_send)(monitor_group(self.user), event)
+
+
+# monitoring page of a logged in user, receives what their devices send
+class MonitorConsumer(WebsocketConsumer):
+    def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            self.close(code=4001)
+            return
+        self.group = monitor_group(user)
+        async_to_sync(self.channel_layer.group_add)(self.group, self.channel_name)
+        self.accept()
+
+    def disconnect(self, code):
+        if hasattr(self, 'group'):
+            async_to_sync(self.channel_layer.group_discard)(self.group, self.channel_name)
+
+    def posture_alert(self, event):
+        self.send(text_data=json.dumps({
+            'type': 'alert', 
+            'alert': event['alert'], 
+            'level': event['level'],
+            'back_alert': event['back_alert'], 
+            'neck_alert': event['neck_alert'],
+        }))
+
+    def device_status(self, event):
+        self.send(text_data=json.dumps({'type': 'device', 'online': event['online']}))
+
+    def posture_keypoints(self, event):
+        self.send(bytes_data=event['keypoints'])
@@ -0,0 +1,145 @@
+from django.conf import settings
+from main.models import Videos, PoorPostures
+from main.utils import timeline_runs, NECK_POSTURES, BACK_POSTURES
+import tempfile
+import datetime
+import json
+import csv
+
+
+# rows fetched per round trip of the server-side cursor, only one chunk is held in memory at a time
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+# columns of every dataset, in the order they are written
+VIDEO_COLUMNS = ['id', 'start_time', 'end_time', 'total_time_seconds', 'total_alerts', 'incorrect_postures', 'posture_score', 'posture_seconds']
+TIMELINE_COLUMNS = ['video_id', 'session_start', 'body_part', 'posture', 'start_ms', 'duration_ms']
+PHOTO_COLUMNS = ['id', 'date_created', 'session_start', 'posture_photo', 'sha256', 'size', 'archive']
+
+
+def _value(value):
+    '''json friendly version of a column value'''
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def video_rows(user: object, since: datetime.datetime=None):
+    '''one dict per video of the user, oldest first, without the binary timelines'''
+    videos = Videos.objects.filter(subject=user).defer('neck_timeline', 'back_timeline')
+    if since is not None:
+        videos = videos.filter(start_time__gte=since)
+    for video in videos.order_by('start_time', 'pk').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'id': video.id,
+            'start_time': video.start_time,
+            'end_time': video.end_time,
+            'total_time_seconds': video.total_time_seconds,
+            'total_alerts': video.total_alerts,
+            'incorrect_postures': video.incorrect_postures or [],
+            'posture_score': video.posture_score,
+            'posture_seconds': video.posture_seconds or {},
+        }
+
+
+def timeline_rows(user: object, since: datetime.datetime=None):
+    '''one dict per posture run of the user's timelines, videos without a timeline are skipped'''
+    videos = Videos.objects.filter(subject=user).only('id', 'start_time', 'neck_timeline', 'back_timeline')
+    if since is not None:
+        videos = videos.filter(start_time__gte=since)
+    for video in videos.order_by('start_time', 'pk').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        for body_part, timeline, names in (('neck', video.neck_timeline, NECK_POSTURES), ('back', video.back_timeline, BACK_POSTURES)):
+            for code, start, duration in timeline_runs(timeline):
+                yield {
+                    'video_id': video.id,
+                    'session_start': video.start_time,
+                    'body_part': body_part,
+                    'posture': names.get(code, chr(code)),
+                    'start_ms': start,
+                    'duration_ms': duration,
+                }
+
+
+def photo_rows(user: object, since: datetime.datetime=None):
+    '''one dict per incorrect posture photo of the user, the metadata only'''
+    photos = PoorPostures.objects.filter(subject=user).select_related('blob', 'archive')
+    if since is not None:
+        photos = photos.filter(date_created__gte=since)
+    for photo in photos.order_by('date_created', 'pk').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'id': photo.id,
+            'date_created': photo.date_created,
+            'session_start': photo.session_start,
+            'posture_photo': photo.posture_photo.name,
+            'sha256': photo.blob.sha256 if photo.blob else '',
+            'size': photo.blob.size if photo.blob else None,
+            # zip holding the original once compact_photos archived it
+            'archive': photo.archive.archive.name if photo.archive else '',
+        }
+
+
+# dataset name in the url: (rows generator, columns)
+EXPORT_DATASETS = {
+    'videos': (video_rows, VIDEO_COLUMNS),
+    'timelines': (timeline_rows, TIMELINE_COLUMNS),
+    'photos': (photo_rows, PHOTO_COLUMNS),
+}
+
+
+class _Echo:
+    '''file-like object handing back what csv.writer writes instead of buffering it'''
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_lines(rows, columns: list):
+    '''
+    encodes rows as csv one line at a time
+
+    :param rows: iterable of dicts
+    :param columns: keys written, in order, preceded by a header line
+    '''
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        # lists and dicts are written as json inside their cell
+        yield writer.writerow([
+            json.dumps(value) if isinstance(value, (list, dict)) else _value(value)
+            for value in (row[column] for column in columns)
+        ])
+
+
+def jsonl_lines(rows, columns: list):
+    '''encodes rows as json lines, one object per row'''
+    for row in rows:
+        yield json.dumps({column: _value(row[column]) for column in columns}) + '\n'
+
+
+def export_lines(dataset: str, export_format: str, user: object, since: datetime.datetime=None):
+    '''
+    lazily encoded lines of a dataset, the queries only run once they are iterated
+
+    :param dataset: videos, timelines or photos
+    :param export_format: csv or jsonl
+    :param since: only rows from this time onwards
+    '''
+    rows, columns = EXPORT_DATASETS[dataset]
+    encode = csv_lines if export_format == 'csv' else jsonl_lines
+    return encode(rows(user, since), columns)
+
+
+def export_file(dataset: str, export_format: str, user: object, since: datetime.datetime=None):
+    '''
+    writes a dataset to a temporary file on disk and returns it rewound. the rows are read and encoded in the
+    calling thread: under ASGI a streamed response is iterated inside the event loop, where queries aren't allowed.
+
+    :param dataset: videos, timelines or photos
+    :param export_format: csv or jsonl
+    :param since: only rows from this time onwards
+    '''
+    export = tempfile.TemporaryFile()
+    for line in export_lines(dataset, export_format, user, since):
+        export.write(line.encode())
+    export.seek(0)
+    return export
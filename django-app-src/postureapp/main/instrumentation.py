@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db import connection
+from collections import deque
+import threading
+import logging
+import bisect
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class QueryCounter:
+    '''
+    database execute wrapper counting the queries of one request and the time spent in them,
+    queries slower than slow_threshold seconds are logged with their SQL
+    '''
+    def __init__(self, slow_threshold: float=None, label: str=''):
+        self.count = 0
+        self.time = 0.0
+        self.slow_threshold = slow_threshold
+        self.label = label
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.time += duration
+            if self.slow_threshold is not None and duration >= self.slow_threshold:
+                logger.warning('slow query (%.1f ms) in %s: %s; params=%r', duration * 1000, self.label, sql, params)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+class ViewStats:
+    '''running totals of one view, with its latest latencies kept for percentiles'''
+    def __init__(self, samples: int):
+        self.requests = 0
+        self.errors = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.queries = 0
+        self.queries_max = 0
+        self.query_time = 0.0
+        self.response_bytes = 0
+        self.response_bytes_max = 0
+        self.latencies = deque(maxlen=samples)
+
+    def add(self, latency: float, error: bool, queries: int, query_time: float, response_bytes: int) -> None:
+        self.requests += 1
+        self.errors += error
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.queries += queries
+        self.queries_max = max(self.queries_max, queries)
+        self.query_time += query_time
+        self.response_bytes += response_bytes
+        self.response_bytes_max = max(self.response_bytes_max, response_bytes)
+        self.latencies.append(latency)
+
+    def as_dict(self) -> dict:
+        latencies = [latency * 1000 for latency in self.latencies]
+        cumulative = 0
+        histogram = {}
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), self.buckets):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_ms': {
+                'mean': round(self.latency_sum / self.requests * 1000, 2),
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(self.latency_max * 1000, 2),
+            },
+            'latency_histogram': histogram,
+            'queries': {
+                'mean': round(self.queries / self.requests, 2),
+                'max': self.queries_max,
+                'mean_time_ms': round(self.query_time / self.requests * 1000, 2),
+            },
+            'response_bytes': {
+                'mean': round(self.response_bytes / self.requests),
+                'max': self.response_bytes_max,
+            },
+        }
+
+
+class RequestStats:
+    '''
+    * Bounded in-memory store of the cost of every view of this server process.
+    * At most max_views views are tracked, later ones are counted together as "other", and only the
+      latest samples latencies of each view are kept for percentiles, totals and histograms cover everything.
+    '''
+    def __init__(self, max_views: int=200, samples: int=1000):
+        self.__lock = threading.Lock()
+        self.__max_views = max_views
+        self.__samples = samples
+        self.__views = {}
+        self.__started = time.time()
+
+    def add(self, view: str, latency: float, error: bool, queries: int, query_time: float, response_bytes: int) -> None:
+        with self.__lock:
+            stats = self.__views.get(view)
+            if stats is None:
+                if len(self.__views) >= self.__max_views:
+                    view = 'other'
+                stats = self.__views.setdefault(view, ViewStats(self.__samples))
+            stats.add(latency, error, queries, query_time, response_bytes)
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            return {
+                'since': self.__started,
+                'views': {view: stats.as_dict() for view, stats in sorted(self.__views.items())},
+            }
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__views = {}
+            self.__started = time.time()
+
+
+# store of this process, read by the request stats endpoint
+request_stats = RequestStats(
+    max_views=getattr(settings, 'REQUEST_STATS_MAX_VIEWS', 200), 
+    samples=getattr(settings, 'REQUEST_STATS_SAMPLES', 1000)
+)
+
+
+class RequestTimingMiddleware:
+    '''
+    * Times every request, counts its queries and their time, and measures the response size,
+      all recorded per view name in request_stats.
+    * Queries slower than SLOW_QUERY_THRESHOLD seconds are logged with their SQL.
+    * Streaming responses (sse) are timed until their headers, their size isn't known.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', 0.1)
+
+    def __call__(self, request):
+        counter = QueryCounter(self.slow_threshold, request.path)
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        latency = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        response_bytes = 0 if response.streaming else len(response.content)
+        request_stats.add(view, latency, response.status_code >= 500, counter.count, counter.time, response_bytes)
+        return response
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.models import User
+from main.compaction import retention_rules, expire_photos, archive_sessions, release_blobs, delete_orphans
+import datetime
+
+
+# periodic media compaction: retention, per-session archives of old photos and orphaned files
+class Command(BaseCommand):
+    help = ("Applies every user's photo retention rules (settings.PHOTO_RETENTION): deletes expired photos, "
+            "packs older ones into per-session archives and contact sheets, keeping their thumbnails for the feed, "
+            "and deletes the media files nothing refers to. Safe to interrupt, the next run carries on.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='only compact the photos of this user')
+        parser.add_argument('--archive-after', type=int, help='days after which photos are archived, overrides the settings')
+        parser.add_argument('--delete-after', type=int, help='days after which photos are deleted, overrides the settings')
+        parser.add_argument('--batch-size', type=int, default=100, help='photos handled at a time, also the largest archive')
+        parser.add_argument('--limit', type=int, default=0, help='sessions archived per user in this run, 0 for all of them')
+        parser.add_argument('--skip-orphans', action='store_true', help="don't sweep the media folders for orphaned files")
+        parser.add_argument('--orphan-grace', type=float, default=1, help='hours a file must have existed to be treated as orphaned')
+        parser.add_argument('--dry-run', action='store_true', help='only report what would be done')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['email']:
+            users = users.filter(email=options['email'])
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        now = timezone.now()
+
+        for user in users.iterator():
+            archive_after, delete_after = retention_rules(user)
+            if options['archive_after'] is not None:
+                archive_after = options['archive_after']
+            if options['delete_after'] is not None:
+                delete_after = options['delete_after']
+
+            expired = archives = archived = 0
+            if delete_after is not None:
+                expired = expire_photos(user, now - datetime.timedelta(days=delete_after), batch_size, dry_run)
+            if archive_after is not None:
+                archives, archived = archive_sessions(user, now - datetime.timedelta(days=archive_after), batch_size, options['limit'], dry_run)
+            if expired or archived:
+                self.stdout.write(f'{user.email}: {expired} photos deleted, {archived} photos packed into {archives} archives')
+
+        deleted, released = release_blobs(batch_size, dry_run)
+        self.stdout.write(f'{released} archived originals released, {deleted} unused blobs deleted')
+        if not options['skip_orphans']:
+            orphans = delete_orphans(datetime.timedelta(hours=options['orphan_grace']), batch_size, dry_run)
+            self.stdout.write(f'{orphans} orphaned files deleted')
+
+        self.stdout.write(self.style.SUCCESS('Dry run, nothing was changed.' if dry_run else 'Photos compacted.'))
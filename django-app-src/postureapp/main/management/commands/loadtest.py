@@ -0,0 +1,240 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.core.files.uploadedfile import SimpleUploadedFile
+from main.models import User
+from main.instrumentation import QueryCounter, percentile
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import requests
+import random
+import struct
+import base64
+import json
+import time
+import io
+
+
+# device endpoints, named as in main/urls.py
+IDENTIFY = '/main/identify-camera/'
+ALERT = '/main/my-endpoint/'
+PHOTOS = '/main/user-incorrect-postures/'
+VIDEO_DATA = '/main/video-data/'
+
+LOADTEST_PASSWORD = 'loadtest-password'
+
+
+class Recorder:
+    '''thread safe store of the latency, status and query counts of every request per endpoint'''
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, endpoint: str, latency: float, ok: bool, queries: int, query_time: float) -> None:
+        with self.__lock:
+            self.samples.setdefault(endpoint, []).append((latency, ok, queries, query_time))
+
+
+class InProcessTransport:
+    '''
+    * Calls the views in this process through django.test.Client and counts the queries they run.
+    * No server, network or worker model is involved and the devices share the GIL with the views: only
+      useful to profile the views themselves, not to size a deployment.
+    '''
+    def __init__(self):
+        self.__client = Client(HTTP_HOST='127.0.0.1', raise_request_exception=False)
+
+    def post(self, endpoint: str, data: dict, files: dict=None) -> tuple:
+        '''
+        :param files: field name: (filename, content, content type)
+        :returns: whether the request succeeded, its number of queries and their time
+        '''
+        data = dict(data)
+        for name, (filename, content, content_type) in (files or {}).items():
+            data[name] = SimpleUploadedFile(filename, content, content_type=content_type)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.__client.post(endpoint, data)
+        return response.status_code < 400, counter.count, counter.time
+
+    def close(self) -> None:
+        # each device thread has its own database connection
+        connection.close()
+
+
+class HttpTransport:
+    '''
+    * Posts to a running server over the network with requests, a new connection per request like
+      DjangoAppSession on the device, so the server's own workers, database pool and network stack are measured.
+    * The queries run by the server aren't visible from here, the request_stats command reports them.
+    '''
+    def __init__(self, url: str, timeout: float):
+        self.__url = url.rstrip('/')
+        self.__timeout = timeout
+
+    def post(self, endpoint: str, data: dict, files: dict=None) -> tuple:
+        response = requests.post(self.__url + endpoint, data=data, files=files, timeout=self.__timeout)
+        return response.status_code < 400, None, None
+
+    def close(self) -> None:
+        pass
+
+
+def synthetic_session(duration: int, alert_interval: float, rng: random.Random) -> dict:
+    '''alerts arriving as a poisson process, every alert at least 10 seconds apart like on the device'''
+    alerts = []
+    t = 0.0
+    while True:
+        t += 10 + rng.expovariate(1 / max(alert_interval - 10, 1))
+        if t >= duration:
+            break
+        alerts.append({'t': t, 'type': rng.choice(['back', 'neck'])})
+    return {'duration': duration, 'alerts': alerts}
+
+
+def synthetic_timeline(duration: int, rng: random.Random, codes: bytes) -> str:
+    '''run-length encoded timeline in the format sent by the device'''
+    runs = bytearray()
+    start = 0
+    end = duration * 1000
+    while start < end:
+        length = min(int(rng.uniform(2, 60) * 1000), end - start)
+        runs += struct.pack('<BII', rng.choice(codes), start, length)
+        start += length
+    return base64.b64encode(bytes(runs)).decode()
+
+
+def synthetic_photo(seed: int) -> bytes:
+    '''small jpeg standing in for a camera frame, a handful of seeds gives repeated frames'''
+    rng = random.Random(seed)
+    image = Image.new('RGB', (640, 480), tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+# simulating Jetson Nanos against the device endpoints to measure server capacity
+class Command(BaseCommand):
+    help = ('Simulates concurrent Jetson Nano devices running the DjangoAppSession protocol and reports latency '
+            'percentiles, error rates and query counts per endpoint. With --url the requests go over HTTP to a running '
+            'server, which must use the same database as this command since the simulated users are created here. '
+            'Without it the views are called in this process, which only profiles the views.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=10, help='number of concurrent devices')
+        parser.add_argument('--duration', type=int, default=600, help='length of a synthetic session in seconds')
+        parser.add_argument('--alert-interval', type=float, default=60, help='mean seconds between synthetic alerts')
+        parser.add_argument('--speed', type=float, default=60, help='how many times faster than real time sessions are replayed')
+        parser.add_argument('--sessions', help='json file with recorded sessions: [{"duration": s, "alerts": [{"t": s, "type": "back"}]}]')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cleanup', action='store_true', help='delete the simulated users and their data afterwards')
+        parser.add_argument('--url', help='base url of a running server, e.g. http://127.0.0.1:8000, instead of calling the views in process')
+        parser.add_argument('--timeout', type=float, default=30, help='seconds before an HTTP request counts as failed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['sessions']:
+            with open(options['sessions']) as f:
+                recorded = json.load(f)
+            sessions = [recorded[i % len(recorded)] for i in range(options['devices'])]
+        else:
+            sessions = [
+                synthetic_session(options['duration'], options['alert_interval'], rng)
+                for _ in range(options['devices'])
+            ]
+
+        users = [self._get_user(i) for i in range(options['devices'])]
+        photos = [synthetic_photo(seed) for seed in range(4)]
+        recorder = Recorder()
+
+        if options['url']:
+            target = options['url']
+            transport = lambda: HttpTransport(options['url'], options['timeout'])
+        else:
+            target = 'the views in process'
+            transport = InProcessTransport
+
+        self.stdout.write(f"Simulating {options['devices']} devices at {options['speed']}x real time against {target}...")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['devices']) as executor:
+            futures = [
+                executor.submit(self._run_device, transport(), user, session, photos, options['speed'], options['seed'] + i, recorder)
+                for i, (user, session) in enumerate(zip(users, sessions))
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        self._report(recorder, elapsed)
+        if options['cleanup']:
+            # only the accounts this run logged in as, never a real account that happens to share the prefix
+            User.objects.filter(pk__in=[user.pk for user in users], email__regex=r'^loadtest-\d+@example\.com$').delete()
+
+    def _get_user(self, index: int) -> User:
+        email = f'loadtest-{index}@example.com'
+        user = User.objects.filter(email=email).first()
+        if user is None:
+            user = User.objects.create_user(email, LOADTEST_PASSWORD, first_name='Load', last_name=f'Test{index}')
+        return user
+
+    def _post(self, transport, endpoint: str, data: dict, recorder: Recorder, files: dict=None) -> None:
+        start = time.perf_counter()
+        try:
+            ok, queries, query_time = transport.post(endpoint, data, files)
+        except Exception:
+            ok, queries, query_time = False, None, None
+        recorder.add(endpoint, time.perf_counter() - start, ok, queries, query_time)
+
+    def _run_device(self, transport, user: User, session: dict, photos: list, speed: float, seed: int, recorder: Recorder) -> None:
+        rng = random.Random(seed)
+        credentials = {'email': user.email, 'password': LOADTEST_PASSWORD}
+        start_time = int(time.time())
+        try:
+            self._post(transport, IDENTIFY, credentials, recorder)
+            elapsed = 0.0
+            for alert in sorted(session['alerts'], key=lambda alert: alert['t']):
+                time.sleep(max(0.0, (alert['t'] - elapsed) / speed))
+                elapsed = alert['t']
+                self._post(transport, ALERT, dict(credentials, alert=alert['type']), recorder)
+
+            # the device uploads one photo per alert at the end of the video
+            for index in range(len(session['alerts'])):
+                image = (f'incorrect_posture_{index}.jpg', rng.choice(photos), 'image/jpeg')
+                self._post(transport, PHOTOS, dict(credentials, start_time=start_time), recorder, files={'image': image})
+
+            data = dict(
+                credentials,
+                start_time=start_time,
+                end_time=start_time + int(session['duration']),
+                total_alerts=len(session['alerts']),
+                incorrect_postures=json.dumps(['forward-leaning back'] * len(session['alerts']) or ['No Incorrect Postures']),
+                neck_timeline=synthetic_timeline(int(session['duration']), rng, b'fu'),
+                back_timeline=synthetic_timeline(int(session['duration']), rng, b'fur'),
+            )
+            self._post(transport, VIDEO_DATA, data, recorder)
+        finally:
+            transport.close()
+
+    def _report(self, recorder: Recorder, elapsed: float) -> None:
+        header = f"{'endpoint':<34}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'queries':>9}{'query ms':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        total = 0
+        for endpoint, samples in sorted(recorder.samples.items()):
+            latencies = [sample[0] * 1000 for sample in samples]
+            errors = sum(1 for sample in samples if not sample[1])
+            counted = [sample for sample in samples if sample[2] is not None]
+            if counted:
+                queries = f'{sum(sample[2] for sample in counted) / len(counted):>9.1f}'
+                query_time = f'{sum(sample[3] for sample in counted) / len(counted) * 1000:>10.2f}'
+            else:
+                # over HTTP the queries run in the server, see the request_stats command
+                queries, query_time = f'{"-":>9}', f'{"-":>10}'
+            total += len(samples)
+            self.stdout.write(
+                f'{endpoint:<34}{len(samples):>9}{errors / len(samples):>8.1%}'
+                f'{percentile(latencies, 50):>9.1f}{percentile(latencies, 90):>9.1f}'
+                f'{percentile(latencies, 99):>9.1f}{max(latencies):>9.1f}{queries}{query_time}'
+            )
+        self.stdout.write(f'\n{total} requests in {elapsed:.1f} s ({total / elapsed:.1f} req/s)')
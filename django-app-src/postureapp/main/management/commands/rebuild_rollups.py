@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import User, Videos, DailyRollups
+from main.utils import session_day, posture_counts
+
+
+# backfilling the daily analytics rollups from the videos already stored
+class Command(BaseCommand):
+    help = "Rebuilds every user's daily rollups from their stored videos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='only rebuild the rollups of this user')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['email']:
+            users = users.filter(email=options['email'])
+
+        for user in users.iterator():
+            days = {}
+            videos = Videos.objects.filter(subject=user).only(
+                'start_time', 'total_time_seconds', 'total_alerts', 'posture_score', 'incorrect_postures'
+            )
+            for video in videos.iterator():
+                day = session_day(video.start_time)
+                rollup = days.get(day)
+                if rollup is None:
+                    rollup = days[day] = DailyRollups(subject=user, day=day)
+                rollup.sessions += 1
+                rollup.monitored_seconds += video.total_time_seconds
+                rollup.alerts += video.total_alerts
+                rollup.score_sum += video.posture_score
+                for column, count in posture_counts(video.incorrect_postures).items():
+                    setattr(rollup, column, getattr(rollup, column) + count)
+
+            with transaction.atomic():
+                DailyRollups.objects.filter(subject=user).delete()
+                DailyRollups.objects.bulk_create(days.values(), batch_size=500)
+            self.stdout.write(f'{user.email}: {len(days)} days')
+
+        self.stdout.write(self.style.SUCCESS('Rollups rebuilt.'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import User, Videos, Statistics
+
+
+# backfilling the per-user statistics from the videos already stored
+class Command(BaseCommand):
+    help = "Rebuilds every user's statistics row from their stored videos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='only rebuild the statistics of this user')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['email']:
+            users = users.filter(email=options['email'])
+
+        for user in users.iterator():
+            with transaction.atomic():
+                statistics, _ = Statistics.objects.select_for_update().get_or_create(subject=user)
+                statistics.reset()
+                # replaying the videos in order gives the same row video_data would have built
+                videos = Videos.objects.filter(subject=user).order_by('end_time').only(
+                    'total_alerts', 'total_time_seconds', 'posture_score', 'end_time'
+                )
+                for video in videos.iterator():
+                    statistics.add_video(video)
+                statistics.save()
+            self.stdout.write(f'{user.email}: {statistics.total_videos} videos')
+
+        self.stdout.write(self.style.SUCCESS('Statistics rebuilt.'))
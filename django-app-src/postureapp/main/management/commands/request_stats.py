@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from urllib.error import HTTPError
+import getpass
+import json
+
+
+# ordering of the report, by a value of the per-view statistics
+SORT_KEYS = {
+    'requests': lambda stats: stats['requests'],
+    'p95': lambda stats: stats['latency_ms']['p95'],
+    'total': lambda stats: stats['latency_ms']['mean'] * stats['requests'],
+    'queries': lambda stats: stats['queries']['mean'],
+    'bytes': lambda stats: stats['response_bytes']['mean'],
+}
+
+
+# reading the request timings collected by the middleware of a running server
+class Command(BaseCommand):
+    help = ('Fetches the per-view latency, query and response size statistics recorded by '
+            'RequestTimingMiddleware in a running server process and prints them as a table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/main/api/request-stats/', help='request stats endpoint of the server')
+        parser.add_argument('--email', required=True, help='email of an admin account')
+        parser.add_argument('--password', help='asked for when not given')
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='total', help='column the views are ordered by')
+        parser.add_argument('--reset', action='store_true', help='clear the statistics after reading them')
+        parser.add_argument('--json', action='store_true', help='print the raw statistics')
+
+    def handle(self, *args, **options):
+        password = options['password'] or getpass.getpass('Admin password: ')
+        data = {'email': options['email'], 'password': password}
+        if options['reset']:
+            data['reset'] = '1'
+        try:
+            with urlopen(options['url'], data=urlencode(data).encode()) as response:
+                snapshot = json.loads(response.read())
+        except HTTPError as e:
+            raise CommandError(f'{options["url"]} answered {e.code}: {e.read().decode()}')
+
+        if options['json']:
+            self.stdout.write(json.dumps(snapshot, indent=2))
+            return
+
+        header = f"{'view':<30}{'requests':>9}{'errors':>8}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'queries':>9}{'query ms':>10}{'kB':>8}"
+        self.stdout.write(f"server process {snapshot['pid']}")
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        views = sorted(snapshot['views'].items(), key=lambda item: SORT_KEYS[options['sort']](item[1]), reverse=True)
+        for view, stats in views:
+            latency = stats['latency_ms']
+            self.stdout.write(
+                f"{view:<30}{stats['requests']:>9}{stats['errors']:>8}{latency['mean']:>9.1f}{latency['p50']:>9.1f}"
+                f"{latency['p95']:>9.1f}{latency['p99']:>9.1f}{latency['max']:>9.1f}{stats['queries']['mean']:>9.1f}"
+                f"{stats['queries']['mean_time_ms']:>10.2f}{stats['response_bytes']['mean'] / 1024:>8.1f}"
+            )
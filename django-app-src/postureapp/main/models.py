@@ -47,6 +47,7 @@ class User(AbstractBaseUser):
         super().save(*args, **kwargs)
         if is_new:
             Notifications.objects.create(subject=self, back_alert=0, neck_alert=0)
+            Statistics.objects.create(subject=self)
 
 
 class Notifications(models.Model):
@@ -63,6 +64,94 @@ class Videos(models.Model):
     total_alerts = models.IntegerField(default=0)
     incorrect_postures = ArrayField(models.CharField(max_length=20), blank=True, null=True)
     posture_score = models.IntegerField(default=0, null=False, blank=False)
+    # run-length encoded posture of every frame sent by the device, 9 bytes per posture change
+    neck_timeline = models.BinaryField(null=True, blank=True)
+    back_timeline = models.BinaryField(null=True, blank=True)
+    # exact seconds spent in each posture, decoded from the timelines
+    posture_seconds = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        # backs the keyset paginated history, newest first
+        indexes = [
+            models.Index(fields=['subject', 'end_time'], name='videos_subject_end_idx'),
+            # backs the date range searches and analytics
+            models.Index(fields=['subject', 'start_time'], name='videos_subject_start_idx'),
+        ]
+
+
+# per-user totals kept up to date as videos arrive so the profile page reads a single row
+class Statistics(models.Model):
+    subject = models.OneToOneField(User, on_delete=models.CASCADE)
+    total_videos = models.IntegerField(default=0)
+    total_alerts = models.IntegerField(default=0)
+    total_time_seconds = models.IntegerField(default=0)
+    average_score = models.FloatField(default=0)
+    highest_score = models.IntegerField(default=0)
+    latest_score = models.IntegerField(default=0)
+    previous_score = models.IntegerField(default=0)
+    latest_end_time = models.DateTimeField(null=True, blank=True)
+    previous_end_time = models.DateTimeField(null=True, blank=True)
+
+    def add_video(self, video: 'Videos') -> None:
+        '''
+        folds a newly stored video into the running totals in O(1)
+
+        :param video: the video that has just been saved
+        '''
+        score = int(video.posture_score)
+        self.total_videos += 1
+        self.total_alerts += video.total_alerts
+        self.total_time_seconds += video.total_time_seconds
+        # running mean, avoids re-reading every video of the user
+        self.average_score += (score - self.average_score) / self.total_videos
+        if self.total_videos == 1 or score > self.highest_score:
+            self.highest_score = score
+        # videos may arrive out of order, only the most recent ones count for the improvement
+        if self.latest_end_time is None or video.end_time >= self.latest_end_time:
+            self.previous_score = self.latest_score
+            self.previous_end_time = self.latest_end_time
+            self.latest_score = score
+            self.latest_end_time = video.end_time
+        elif self.previous_end_time is None or video.end_time >= self.previous_end_time:
+            self.previous_score = score
+            self.previous_end_time = video.end_time
+
+    def reset(self) -> None:
+        '''clears all the totals before a rebuild'''
+        self.total_videos = 0
+        self.total_alerts = 0
+        self.total_time_seconds = 0
+        self.average_score = 0
+        self.highest_score = 0
+        self.latest_score = 0
+        self.previous_score = 0
+        self.latest_end_time = None
+        self.previous_end_time = None
+
+
+# per-user daily totals updated as videos arrive, weeks and months are summed from them in the database
+class DailyRollups(models.Model):
+    subject = models.ForeignKey(User, on_delete=models.CASCADE)
+    day = models.DateField()
+    sessions = models.IntegerField(default=0)
+    monitored_seconds = models.IntegerField(default=0)
+    alerts = models.IntegerField(default=0)
+    # the average score is score_sum / sessions, sums can be added up across days unlike averages
+    score_sum = models.IntegerField(default=0)
+    reclined_back = models.IntegerField(default=0)
+    forward_leaning_back = models.IntegerField(default=0)
+    forward_leaning_neck = models.IntegerField(default=0)
+
+    # incorrect postures sent by the device and the column counting each of them
+    POSTURE_COLUMNS = {
+        'reclined back': 'reclined_back',
+        'forward-leaning back': 'forward_leaning_back',
+        'forward-leaning neck': 'forward_leaning_neck',
+    }
+
+    class Meta:
+        # the unique constraint's index also serves the per-user range reads
+        unique_together = ('subject', 'day')
 
 
 class FeedBack(models.Model):
@@ -71,7 +160,41 @@ class FeedBack(models.Model):
     date_created = models.DateTimeField(auto_now=True)
 
 
+# one stored file per distinct image, photos of repeated alerts reference the same blob
+class PhotoBlobs(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    # difference hash used to spot near-identical frames, hex encoded 64 bits
+    phash = models.CharField(max_length=16, blank=True, default='')
+    image = models.ImageField(upload_to='poor_postures/', null=False, blank=False)
+    size = models.IntegerField(default=0)
+    # pixels, variants are never upscaled so the wider ones are only offered up to it. None when unreadable
+    width = models.IntegerField(null=True, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    # the file was removed by compact_photos once every photo using it got archived, its thumbnails remain
+    archived = models.BooleanField(default=False)
+
+
+# old photos packed by the compact_photos command: a zip of the originals and a contact sheet per session
+class PhotoArchives(models.Model):
+    subject = models.ForeignKey(User, on_delete=models.CASCADE)
+    session_start = models.DateTimeField(null=True, blank=True)
+    archive = models.FileField(upload_to='photo_archives/')
+    contact_sheet = models.ImageField(upload_to='contact_sheets/')
+    photos = models.IntegerField(default=0)
+    size = models.IntegerField(default=0)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+
 class PoorPostures(models.Model):
     subject = models.ForeignKey(User, on_delete=models.CASCADE)
     posture_photo = models.ImageField(upload_to='poor_postures/', null=False, blank=False)
-    date_created = models.DateTimeField(auto_now=True)
\ No newline at end of file
+    date_created = models.DateTimeField(auto_now=True)
+    blob = models.ForeignKey(PhotoBlobs, on_delete=models.PROTECT, null=True, blank=True)
+    # start of the monitoring video the photo was taken in, sent by the device
+    session_start = models.DateTimeField(null=True, blank=True)
+    # set once the original is packed, the feed then shows the thumbnails and links the contact sheet
+    archive = models.ForeignKey(PhotoArchives, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        # backs the keyset paginated photos feed, newest first
+        indexes = [models.Index(fields=['subject', 'date_created'], name='photos_subject_created_idx')]
\ No newline at end of file
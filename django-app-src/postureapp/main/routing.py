@@ -0,0 +1,11 @@
+from django.urls import path
+from channels.security.websocket import AllowedHostsOriginValidator
+from main import consumers
+
+# websocket routes, served by the ASGI application
+websocket_urlpatterns = [
+    # devices don't send an Origin header, they authenticate in their first message
+    path('ws/device/', consumers.DeviceConsumer.as_asgi()),
+    # pages are authenticated by their session cookie, only from our own hosts
+    path('ws/monitor/', AllowedHostsOriginValidator(consumers.MonitorConsumer.as_asgi())),
+]
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from main.models import User, FeedBack, Notifications, Videos
+from main.caching import invalidate_home, invalidate_notifications, invalidate_history, invalidate_testimonials
+
+
+# cached reads are dropped as soon as a row they were built from is saved or deleted
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    # remembered so saves that don't touch the name, like the last_login update of every login, keep the cache.
+    # read from __dict__ so a deferred first_name isn't fetched
+    instance._cached_first_name = instance.__dict__.get('first_name')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    first_name = instance.__dict__.get('first_name')
+    if created or first_name != getattr(instance, '_cached_first_name', None):
+        # the home page and the testimonials show the first name
+        invalidate_home(instance.pk)
+        invalidate_testimonials()
+    instance._cached_first_name = first_name
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_home(instance.pk)
+    invalidate_testimonials()
+
+
+@receiver([post_save, post_delete], sender=FeedBack)
+def feedback_changed(sender, instance, **kwargs):
+    invalidate_testimonials()
+
+
+@receiver([post_save, post_delete], sender=Notifications)
+def notifications_changed(sender, instance, **kwargs):
+    invalidate_notifications(instance.subject_id)
+
+
+@receiver([post_save, post_delete], sender=Videos)
+def videos_changed(sender, instance, **kwargs):
+    invalidate_history(instance.subject_id)
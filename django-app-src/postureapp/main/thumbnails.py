@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+import threading
+import os
+import io
+
+
+# widths in pixels of the variants generated for each incorrect posture photo
+VARIANT_WIDTHS = (160, 320, 640)
+# how long browsers may keep a variant, they never change once generated
+VARIANT_MAX_AGE = 60 * 60 * 24 * 365
+
+# a single background worker keeps the resizing off the request threads
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+_pending = {}
+_lock = threading.Lock()
+
+
+def variant_name(photo_name: str, width: int) -> str:
+    '''storage path of the variant of a photo at a given width'''
+    return os.path.join('thumbnails', str(width), os.path.basename(photo_name))
+
+
+def variant_widths(width: int=None) -> list:
+    '''
+    variants worth offering for a photo and the width they actually have. variants are never upscaled, so
+    those at or past the original's width are all the original: only the first of them is offered.
+
+    :param width: width of the original, None when unknown and every variant is offered
+    :returns: (variant, actual width) pairs, narrowest first
+    '''
+    if width is None:
+        return [(variant, variant) for variant in VARIANT_WIDTHS]
+    widths = []
+    for variant in VARIANT_WIDTHS:
+        widths.append((variant, min(variant, width)))
+        if variant >= width:
+            break
+    return widths
+
+
+def _generate(photo_name: str, width: int) -> str:
+    name = variant_name(photo_name, width)
+    if default_storage.exists(name):
+        return name
+    with default_storage.open(photo_name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = image.convert('RGB')
+    # never upscale, the original is served as the largest variant instead
+    if image.width > width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=80, optimize=True, progressive=True)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _forget(key: tuple, future) -> None:
+    with _lock:
+        if _pending.get(key) is future:
+            del _pending[key]
+
+
+def request_variant(photo_name: str, width: int):
+    '''
+    queues the generation of a variant on the background worker and returns its future.
+    requests for a variant that is already being generated share the same future.
+
+    :param photo_name: storage name of the original photo
+    :param width: one of VARIANT_WIDTHS
+    '''
+    key = (photo_name, width)
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _executor.submit(_generate, photo_name, width)
+            _pending[key] = future
+            future.add_done_callback(lambda f: _forget(key, f))
+    return future
+
+
+def schedule_variants(photo_name: str) -> None:
+    '''generates every variant of a freshly uploaded photo in the background'''
+    for width in VARIANT_WIDTHS:
+        request_variant(photo_name, width)
+
+
+def get_variant(photo_name: str, width: int) -> str:
+    '''returns the storage name of a variant, generating it on first request'''
+    name = variant_name(photo_name, width)
+    if default_storage.exists(name):
+        return name
+    return request_variant(photo_name, width).result()
@@ -22,5 +22,11 @@ urlpatterns = [
     path('user-records-search/', views.search_records, name='search'),
     path('user-incorrect-postures/', views.upload_posture_photos, name='upload_postures'),
     path('user-incorrect-posture-photos/', views.posture_photos, name='posture_photos'),   
+    path('user-incorrect-posture-photos/<int:photo_id>/<int:width>/', views.photo_variant, name='photo_variant'),
+    path('api/videos/', views.videos_api, name='videos_api'),
+    path('api/photos/', views.photos_api, name='photos_api'),
+    path('api/analytics/', views.analytics, name='analytics'),
+    path('api/request-stats/', views.request_stats_api, name='request_stats'),
+    path('api/export/<str:dataset>/', views.export_data, name='export'),
 ]
 
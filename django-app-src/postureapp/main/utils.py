@@ -1,5 +1,12 @@
-from main.models import Notifications
+from main.models import Notifications, Statistics, DailyRollups
+from django.db import transaction
+from django.db.models import Q, F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import datetime
+import base64
+import struct
+import json
 
 
 # utility functions to calulate the statistics and time
@@ -12,6 +19,66 @@ def get_latest_notifications(user: object) -> dict:
     return latest_notifications
 
 
+def monitor_group(user: object) -> str:
+    '''channel layer group of the monitoring pages a user has open'''
+    return f'monitor_{user.pk}'
+
+
+def record_alert(user: object, alert_types: list) -> Notifications:
+    '''
+    counts an alert sent by the device, neck and back alerts raised together are counted once each
+
+    :param alert_types: back and/or neck
+    '''
+    notification = Notifications.objects.get(subject=user)
+    if 'back' in alert_types:
+        notification.back_alert += 1
+    if 'neck' in alert_types:
+        notification.neck_alert += 1
+    notification.save()
+    return notification
+
+
+def update_statistics(user: object, video: object) -> Statistics:
+    '''adds a stored video to the user's statistics row, locking it so concurrent uploads don't clash'''
+    with transaction.atomic():
+        Statistics.objects.get_or_create(subject=user)
+        statistics = Statistics.objects.select_for_update().get(subject=user)
+        statistics.add_video(video)
+        statistics.save()
+    return statistics
+
+
+def session_day(time: datetime.datetime) -> datetime.date:
+    '''day a video belongs to, in the same timezone the database truncates dates in'''
+    if timezone.is_naive(time):
+        time = timezone.make_aware(time)
+    return timezone.localdate(time)
+
+
+def posture_counts(incorrect_postures: list) -> dict:
+    '''number of alerts of each kind in a video, keyed by DailyRollups column'''
+    counts = dict.fromkeys(DailyRollups.POSTURE_COLUMNS.values(), 0)
+    for posture in incorrect_postures or []:
+        column = DailyRollups.POSTURE_COLUMNS.get(posture)
+        if column:
+            counts[column] += 1
+    return counts
+
+
+def update_rollups(user: object, video: object) -> None:
+    '''adds a stored video to the daily rollup of its start day with a single atomic update'''
+    rollup, _ = DailyRollups.objects.get_or_create(subject=user, day=session_day(video.start_time))
+    increments = {column: F(column) + count for column, count in posture_counts(video.incorrect_postures).items()}
+    DailyRollups.objects.filter(pk=rollup.pk).update(
+        sessions=F('sessions') + 1,
+        monitored_seconds=F('monitored_seconds') + video.total_time_seconds,
+        alerts=F('alerts') + video.total_alerts,
+        score_sum=F('score_sum') + int(video.posture_score),
+        **increments
+    )
+
+
 def compute_posture_score(total_time: int, num_alerts: int) -> int:
     poor_posture_time = num_alerts * 10
     poor_posture_percentage = poor_posture_time / total_time * 100
@@ -19,6 +86,75 @@ def compute_posture_score(total_time: int, num_alerts: int) -> int:
     return posture_score
 
 
+# layout of one run of a device timeline: posture code, start and duration in milliseconds
+TIMELINE_RUN = struct.Struct('<BII')
+# posture names of the codes sent by the device for each body part
+NECK_POSTURES = {ord('f'): 'forward-leaning neck', ord('u'): 'upright neck'}
+BACK_POSTURES = {ord('f'): 'forward-leaning back', ord('u'): 'upright back', ord('r'): 'reclined back'}
+INCORRECT_CODES = (ord('f'), ord('r'))
+
+
+def decode_timeline(encoded: str) -> bytes:
+    '''turns the base64 timeline posted by the device into the bytes stored on Videos'''
+    if not encoded:
+        return b''
+    timeline = base64.b64decode(encoded)
+    if len(timeline) % TIMELINE_RUN.size:
+        raise ValueError('truncated posture timeline')
+    return timeline
+
+
+def timeline_runs(timeline: bytes) -> list:
+    '''(code, start, duration) runs of a stored timeline'''
+    return list(TIMELINE_RUN.iter_unpack(bytes(timeline or b'')))
+
+
+def timeline_seconds(neck_timeline: bytes, back_timeline: bytes) -> dict:
+    '''exact number of seconds spent in each posture'''
+    seconds = {}
+    for timeline, names in ((neck_timeline, NECK_POSTURES), (back_timeline, BACK_POSTURES)):
+        for code, _, duration in timeline_runs(timeline):
+            name = names.get(code)
+            if name:
+                seconds[name] = seconds.get(name, 0) + duration / 1000
+    return {name: round(value, 3) for name, value in seconds.items()}
+
+
+def poor_posture_seconds(neck_timeline: bytes, back_timeline: bytes) -> float:
+    '''seconds during which the neck or the back was incorrect, overlaps are only counted once'''
+    intervals = sorted(
+        (start, start + duration)
+        for timeline in (neck_timeline, back_timeline)
+        for code, start, duration in timeline_runs(timeline)
+        if code in INCORRECT_CODES
+    )
+    total = 0
+    current_start, current_end = None, None
+    for start, end in intervals:
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total / 1000
+
+
+def compute_exact_posture_score(total_time: int, neck_timeline: bytes, back_timeline: bytes) -> int:
+    '''posture score from the time actually spent in an incorrect posture rather than the alerts count'''
+    return compute_dwell_posture_score(total_time, poor_posture_seconds(neck_timeline, back_timeline))
+
+
+def compute_dwell_posture_score(total_time: int, poor_seconds: float) -> int:
+    '''posture score from the seconds spent with the neck or the back incorrect, counted by the device'''
+    if total_time <= 0:
+        return 0
+    poor_posture_percentage = min(poor_seconds, total_time) / total_time * 100
+    return 100 - poor_posture_percentage
+
+
 def good_posture_time(total_time: int, total_alerts: int) -> int:
     return total_time - total_alerts * 10
 
@@ -52,3 +188,47 @@ def overall_improvement(scores):
     
     return round(improvement_percentage, 2)
 
+
+
+def encode_cursor(time: datetime.datetime, pk: int) -> str:
+    '''packs the position of the last row of a page into an opaque url-safe token'''
+    raw = json.dumps([time.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    '''unpacks a token made by encode_cursor, returns None if it was tampered with'''
+    try:
+        time, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        time = parse_datetime(time)
+        if time is None:
+            return None
+        return time, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_page(queryset, field: str, cursor: str=None, page_size: int=20) -> tuple:
+    '''
+    returns one page of a queryset ordered newest first along with the cursor of the next page.
+    rows are located through the (subject, field) index instead of an offset, so every page
+    costs the same whatever the length of the history.
+
+    :param queryset: rows already filtered by subject
+    :param field: datetime field used for the ordering
+    :param cursor: token returned with the previous page
+    :param page_size: number of rows per page
+    '''
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        time, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__lt': time}) | Q(**{field: time, 'pk__lt': pk}))
+    # fetching one extra row tells us whether there is a next page without a count query
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return rows, next_cursor
@@ -1,18 +1,37 @@
 from django.contrib.auth import authenticate, login, logout
 from django.shortcuts import render
 from .forms import LoginForm, RegisterForm, FeedBackForm
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, HttpResponse, FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.core.files.storage import default_storage
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from .models import User, Notifications, Videos, FeedBack, PoorPostures
-from django.utils.timezone import now
-from main.utils import get_latest_notifications, compute_posture_score, \
-good_posture_time, current_time, format_time, overall_improvement
-from django.db.models import Sum, Avg, Max
+from .models import User, Videos, FeedBack, PoorPostures, Statistics, DailyRollups
+from django.utils.timezone import now, make_aware
+from main.utils import compute_posture_score, \
+good_posture_time, current_time, format_time, overall_improvement, update_statistics, \
+keyset_page, update_rollups, record_alert, monitor_group, decode_timeline, timeline_seconds, compute_exact_posture_score, \
+compute_dwell_posture_score
+from django.db.models import Sum, F
+from django.db.models.functions import TruncWeek, TruncMonth
+from main.blobs import store_posture_photo
+from main.thumbnails import schedule_variants, get_variant, variant_widths, VARIANT_WIDTHS, VARIANT_MAX_AGE
+from main.instrumentation import request_stats
+from main.exports import export_file, EXPORT_DATASETS, EXPORT_FORMATS
+from main.caching import cached_notifications, cached_history, CACHE_TIMEOUT
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
 from datetime import datetime
 import json
+import os
+
+
+# number of rows rendered per history or photos page
+PAGE_SIZE = 20
+# analytics periods and the database function truncating a day to the start of its period
+ANALYTICS_PERIODS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
 
 
 # uploading incorrect posture photos from Jetson Nano
@@ -23,16 +42,18 @@ def upload_posture_photos(request):
         user = authenticate(request, email=request.POST.get('email'), password=request.POST.get('password'))
         files = request.FILES.getlist('image')
 
+        # the start of the video lets near-identical photos of the same video share one file
+        session_start = request.POST.get('start_time')
+        session_start = current_time(int(session_start)) if session_start else None
+
         # Process the uploaded files
         if files:
             for file in files:
-                # Create a new PoorPostures object and assign the uploaded file
-                posture = PoorPostures(
-                    subject = user,
-                    posture_photo = file
-                )
-                
-                posture.save()
+                # identical images are stored once, the new PoorPostures row references the blob
+                posture, created = store_posture_photo(user, file, session_start)
+                if created:
+                    # resizing happens on the background worker, once per distinct image
+                    schedule_variants(posture.posture_photo.name)
 
             # Return a response indicating success
             return HttpResponse('success')
@@ -64,8 +85,20 @@ def video_data(request):
         start_time = current_time(start_time)
         end_time = current_time(end_time)
         print(start_time, end_time)
-        # calulate posture score
-        posture_score = compute_posture_score(total_time=total_time, num_alerts=num_alerts)
+        # timelines are missing when the device predates them
+        neck_timeline = decode_timeline(data.get('neck_timeline'))
+        back_timeline = decode_timeline(data.get('back_timeline'))
+        # calulate posture score, from the device's dwell counters when sent, exactly from
+        # the per frame timelines otherwise, approximated from the alerts by older devices
+        if data.get('poor_posture_seconds'):
+            posture_score = compute_dwell_posture_score(total_time, float(data['poor_posture_seconds']))
+            posture_seconds = json.loads(data.get('posture_seconds') or '{}')
+        elif neck_timeline or back_timeline:
+            posture_score = compute_exact_posture_score(total_time, neck_timeline, back_timeline)
+            posture_seconds = timeline_seconds(neck_timeline, back_timeline)
+        else:
+            posture_score = compute_posture_score(total_time=total_time, num_alerts=num_alerts)
+            posture_seconds = None
         # populating database
         new_video = Videos(
                     subject=user, 
@@ -74,9 +107,15 @@ def video_data(request):
                     total_time_seconds=total_time,
                     total_alerts=num_alerts, 
                     incorrect_postures=incorrect_postures, 
-                    posture_score=posture_score
+                    posture_score=posture_score,
+                    neck_timeline=neck_timeline or None,
+                    back_timeline=back_timeline or None,
+                    posture_seconds=posture_seconds
                     )
         new_video.save()
+        # keeping the profile statistics up to date
+        update_statistics(user, new_video)
+        update_rollups(user, new_video)
         return JsonResponse({'status': 'success'})
     else:
         return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
@@ -100,13 +139,16 @@ def my_endpoint(request):
         data = request.POST.dict()  # get the dictionary of data sent in the request
         user = authenticate(request, email=request.POST.get('email'), password=request.POST.get('password'))
         user = User.objects.get(email=user)
-        notification = Notifications.objects.get(subject=user)
-        if data['alert'] == 'back':
-            notification.back_alert += 1
-            notification.save()
-        elif data['alert'] == 'neck':
-            notification.neck_alert += 1
-            notification.save()
+        # neck and back alerts raised together arrive as one "back,neck" notification
+        notification = record_alert(user, data['alert'].split(','))
+        # pages listening on the websocket get the alert right away instead of on their next sse poll
+        async_to_sync(get_channel_layer().group_send)(monitor_group(user), {
+            'type': 'posture.alert', 
+            'alert': data['alert'], 
+            'level': int(data.get('level', 0)),
+            'back_alert': notification.back_alert, 
+            'neck_alert': notification.neck_alert,
+        })
         return JsonResponse({'status': 'success'})
     else:
         return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
@@ -114,8 +156,9 @@ def my_endpoint(request):
 
 # welcome page
 def index(request):
-    feedbacks = FeedBack.objects.order_by('-date_created')[:2]
-    context = {'feedbacks': feedbacks}
+    # lazy: only queried when the cached testimonials fragment has been invalidated
+    feedbacks = FeedBack.objects.select_related('author').order_by('-date_created')[:2]
+    context = {'feedbacks': feedbacks, 'cache_timeout': CACHE_TIMEOUT}
     return render(request, 'main/index.html', context)
 
 
@@ -159,8 +202,8 @@ def login_view(request):
 def home_view(request):
     # change it to user first name later on
     user = request.user
-    context = {'user': user}
-    print(request.user)
+    # the page is cached per user until their first name changes
+    context = {'user': user, 'cache_timeout': CACHE_TIMEOUT}
     return render(request, 'main/home.html', context)
 
 
@@ -181,45 +224,24 @@ def user_profile(request):
 
     # days on app
     days_in_app = (now() - user.date_created).days
-    # get the video details:    
-    # get time spent in a good posture
-    try:
-        # sum all user's alerts for each video
-        total_alerts = Videos.objects.filter(subject=user).aggregate(Sum('total_alerts'))['total_alerts__sum']
-        # sum all user's total time for each video
-        total_time = Videos.objects.filter(subject=user).aggregate(Sum('total_time_seconds'))['total_time_seconds__sum']
+    # statistics are maintained by video_data, only one row is read here
+    statistics, _ = Statistics.objects.get_or_create(subject=user)
+    if statistics.total_videos:
         # compute good posture time
-        good_posture = good_posture_time(total_time=total_time, total_alerts=total_alerts)
+        good_posture = good_posture_time(total_time=statistics.total_time_seconds, total_alerts=statistics.total_alerts)
         good_posture = format_time(good_posture)
-    except:
+    else:
         # if video does not exist
         good_posture = 0
-    # get the latest video score
-    latest_video = Videos.objects.filter(subject=user).order_by('-end_time').first()
-    if latest_video:
-        # If there's a latest video, get its posture score
-        latest_score = latest_video.posture_score
-    else:
-        # If there's no video for the current user, set the latest posture score to 0
-        latest_score = 0
-    # Get the average posture score of all videos for the user
-    average_score = Videos.objects.filter(subject=user).aggregate(Avg('posture_score'))['posture_score__avg']
-    # If there are no videos for the user, set the average posture score to 0
-    if not average_score:
-        average_score = 0
-    else:
-        average_score = round(average_score, 2)
-
+    latest_score = statistics.latest_score
+    average_score = round(statistics.average_score, 2)
+    highest_score = statistics.highest_score
 
-    highest_score = Videos.objects.filter(subject=user).aggregate(Max('posture_score'))['posture_score__max']
-
-    if not highest_score:
-        highest_score = 0
-    
-    # posture improvements:
-    videos = Videos.objects.filter(subject=request.user).order_by('start_time')
-    scores = [video.posture_score for video in videos]
-    improvement = overall_improvement(scores)
+    # posture improvements: only the last two scores are needed
+    if statistics.total_videos >= 2:
+        improvement = overall_improvement([statistics.previous_score, statistics.latest_score])
+    else:
+        improvement = 0
 
     context = {
         'user': user,
@@ -255,12 +277,45 @@ def user_feedback(request):
 @login_required
 def user_record(request):
     user = request.user
-    # querying database for videos details
-    videos = Videos.objects.filter(subject=user).order_by('end_time')[::-1]
-    context = {'videos': videos}
+    cursor = request.GET.get('cursor')
+    # querying one page of videos details, most recent first. the first page is cached until a video is saved
+    if cursor:
+        videos, next_cursor = keyset_page(
+            Videos.objects.filter(subject=user), 
+            field='end_time', 
+            cursor=cursor, 
+            page_size=PAGE_SIZE
+        )
+    else:
+        videos, next_cursor = cached_history(user, PAGE_SIZE)
+    context = {'videos': videos, 'next_cursor': next_cursor}
     return render(request, 'main/record.html', context)
 
 
+# History API: same pages as the history page in JSON
+@login_required
+def videos_api(request):
+    videos, next_cursor = keyset_page(
+        Videos.objects.filter(subject=request.user), 
+        field='end_time', 
+        cursor=request.GET.get('cursor'), 
+        page_size=PAGE_SIZE
+    )
+    data = [
+        {
+            'id': video.id,
+            'start_time': video.start_time.isoformat(),
+            'end_time': video.end_time.isoformat(),
+            'total_time_seconds': video.total_time_seconds,
+            'total_alerts': video.total_alerts,
+            'incorrect_postures': video.incorrect_postures,
+            'posture_score': video.posture_score,
+        }
+        for video in videos
+    ]
+    return JsonResponse({'videos': data, 'next_cursor': next_cursor})
+
+
 # search bar
 @login_required
 def search_records(request):
@@ -292,11 +347,62 @@ def search_records(request):
 @login_required
 def posture_photos(request):
     user = request.user
-    photos = PoorPostures.objects.filter(subject=user).order_by('date_created')[::-1]
-    context = {'photos': photos}
+    photos, next_cursor = keyset_page(
+        PoorPostures.objects.filter(subject=user).select_related('archive', 'blob'), 
+        field='date_created', 
+        cursor=request.GET.get('cursor'), 
+        page_size=PAGE_SIZE
+    )
+    # the srcset only advertises the variants that exist at their real width
+    for photo in photos:
+        photo.variants = variant_widths(photo.blob.width if photo.blob else None)
+    context = {'photos': photos, 'next_cursor': next_cursor}
     return render(request, 'main/photos.html', context)
 
 
+# resized incorrect posture photo, generated on first request if the worker hasn't done it yet
+@login_required
+def photo_variant(request, photo_id, width):
+    if width not in VARIANT_WIDTHS:
+        raise Http404('Unknown photo size.')
+    photo = get_object_or_404(PoorPostures, pk=photo_id, subject=request.user)
+    try:
+        name = get_variant(photo.posture_photo.name, width)
+    except FileNotFoundError:
+        # neither the variant nor the original exist anymore
+        raise Http404('Photo not found.')
+    response = FileResponse(default_storage.open(name, 'rb'), content_type='image/jpeg')
+    # variants never change, browsers may keep them as long as they like
+    response['Cache-Control'] = f'private, max-age={VARIANT_MAX_AGE}, immutable'
+    return response
+
+
+# photos feed API: same pages as the photos feed in JSON
+@login_required
+def photos_api(request):
+    photos, next_cursor = keyset_page(
+        PoorPostures.objects.filter(subject=request.user).select_related('archive', 'blob'), 
+        field='date_created', 
+        cursor=request.GET.get('cursor'), 
+        page_size=PAGE_SIZE
+    )
+    data = [
+        {
+            'id': photo.id,
+            # archived originals are only in their session's zip, the contact sheet stands in for them
+            'url': photo.archive.contact_sheet.url if photo.archive else photo.posture_photo.url,
+            'archive': photo.archive.archive.url if photo.archive else None,
+            'variants': {
+                width: reverse('main:photo_variant', args=[photo.id, variant])
+                for variant, width in variant_widths(photo.blob.width if photo.blob else None)
+            },
+            'date_created': photo.date_created.isoformat(),
+        }
+        for photo in photos
+    ]
+    return JsonResponse({'photos': data, 'next_cursor': next_cursor})
+
+
 # establishing SSE connection
 @login_required
 def sse(request):
@@ -304,7 +410,8 @@ def sse(request):
     response['Cache-Control'] = 'no-cache'
     response['Connection'] = 'keep-alive'
 
-    notifications = get_latest_notifications(request.user)
+    # cached until the device sends an alert
+    notifications = cached_notifications(request.user)
     data = json.dumps({'back_alert': notifications['back_alert'], 'neck_alert': notifications['neck_alert']})
     response.write(f"data: {data}\n\n")
     return response
@@ -313,6 +420,102 @@ def sse(request):
 # posture monitoring page: notifications will be displayed here
 @login_required
 def user_monitoring(request):
-    user_id = request.user.id
-    notifications = Notifications.objects.get(subject_id=user_id)
-    return render(request, 'main/monitoring.html', {'back_postures': notifications.back_alert})
\ No newline at end of file
+    notifications = cached_notifications(request.user)
+    return render(request, 'main/monitoring.html', {'back_postures': notifications['back_alert']})
+
+
+# analytics API: per day, week or month aggregates summed from the daily rollups in the database
+@login_required
+def analytics(request):
+    period = request.GET.get('period', 'day')
+    if period not in ANALYTICS_PERIODS:
+        return JsonResponse({'status': 'error', 'message': 'period must be day, week or month'}, status=400)
+    rollups = DailyRollups.objects.filter(subject=request.user)
+    try:
+        if request.GET.get('start'):
+            rollups = rollups.filter(day__gte=datetime.strptime(request.GET['start'], '%Y-%m-%d').date())
+        if request.GET.get('end'):
+            rollups = rollups.filter(day__lte=datetime.strptime(request.GET['end'], '%Y-%m-%d').date())
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'dates must be formatted as YYYY-MM-DD'}, status=400)
+
+    trunc = ANALYTICS_PERIODS[period]
+    if trunc is not None:
+        rollups = rollups.annotate(bucket=trunc('day'))
+    else:
+        rollups = rollups.annotate(bucket=F('day'))
+    posture_columns = DailyRollups.POSTURE_COLUMNS
+    rows = rollups.values('bucket').annotate(
+        total_sessions=Sum('sessions'),
+        total_seconds=Sum('monitored_seconds'),
+        total_alerts=Sum('alerts'),
+        total_score=Sum('score_sum'),
+        **{f'total_{column}': Sum(column) for column in posture_columns.values()}
+    ).order_by('bucket')
+
+    buckets = [
+        {
+            'start': row['bucket'].isoformat(),
+            'sessions': row['total_sessions'],
+            'monitored_seconds': row['total_seconds'],
+            'alerts': row['total_alerts'],
+            'average_score': round(row['total_score'] / row['total_sessions'], 2) if row['total_sessions'] else 0,
+            'incorrect_postures': {posture: row[f'total_{column}'] for posture, column in posture_columns.items()},
+        }
+        for row in rows
+    ]
+    return JsonResponse({'period': period, 'buckets': buckets})
+
+
+# request timing statistics of this server process, admins only: from their session or,
+# for scripts and the request_stats command, with their email and password like the device
+@csrf_exempt
+def request_stats_api(request):
+    if request.method == 'POST':
+        user = authenticate(request, email=request.POST.get('email'), password=request.POST.get('password'))
+    else:
+        user = request.user if request.user.is_authenticated else None
+    if user is None or not user.is_admin:
+        return JsonResponse({'status': 'error', 'message': 'Admins only'}, status=403)
+    snapshot = request_stats.snapshot()
+    # statistics are only cleared by an authenticated POST, never by a cross-site GET
+    if request.method == 'POST' and request.POST.get('reset'):
+        request_stats.reset()
+    return JsonResponse(dict(snapshot, status='success', pid=os.getpid()))
+
+
+# full history export as csv or json lines: rows are read through a server-side cursor and spooled to a
+# temporary file by this view's worker thread, then the file is streamed, so years of sessions take constant
+# memory. users export their own data from their session, admins can export anyone's with ?user=<email>
+# and scripts post their email and password
+@csrf_exempt
+def export_data(request, dataset):
+    if request.method == 'POST':
+        user = authenticate(request, email=request.POST.get('email'), password=request.POST.get('password'))
+        params = request.POST
+    else:
+        user = request.user if request.user.is_authenticated else None
+        params = request.GET
+    if user is None:
+        return JsonResponse({'status': 'error', 'message': 'Authentication required'}, status=401)
+    if dataset not in EXPORT_DATASETS:
+        return JsonResponse({'status': 'error', 'message': 'dataset must be videos, timelines or photos'}, status=404)
+    export_format = params.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'status': 'error', 'message': 'format must be csv or jsonl'}, status=400)
+
+    subject = user
+    if params.get('user') and params.get('user') != user.email:
+        if not user.is_admin:
+            return JsonResponse({'status': 'error', 'message': 'Admins only'}, status=403)
+        subject = get_object_or_404(User, email=params.get('user'))
+    since = None
+    if params.get('since'):
+        try:
+            since = make_aware(datetime.strptime(params.get('since'), '%Y-%m-%d'))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'since must be a YYYY-MM-DD date'}, status=400)
+
+    # FileResponse closes the temporary file, which deletes it, once it has been sent
+    export = export_file(dataset, export_format, subject, since)
+    return FileResponse(export, as_attachment=True, filename=f'{dataset}.{export_format}', content_type=EXPORT_FORMATS[export_format])
@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first so its timings include every other middleware
+    'main.instrumentation.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +89,26 @@ WSGI_APPLICATION = 'postureapp.wsgi.application'
 # for SSE
 ASGI_APPLICATION = 'postureapp.asgi.application'
 
+# channel layer fanning device messages out to the monitoring pages. The in-memory layer only reaches pages
+# served by the same process, use channels_redis.core.RedisChannelLayer when running several workers.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+# cache of the hot read paths (testimonials, home page, notifications and first history page), entries are
+# dropped by the post_save signals of main/signals.py. The local memory cache is per process, use
+# django.core.cache.backends.filebased.FileBasedCache with a shared LOCATION when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'postureapp',
+    },
+}
+# seconds an entry lives at most when nothing invalidates it
+VIEW_CACHE_TIMEOUT = 3600
+
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
@@ -152,4 +174,37 @@ MEDIA_ROOT = MEDIA_DIR
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # allow a greater number of post requests
-DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000000  # or any other value that suits your needs
\ No newline at end of file
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000000  # or any other value that suits your needs
+
+# posture photos of the same video whose perceptual hashes differ by at most this many bits
+# are stored once, set to None to only merge exact duplicates
+PHOTO_NEAR_DUPLICATE_DISTANCE = 6
+
+# request timing middleware: views tracked per process (later ones are counted as "other"),
+# latencies kept per view for percentiles, and queries slower than this many seconds are logged
+REQUEST_STATS_MAX_VIEWS = 200
+REQUEST_STATS_SAMPLES = 1000
+SLOW_QUERY_THRESHOLD = 0.1
+
+# rows fetched per round trip of the server-side cursor behind the csv and json lines exports
+EXPORT_CHUNK_SIZE = 2000
+
+# photo retention of the compact_photos command: photos older than archive_after_days are packed into
+# per-session zips and contact sheets (their thumbnails stay in the feed) and deleted with their archive
+# after delete_after_days, None keeps them. users overrides the rules per email.
+PHOTO_RETENTION = {
+    'archive_after_days': 30,
+    'delete_after_days': None,
+    'users': {},
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'main.instrumentation': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
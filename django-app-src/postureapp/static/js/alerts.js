@@ -1,29 +1,105 @@
 // js for real time alerts (templates/main/monitoring.html)
-var source = new EventSource("{% url 'main:sse' %}");
 var isFirstLoad = true; // Flag to prevent popup on first load
-source.addEventListener('message', function(event) {
-    var data = JSON.parse(event.data);
-    var backAlertsElem = document.getElementById('back-alerts');
-    var neckAlertsElem = document.getElementById('neck-alerts');
-    var backAlerts = parseInt(backAlertsElem.innerText);
-    var neckAlerts = parseInt(neckAlertsElem.innerText);
-    // Update the values of the elements with the received data
-    backAlertsElem.innerText = data.back_alert;
-    neckAlertsElem.innerText = data.neck_alert;
-    // Show the modal popup if the value of back-alerts or neck-alerts changes
-    var message = '';
-    if (!isFirstLoad && parseInt(data.back_alert) > backAlerts) {
-        message += 'Straighten your back! ';
+var backAlertsElem = document.getElementById('back-alerts');
+var neckAlertsElem = document.getElementById('neck-alerts');
+
+// alert counts polled from the server, used when the websocket is unavailable
+function listenSSE() {
+    var source = new EventSource("{% url 'main:sse' %}");
+    source.addEventListener('message', function(event) {
+        var data = JSON.parse(event.data);
+        var backAlerts = parseInt(backAlertsElem.innerText);
+        var neckAlerts = parseInt(neckAlertsElem.innerText);
+        // Update the values of the elements with the received data
+        backAlertsElem.innerText = data.back_alert;
+        neckAlertsElem.innerText = data.neck_alert;
+        // Show the modal popup if the value of back-alerts or neck-alerts changes
+        var message = '';
+        if (!isFirstLoad && parseInt(data.back_alert) > backAlerts) {
+            message += 'Straighten your back! ';
+        }
+        if (!isFirstLoad && parseInt(data.neck_alert) > neckAlerts) {
+            message += 'straighten your neck!';
+        }
+        if (message !== '') {
+            showModal(message);
+        }
+        // Set the flag to false after the first load
+        isFirstLoad = false;
+    });
+}
+
+// alerts, device status and keypoints pushed by the device through the server as they happen
+function listenWebSocket() {
+    var scheme = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+    var socket = new WebSocket(scheme + window.location.host + '/ws/monitor/');
+    socket.binaryType = 'arraybuffer';
+    var opened = false;
+    socket.onopen = function() {
+        opened = true;
+    };
+    socket.onmessage = function(event) {
+        if (event.data instanceof ArrayBuffer) {
+            drawKeypoints(new DataView(event.data));
+            return;
+        }
+        var data = JSON.parse(event.data);
+        if (data.type === 'alert') {
+            backAlertsElem.innerText = data.back_alert;
+            neckAlertsElem.innerText = data.neck_alert;
+            var message = '';
+            if (data.alert.indexOf('back') !== -1) {
+                message += 'Straighten your back! ';
+            }
+            if (data.alert.indexOf('neck') !== -1) {
+                message += 'straighten your neck!';
+            }
+            showModal(message);
+        } else if (data.type === 'device') {
+            document.getElementById('device-status').innerText = data.online ? 'Device connected' : 'Device disconnected';
+        }
+    };
+    socket.onclose = function() {
+        // never connected: the server doesn't serve websockets, fall back on sse
+        if (!opened) {
+            listenSSE();
+        } else {
+            setTimeout(listenWebSocket, 2000);
+        }
+    };
+}
+
+// float16 to number, browsers have no Float16Array
+function halfToFloat(bits) {
+    var exponent = (bits >> 10) & 0x1f;
+    var fraction = bits & 0x3ff;
+    var sign = bits & 0x8000 ? -1 : 1;
+    if (exponent === 0) {
+        return sign * Math.pow(2, -14) * (fraction / 1024);
     }
-    if (!isFirstLoad && parseInt(data.neck_alert) > neckAlerts) {
-        message += 'straighten your neck!';
+    if (exponent === 0x1f) {
+        return fraction ? NaN : sign * Infinity;
     }
-    if (message !== '') {
-        showModal(message);
+    return sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+}
+
+// 17 (y, x, score) keypoints packed as little-endian float16
+function drawKeypoints(view) {
+    var canvas = document.getElementById('keypoints-canvas');
+    var context = canvas.getContext('2d');
+    context.clearRect(0, 0, canvas.width, canvas.height);
+    context.fillStyle = '#198754';
+    for (var i = 0; i < 17; i++) {
+        var y = halfToFloat(view.getUint16(i * 6, true));
+        var x = halfToFloat(view.getUint16(i * 6 + 2, true));
+        var score = halfToFloat(view.getUint16(i * 6 + 4, true));
+        if (score > 0.4) {
+            context.beginPath();
+            context.arc(x * canvas.width, y * canvas.height, 4, 0, 2 * Math.PI);
+            context.fill();
+        }
     }
-    // Set the flag to false after the first load
-    isFirstLoad = false;
-});
+}
 
 function showModal(message) {
     var modal = document.getElementById('alert-modal');
@@ -36,3 +112,17 @@ function showModal(message) {
         modal.style.display = "none";
     }, 3000);
 }
+
+if ('WebSocket' in window) {
+    // the counters start from the database, later alerts arrive through the websocket
+    fetch("{% url 'main:sse' %}").then(function(response) {
+        return response.text();
+    }).then(function(text) {
+        var data = JSON.parse(text.replace('data: ', ''));
+        backAlertsElem.innerText = data.back_alert;
+        neckAlertsElem.innerText = data.neck_alert;
+    });
+    listenWebSocket();
+} else {
+    listenSSE();
+}
@@ -0,0 +1,42 @@
+from posture_corrector_api import analyse_videos
+import argparse
+import json
+import time
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Produces the posture session summary of recorded sitting sessions.')
+    parser.add_argument('videos', nargs='+', help='video files to analyse')
+    parser.add_argument('--camera-position', type=int, default=1, choices=[1, 2, 3], 
+                        help='1 lateral right, 2 frontal, 3 lateral left')
+    parser.add_argument('--backend', default='onnx', choices=['trt', 'onnx', 'tflite'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--fps', type=float, default=10, help='frames analysed per second of video')
+    parser.add_argument('--segment', type=int, default=300, help='seconds of video per task')
+    parser.add_argument('--output', help='json lines file the summaries are written to')
+    args = parser.parse_args()
+
+    start = time.time()
+    summaries = analyse_videos(
+        args.videos, 
+        camera_position=args.camera_position, 
+        backend=args.backend, 
+        workers=args.workers, 
+        sample_fps=args.fps, 
+        segment_seconds=args.segment
+    )
+    elapsed = time.time() - start
+
+    video_seconds = sum(summary['end_time'] - summary['start_time'] for summary in summaries.values())
+    lines = [json.dumps(dict(summary, video=path)) for path, summary in summaries.items()]
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    else:
+        print('\n'.join(lines))
+    print(f'\nAnalysed {video_seconds} s of video in {elapsed:.1f} s ({video_seconds / max(elapsed, 1e-6):.1f}x real time)')
+
+
+if __name__ == '__main__':
+    main()
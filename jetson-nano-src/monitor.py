@@ -4,6 +4,15 @@ from posture_corrector_api import (
     draw_connections, 
     draw_keypoints, 
     authenticate_user, 
+    open_source,
+    run_pipeline,
+    ModelScheduler,
+    ThermalGovernor,
+    AlertScheduler,
+    configure_tracing,
+    configure_metrics,
+    metrics,
+    tracer,
     CameraException, 
     PhotosUploadException, 
     FolderCleaningException, 
@@ -13,7 +22,6 @@ import numpy as np
 import getpass
 import time
 import cv2
-import os
 
 
 def main():
@@ -56,6 +64,25 @@ def main():
         else:
             print('\n' + 'Authentication Error: Incorrect email or password, please try again.' + '\n')
 
+    configure_tracing(config.get('tracing'))
+    configure_metrics(config.get('metrics'))
+    pipeline = config.get('pipeline') or {}
+    multiprocess = bool(pipeline.get('multiprocess', False))
+    scheduling = dict(config.get('scheduler') or {})
+    governing = dict(config.get('governor') or {})
+    governor = ThermalGovernor(**governing) if governing.pop('enabled', False) else None
+    scheduler = None
+    fps = 19
+    if scheduling.pop('enabled', False) and not multiprocess:
+        # the buffers are sized for the rate the scheduler paces detections at
+        fps = scheduling.get('target_fps', fps)
+        scheduler = ModelScheduler(governor=governor, **scheduling)
+    elif governor is not None and not multiprocess:
+        # the governor paces the default TensorRT model on its own
+        scheduler = ModelScheduler([{'name': 'thunder-256-fp16', 'backend': 'trt'}], target_fps=fps, governor=governor)
+    if governor is not None:
+        metrics.watch_governor(governor)
+
     # creating an instance of the PostureCorrector class
     # after testing and calculating the average fps it turns out to be 17
     user = PostureCorrectorTrt(
@@ -64,52 +91,92 @@ def main():
         email=email, 
         password=password,
         camera_position=camera_position, 
-        fps=19,
-        duration=10
+        fps=fps,
+        duration=10,
+        # in multiprocess mode the model is loaded by the inference process
+        load_model=not multiprocess and scheduler is None,
+        alert_scheduler=AlertScheduler(**(config.get('alerts') or {}))
     )
-    try: 
-        # Open the CS2 camera and start capturing frames
-        cap = cv2.VideoCapture("nvarguscamerasrc ! video/x-raw(memory:NVMM),width=3280,height=2464,format=NV12,framerate=21/1 \
-                                ! nvvidconv flip-method=2 ! video/x-raw, width=(int)640, height=(int)480, format=(string)BGRx \
-                            ! videoconvert ! video/x-raw, format=(string)BGR ! appsink")
-    except:
-        raise CameraException("No camera module detected on your device. Please make sure your camera is connected.")
+    metrics.watch_session(user.app)
+    channel = dict(config.get('channel') or {})
+    if channel.pop('enabled', False):
+        user.app.open_channel(**channel)
+    if multiprocess:
+        # capture and inference run in their own processes, frames are shared in memory
+        run_pipeline(user, config.get('camera'), backend='trt', slots=int(pipeline.get('slots', 4)))
+    else:
+        # Open the camera set in config.yaml (CSI by default) and start capturing frames
+        cap = open_source(config.get('camera'))
+        if not cap.isOpened():
+            raise CameraException("No camera module detected on your device. Please make sure your camera is connected.")
         
-    while cap.isOpened():
-        ret, frame = cap.read()
-
-        # Preprocess the input image
-        img = cv2.resize(frame, (256, 256))
-        img = img.astype(np.float32)
-        img = np.expand_dims(img, axis=0)
-
-        # detect body key joint
-        user.detect(img)
-        keypoints_with_scores = user.keypoints_with_scores
-        # Render the output keypoints and drawing connections
-        draw_connections(frame, keypoints_with_scores, 0.4)
-        draw_keypoints(frame, keypoints_with_scores, 0.4)
-        # detection of the current posture
-        user.monitor_posture()
-        # update frames for photos if incorrect postures last 10 seconds
-        user.frame = frame 
-        # render neck and back postures on frames
-        text = f"back posture: {user.back_posture}"
-        cv2.putText(frame, text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-
-        text2 = f"neck posture: {user.neck_posture}" 
-        cv2.putText(frame, text2, (50, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2) 
-
-        # pop up monitoring screen
-        cv2.imshow('monitor', frame)
-
-        if cv2.waitKey(10) & 0xFF == ord('q'):
-            break
+        while cap.isOpened():
+            with tracer.span('capture'):
+                ret, frame = cap.read()
+            # end of a video file or synthetic source
+            if not ret:
+                break
+            metrics.frame_captured()
+
+            samples = 1
+            if scheduler is not None:
+                samples = scheduler.pace()
+                if samples == 0:
+                    metrics.frames_dropped.inc(reason='paced')
+                    # ahead of the target fps, the frame is only displayed
+                    cv2.imshow('monitor', frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                    continue
+
+            # Preprocess the input image
+            with tracer.span('preprocess'):
+                size = scheduler.input_size if scheduler is not None else 256
+                img = cv2.resize(frame, (size, size))
+                img = img.astype(np.float32)
+                img = np.expand_dims(img, axis=0)
+
+            # detect body key joint
+            if scheduler is not None:
+                scheduler.detect(img)
+                user.update_keypoints(scheduler.keypoints_with_scores)
+            else:
+                user.detect(img)
+            keypoints_with_scores = user.keypoints_with_scores
+            # live skeleton on the monitoring page, rate limited by the channel
+            user.app.send_keypoints(keypoints_with_scores)
+            # Render the output keypoints and drawing connections
+            with tracer.span('draw'):
+                draw_connections(frame, keypoints_with_scores, 0.4)
+                draw_keypoints(frame, keypoints_with_scores, 0.4)
+            # detection of the current posture
+            with tracer.span('monitor_posture'):
+                user.monitor_posture(samples)
+            metrics.frame_inferred()
+            # update frames for photos if incorrect postures last 10 seconds
+            user.frame = frame 
+            # render neck and back postures on frames
+            text = f"back posture: {user.back_posture}"
+            cv2.putText(frame, text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+
+            text2 = f"neck posture: {user.neck_posture}" 
+            cv2.putText(frame, text2, (50, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2) 
+
+            # pop up monitoring screen
+            with tracer.span('imshow'):
+                cv2.imshow('monitor', frame)
+                key = cv2.waitKey(10)
+
+            if key & 0xFF == ord('q'):
+                break
 
-    cap.release()
-    cv2.destroyAllWindows()
+        cap.release()
+        cv2.destroyAllWindows()
 
     end_time = int(time.time())
+    # the timelines stop with the monitoring, not once the photos are uploaded
+    user.app.end_session()
+    user.app.close_channel()
 
     # exceptions handling
     try:
@@ -123,8 +190,7 @@ def main():
     else:
         try:
             user.app.clean_folder()
-            folder_path = 'incorrect_postures/'
-            empty_folder = True if len(os.listdir(folder_path)) == 0 else False 
+            empty_folder = True if len(user.app.photos()) == 0 else False 
             if not empty_folder:
                 raise FolderCleaningException("Either you don't have an empty folder named incorrect_postures under the root directory, or the photos weren't deleted.")
         except FolderCleaningException as e:
@@ -0,0 +1,66 @@
+from posture_corrector_api import (
+    MultiStreamMonitor,
+    load_config,
+    authenticate_user, 
+    PhotosUploadException, 
+    DatabaseUpdateException
+)
+import getpass
+import time
+
+
+def main():
+
+    config = load_config('config.yaml')
+    host = str(config['server']['host'])
+    port = str(config['server']['port'])
+    # every stream sets its own camera and position, see the streams section of config.yaml
+    streams = config.get('streams') or []
+    if len(streams) == 0:
+        print('No streams configured in config.yaml, use monitor.py to monitor a single camera.')
+        return
+
+    print('Please enter your account email and password to be authenticated.' +'\n')
+    while 1:
+        email = str(input('Enter your email: '))
+        password = getpass.getpass(prompt='Enter your password: ')
+        if authenticate_user(host, port, email, password) == 'user identified':
+            print('\n' + 'Authentication successful' + '\n')
+            break
+        print('\n' + 'Authentication Error: Incorrect email or password, please try again.' + '\n')
+
+    print('Launching Program with {} streams...'.format(len(streams)) + '\n')
+    monitor = MultiStreamMonitor(
+        streams=streams, 
+        host=host, 
+        port=port, 
+        email=email, 
+        password=password, 
+        fps=19, 
+        duration=10
+    )
+    monitor.run()
+
+    end_time = int(time.time())
+    # the timelines stop with the monitoring, not once the photos are uploaded
+    for user in monitor.correctors:
+        user.app.end_session()
+
+    # each stream is stored as its own video in the app
+    for idx, user in enumerate(monitor.correctors):
+        try:
+            upload_photos = user.app.upload_photos()
+            if upload_photos != "success" and upload_photos != "No incorrect postures":
+                raise PhotosUploadException("The incorrect posture photos captured during the video weren't sent to the app.")
+            user.app.clean_folder()
+            update_database = user.app.update_database(end_time)
+            if update_database != "success":
+                raise DatabaseUpdateException("The data collected to assess your posture during the video weren't sent to the app.")
+        except (PhotosUploadException, DatabaseUpdateException) as e:
+            print(f"Error with stream {idx}: {e}")
+        except Exception as e:
+            print(f"Unexpected error with stream {idx}: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,21 @@
 # posture_corrector_api
 
-from .movenet_models import ModelTrt, ModelOnnx, ModelTflite
-from .utils import load_config, draw_connections, draw_keypoints, authenticate_user 
+from .movenet_models import ModelTrt, ModelOnnx, ModelTflite, load_onnx_options, load_tflite_options
+from .utils import load_config, draw_connections, draw_keypoints, resize_with_pad, authenticate_user 
 from .corrector import PostureCorrectorTrt 
 from .post_requests import DjangoAppSession 
+from .channel import DeviceChannel
+from .timeline import PostureTimeline, PostureDwell
+from .sources import FrameSource, CsiCamera, V4l2Camera, VideoFile, SyntheticSource, open_source
+from .pipeline import SharedFrameRing, run_pipeline
+from .analysis import OfflineCorrector, analyse_videos
+from .multistream import MultiStreamMonitor
+from .scheduler import ModelScheduler
+from .alerts import Alert, AlertScheduler
+from .governor import ThermalGovernor
+from .tracing import Tracer, tracer, traced, configure_tracing
+from .metrics import start_metrics_server, configure_metrics
+from . import metrics
 from .test_correctors import TestCorrectorTrt, TestCorrectorOnnx, TestCorrectorTflite
 from .exceptions import CameraException, PhotosUploadException, FolderCleaningException, DatabaseUpdateException
 
@@ -11,12 +23,40 @@ __all__ = [
            'ModelTrt', 
            'ModelOnnx', 
            'ModelTflite', 
+           'load_onnx_options',
+           'load_tflite_options',
            'load_config',
            'draw_connections', 
            'draw_keypoints', 
+           'resize_with_pad',
            'authenticate_user', 
            'PostureCorrectorTrt', 
            'DjangoAppSession',
+           'DeviceChannel',
+           'PostureTimeline',
+           'PostureDwell',
+           'FrameSource',
+           'CsiCamera',
+           'V4l2Camera',
+           'VideoFile',
+           'SyntheticSource',
+           'open_source',
+           'SharedFrameRing',
+           'run_pipeline',
+           'OfflineCorrector',
+           'analyse_videos',
+           'MultiStreamMonitor',
+           'ModelScheduler',
+           'Alert',
+           'AlertScheduler',
+           'ThermalGovernor',
+           'Tracer',
+           'tracer',
+           'traced',
+           'configure_tracing',
+           'metrics',
+           'start_metrics_server',
+           'configure_metrics',
            'TestCorrectorTrt', 
            'TestCorrectorOnnx', 
            'TestCorrectorTflite',
@@ -0,0 +1,91 @@
+from collections import namedtuple
+import time
+
+
+# one notification: the alert types it covers with the incorrect posture code of each, its escalation
+# level and the time it was emitted
+Alert = namedtuple('Alert', ['types', 'postures', 'level', 'time'])
+
+
+class AlertScheduler:
+    '''
+    * Decides when a buffer full of an incorrect posture becomes a notification, without ever sleeping:
+      alerts are raised by the frame loop and collected by poll() on the following frames.
+    * Each alert type has its own cooldown, an alert raised while its type is cooling down is dropped.
+    * The same posture alerting again within escalation_window seconds raises the escalation level,
+      every level halves the cooldown of that type down to min_cooldown.
+    * Neck and back alerts raised within coalesce_window seconds of each other are sent as one notification.
+    * Times come from a monotonic clock, replaced by the position in the video for recordings.
+    '''
+    def __init__(self, cooldowns: dict=None, min_cooldown: float=10, escalation_window: float=120, max_level: int=3, coalesce_window: float=1, clock=time.monotonic):
+        self.__cooldowns = dict({'neck': 30, 'back': 30}, **(cooldowns or {}))
+        self.__min_cooldown = min_cooldown
+        self.__escalation_window = escalation_window
+        self.__max_level = max_level
+        self.__coalesce_window = coalesce_window
+        self.__clock = clock
+        self.__cooling_until = {}
+        # (posture, emitted at, level) of the last alert of each type
+        self.__last = {}
+        self.__pending = {}
+        self.__pending_since = None
+        self.__suppressed = 0
+
+    @property
+    def suppressed(self) -> int:
+        '''alerts dropped because their type was cooling down'''
+        return self.__suppressed
+
+    def set_clock(self, clock) -> None:
+        '''
+        replaces the clock, e.g. by the position in a recorded video
+
+        :param clock: callable returning seconds
+        '''
+        self.__clock = clock
+
+    def raise_alert(self, alert_type: str, posture: int) -> bool:
+        '''
+        registers an alert, sent by the next poll unless its type is cooling down
+
+        :param alert_type: neck or back
+        :param posture: incorrect posture code stored in the buffer
+        :returns: whether the alert was kept
+        '''
+        now = self.__clock()
+        if now < self.__cooling_until.get(alert_type, float('-inf')) or alert_type in self.__pending:
+            self.__suppressed += 1
+            return False
+        self.__pending[alert_type] = posture
+        if self.__pending_since is None:
+            self.__pending_since = now
+        return True
+
+    def poll(self) -> list:
+        '''
+        alerts due now, called on every frame
+
+        :returns: list of Alert, empty most of the time
+        '''
+        if not self.__pending:
+            return []
+        now = self.__clock()
+        # the other type may still join unless every type is already there
+        if len(self.__pending) < len(self.__cooldowns) and now - self.__pending_since < self.__coalesce_window:
+            return []
+
+        level = 0
+        for alert_type, posture in self.__pending.items():
+            type_level = 0
+            last = self.__last.get(alert_type)
+            if last is not None and last[0] == posture and now - last[1] <= self.__escalation_window:
+                type_level = min(last[2] + 1, self.__max_level)
+            self.__last[alert_type] = (posture, now, type_level)
+            cooldown = max(self.__min_cooldown, self.__cooldowns.get(alert_type, self.__min_cooldown) / 2 ** type_level)
+            self.__cooling_until[alert_type] = now + cooldown
+            level = max(level, type_level)
+
+        alert = Alert(types=tuple(sorted(self.__pending)), postures=dict(self.__pending), level=level, time=now)
+        self.__pending = {}
+        self.__pending_since = None
+        return [alert]
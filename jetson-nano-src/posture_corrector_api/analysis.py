@@ -0,0 +1,178 @@
+from .corrector import PostureCorrectorTrt
+from .pipeline import BACKENDS
+from .timeline import PostureTimeline
+import multiprocessing as mp
+import numpy as np
+import struct
+import base64
+import json
+import os
+import cv2
+
+
+class OfflineCorrector(PostureCorrectorTrt):
+    '''
+    * Applies the posture rules of PostureCorrectorTrt to keypoints predicted from a recorded video.
+    * Nobody is watching a recording, so alerts are only counted: no request is sent and no photo is taken.
+    '''
+    def __init__(self, camera_position: int=1, fps: float=10, duration: int=10):
+        super(OfflineCorrector, self).__init__(
+            host='', 
+            port='', 
+            email='', 
+            password='', 
+            camera_position=camera_position, 
+            fps=fps, 
+            duration=duration, 
+            load_model=False
+        )
+
+    def _notify(self, alert_type: str, level: int=0) -> None:
+        pass
+
+    def _photo(self, frame: np.ndarray) -> None:
+        pass
+
+
+# model of the current pool worker, each process loads its own
+_model = None
+
+
+def _init_worker(backend: str) -> None:
+    global _model
+    _model = BACKENDS[backend]()
+
+
+def _analyse_segment(task: tuple) -> dict:
+    '''runs the model and the posture rules on one range of frames of a video'''
+    path, first_frame, last_frame, camera_position, sample_fps = task
+    cap = cv2.VideoCapture(path)
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    # frames in between samples are grabbed without being decoded into images
+    step = max(1, int(round(video_fps / sample_fps)))
+    corrector = OfflineCorrector(camera_position=camera_position, fps=video_fps / step)
+    # timelines and alert cooldowns follow the position in the video rather than the wall clock
+    position = [0.0]
+    clock = lambda: position[0]
+    corrector.app.neck_timeline.set_clock(clock)
+    corrector.app.back_timeline.set_clock(clock)
+    corrector.alert_scheduler.set_clock(clock)
+    corrector.app.dwell.set_clock(clock)
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    for index in range(first_frame, last_frame):
+        position[0] = (index - first_frame) / video_fps
+        if (index - first_frame) % step:
+            if not cap.grab():
+                break
+            continue
+        ret, frame = cap.read()
+        if not ret:
+            break
+        img = cv2.resize(frame, (_model.input_size, _model.input_size))
+        img = np.expand_dims(img.astype(np.float32), axis=0)
+        _model.detect(img)
+        corrector.update_keypoints(_model.keypoints_with_scores)
+        corrector.monitor_posture()
+    cap.release()
+
+    end = int(position[0] * 1000)
+    return {
+        'path': path,
+        'offset': int(first_frame / video_fps * 1000),
+        'duration': (last_frame - first_frame) / video_fps,
+        'total_alerts': corrector.app.total_alerts,
+        'incorrect_postures': list(corrector.app.incorrect_postures),
+        'neck_timeline': corrector.app.neck_timeline.close(end),
+        'back_timeline': corrector.app.back_timeline.close(end),
+        'posture_seconds': corrector.app.dwell.close(),
+        'poor_posture_seconds': corrector.app.dwell.poor_posture_seconds,
+    }
+
+
+def merge_timelines(segments: list) -> bytes:
+    '''
+    joins the timelines of consecutive segments, shifting each run by the segment offset
+    and merging the runs of the same posture that meet at a boundary
+
+    :param segments: (offset in milliseconds, encoded timeline) sorted by offset
+    '''
+    runs = []
+    for offset, timeline in segments:
+        for code, start, duration in struct.iter_unpack(PostureTimeline.RUN_FORMAT, timeline):
+            start += offset
+            if runs and runs[-1][0] == code and runs[-1][1] + runs[-1][2] >= start:
+                runs[-1][2] = start + duration - runs[-1][1]
+            else:
+                runs.append([code, start, duration])
+    return b''.join(struct.pack(PostureTimeline.RUN_FORMAT, *run) for run in runs)
+
+
+def session_summary(segments: list, start_time: int) -> dict:
+    '''builds the data update_database sends to the app out of the analysed segments of one video'''
+    segments = sorted(segments, key=lambda segment: segment['offset'])
+    duration = sum(segment['duration'] for segment in segments)
+    incorrect_postures = [posture for segment in segments for posture in segment['incorrect_postures']]
+    if len(incorrect_postures) == 0:
+        incorrect_postures.append('No Incorrect Postures')
+    neck_timeline = merge_timelines([(segment['offset'], segment['neck_timeline']) for segment in segments])
+    back_timeline = merge_timelines([(segment['offset'], segment['back_timeline']) for segment in segments])
+    posture_seconds = {}
+    for segment in segments:
+        for posture, seconds in segment['posture_seconds'].items():
+            posture_seconds[posture] = round(posture_seconds.get(posture, 0) + seconds, 3)
+    return {
+        'start_time': start_time,
+        'end_time': start_time + int(duration),
+        'total_alerts': sum(segment['total_alerts'] for segment in segments),
+        'incorrect_postures': json.dumps(incorrect_postures),
+        'neck_timeline': base64.b64encode(neck_timeline).decode(),
+        'back_timeline': base64.b64encode(back_timeline).decode(),
+        'posture_seconds': json.dumps(posture_seconds),
+        'poor_posture_seconds': round(sum(segment['poor_posture_seconds'] for segment in segments), 3),
+    }
+
+
+def split_video(path: str, segment_seconds: int) -> list:
+    '''(first frame, last frame) ranges of a video, one per segment'''
+    cap = cv2.VideoCapture(path)
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+    segment_frames = max(1, int(segment_seconds * video_fps))
+    return [(first, min(first + segment_frames, num_frames)) for first in range(0, num_frames, segment_frames)]
+
+
+def analyse_videos(paths: list, camera_position: int=1, backend: str='onnx', workers: int=None, 
+                   sample_fps: float=10, segment_seconds: int=300) -> dict:
+    '''
+    * Analyses recorded sitting sessions and returns the session summary of each video, keyed by path.
+    * Videos are cut into segments spread over a pool of processes, each holding its own model instance.
+    * Posture buffers restart at every segment boundary, so an incorrect posture straddling two segments
+      may be missed, longer segments make this rarer.
+
+    :param paths: video files
+    :param camera_position: 1 lateral right, 2 frontal, 3 lateral left
+    :param backend: trt, onnx or tflite
+    :param workers: number of processes, defaults to the number of cores
+    :param sample_fps: frames analysed per second of video
+    :param segment_seconds: length of the video segments handed to the workers
+    '''
+    tasks = [
+        (path, first, last, camera_position, sample_fps)
+        for path in paths
+        for first, last in split_video(path, segment_seconds)
+    ]
+    results = {path: [] for path in paths}
+    context = mp.get_context('spawn')
+    with context.Pool(processes=workers or os.cpu_count(), initializer=_init_worker, initargs=(backend,)) as pool:
+        for segment in pool.imap_unordered(_analyse_segment, tasks):
+            results[segment['path']].append(segment)
+
+    summaries = {}
+    for path, segments in results.items():
+        duration = sum(segment['duration'] for segment in segments)
+        # the file was last written when the recording stopped
+        start_time = int(os.path.getmtime(path) - duration)
+        summaries[path] = session_summary(segments, start_time)
+    return summaries
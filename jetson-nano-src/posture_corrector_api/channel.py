@@ -0,0 +1,204 @@
+from collections import deque
+import numpy as np
+import threading
+import queue
+import json
+import time
+
+
+def _import_websocket():
+    '''websocket-client is only needed when the channel is enabled'''
+    try:
+        import websocket
+    except ImportError:
+        raise ImportError("the device channel needs websocket-client, install it with: pip3 install websocket-client")
+    return websocket
+
+
+class DeviceChannel:
+    '''
+    * Persistent WebSocket connection to the app (ws://host:port/ws/device/), authenticated once with the
+      account email and password instead of on every alert like the HTTP endpoints.
+    * A background thread owns the socket: it sends the queued messages, a heartbeat every heartbeat_interval
+      seconds and reconnects with a doubling backoff up to max_backoff seconds when the connection drops.
+    * Alerts are acknowledged by the app, alerts still unacknowledged when the connection drops are sent again
+      once it's back.
+    * Keypoints are sent at most keypoints_fps times per second as 17x3 float16 (102 bytes), they are dropped
+      rather than queued when the app can't keep up.
+    '''
+    def __init__(self, host: str, port: str, email: str, password: str, heartbeat_interval: float=10, keypoints_fps: float=10, queue_size: int=64, max_backoff: float=30, timeout: float=5, clock=time.monotonic):
+        self.__url = 'ws://' + host + ':' + port + '/ws/device/'
+        self.__email = email
+        self.__password = password
+        self.__heartbeat_interval = heartbeat_interval
+        self.__keypoints_interval = 1 / keypoints_fps if keypoints_fps > 0 else None
+        self.__max_backoff = max_backoff
+        self.__timeout = timeout
+        self.__clock = clock
+        self.__websocket = _import_websocket()
+        # (opcode, payload) waiting for the socket
+        self.__outbox = queue.Queue(maxsize=queue_size)
+        # alerts sent but not acknowledged yet, by id
+        self.__unacked = {}
+        self.__lock = threading.Lock()
+        self.__next_id = 0
+        self.__keypoints_sent_at = None
+        self.__connected = threading.Event()
+        self.__stopped = threading.Event()
+        self.__latencies = deque(maxlen=32)
+        self.__dropped = 0
+        self.__reconnects = 0
+        self.__thread = None
+
+    @property
+    def connected(self) -> bool:
+        return self.__connected.is_set()
+
+    @property
+    def pending_alerts(self) -> int:
+        '''alerts sent but not acknowledged yet'''
+        with self.__lock:
+            return len(self.__unacked)
+
+    @property
+    def dropped(self) -> int:
+        '''keypoints dropped because the outbox was full'''
+        return self.__dropped
+
+    @property
+    def reconnects(self) -> int:
+        return self.__reconnects
+
+    @property
+    def latency(self) -> float:
+        '''average round trip of the heartbeats in seconds, None before the first one'''
+        if not self.__latencies:
+            return None
+        return sum(self.__latencies) / len(self.__latencies)
+
+    def start(self) -> 'DeviceChannel':
+        '''connects in the background, returns immediately'''
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self._run, name='device-channel', daemon=True)
+            self.__thread.start()
+        return self
+
+    def close(self, timeout: float=2) -> None:
+        '''stops the background thread, the queued messages are sent first while connected'''
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def wait_connected(self, timeout: float=None) -> bool:
+        return self.__connected.wait(timeout)
+
+    def send_alert(self, alert_type: str, level: int=0) -> bool:
+        '''
+        queues an alert for the app
+
+        :param alert_type: back, neck or both as "back,neck"
+        :param level: escalation level of the alert
+        :returns: False when the channel isn't connected, the caller then falls back on HTTP
+        '''
+        if not self.connected:
+            return False
+        with self.__lock:
+            self.__next_id += 1
+            message = {'type': 'alert', 'alert': alert_type, 'level': level, 'id': self.__next_id}
+            self.__unacked[self.__next_id] = message
+        try:
+            self.__outbox.put(('text', json.dumps(message)), timeout=self.__timeout)
+        except queue.Full:
+            with self.__lock:
+                self.__unacked.pop(message['id'], None)
+            return False
+        return True
+
+    def send_keypoints(self, keypoints_with_scores: np.ndarray) -> bool:
+        '''
+        queues the keypoints of the last frame unless the previous ones were sent less than 1 / keypoints_fps ago
+
+        :param keypoints_with_scores: MoveNet output, 17 (y, x, score) rows
+        :returns: whether the keypoints were queued
+        '''
+        if self.__keypoints_interval is None or not self.connected:
+            return False
+        now = self.__clock()
+        if self.__keypoints_sent_at is not None and now - self.__keypoints_sent_at < self.__keypoints_interval:
+            return False
+        payload = np.asarray(keypoints_with_scores, dtype='<f2').reshape(17, 3).tobytes()
+        try:
+            self.__outbox.put_nowait(('binary', payload))
+        except queue.Full:
+            self.__dropped += 1
+            return False
+        self.__keypoints_sent_at = now
+        return True
+
+    def _run(self) -> None:
+        backoff = 1
+        while not self.__stopped.is_set():
+            try:
+                ws = self._connect()
+            except Exception as e:
+                print(f"Device channel: connection failed ({e}), retrying in {backoff}s")
+                self.__stopped.wait(backoff)
+                backoff = min(backoff * 2, self.__max_backoff)
+                continue
+            backoff = 1
+            try:
+                self._serve(ws)
+            except Exception as e:
+                print(f"Device channel: connection lost ({e})")
+            finally:
+                self.__connected.clear()
+                ws.close()
+            if not self.__stopped.is_set():
+                self.__reconnects += 1
+
+    def _connect(self):
+        '''opens the socket, authenticates and sends the alerts left unacknowledged by the previous connection'''
+        ws = self.__websocket.create_connection(self.__url, timeout=self.__timeout)
+        ws.send(json.dumps({'type': 'auth', 'email': self.__email, 'password': self.__password}))
+        response = json.loads(ws.recv())
+        if response.get('status') != 'user identified':
+            ws.close()
+            raise ConnectionError(response.get('status'))
+        with self.__lock:
+            unacked = list(self.__unacked.values())
+        for message in unacked:
+            ws.send(json.dumps(message))
+        self.__connected.set()
+        return ws
+
+    def _serve(self, ws) -> None:
+        '''sends the outbox and heartbeats and reads the acks until the connection drops or the channel is closed'''
+        ws.settimeout(0.05)
+        heartbeat_at = self.__clock()
+        while not (self.__stopped.is_set() and self.__outbox.empty()):
+            try:
+                opcode, payload = self.__outbox.get(timeout=0.05)
+                if opcode == 'binary':
+                    ws.send_binary(payload)
+                else:
+                    ws.send(payload)
+            except queue.Empty:
+                pass
+            if self.__clock() >= heartbeat_at:
+                ws.send(json.dumps({'type': 'heartbeat', 'time': self.__clock()}))
+                heartbeat_at = self.__clock() + self.__heartbeat_interval
+            try:
+                message = ws.recv()
+            except self.__websocket.WebSocketTimeoutException:
+                continue
+            if not message:
+                raise ConnectionError('closed by the app')
+            self._receive(json.loads(message))
+
+    def _receive(self, message: dict) -> None:
+        if message.get('type') == 'ack':
+            with self.__lock:
+                self.__unacked.pop(message.get('id'), None)
+        elif message.get('type') == 'heartbeat' and message.get('time') is not None:
+            self.__latencies.append(self.__clock() - message['time'])
@@ -2,8 +2,12 @@ from .movenet_models import ModelTrt
 from .post_requests import DjangoAppSession
 from .optimised_computations import cpp_functions
 from .optimised_buffers import Buffers 
+from .alerts import Alert, AlertScheduler
+from .tracing import tracer, traced
+from . import metrics
 import numpy as np
 import math
+import os
 import cv2
 
 
@@ -16,12 +20,16 @@ class PostureCorrectorTrt(ModelTrt):
     * Postures are stored in c++ circular buffers, if they're full of an incorrect posture, an alert will be sent to the app along with other data.
     * Buffers are reinisialised if another type of posture is stored as the user is most likely moving.
     * Buffers take one argument, size. It is the number of frames generated throughout the period of time required to send alerts.
+    * Full buffers go through an AlertScheduler: per-type cooldowns, escalation and coalescing of neck and back alerts
+      are decided on monotonic time, the frame loop never waits after an alert.
     '''
     _euclidian_distance = staticmethod(cpp_functions.euclidean_distance)
     _angle_calculator = staticmethod(cpp_functions.angle_calculator)
 
-    def __init__(self, host: str, port:str, email: str, password: str, camera_position: int=1, fps: int=19, duration: int=10):
-        super(PostureCorrectorTrt, self).__init__()
+    def __init__(self, host: str, port:str, email: str, password: str, camera_position: int=1, fps: int=19, duration: int=10, load_model: bool=True, photos_folder: str='incorrect_postures/', alert_scheduler: AlertScheduler=None):
+        # without a model, keypoints predicted elsewhere are passed in with update_keypoints
+        if load_model:
+            super(PostureCorrectorTrt, self).__init__()
         self.__frame = None
         self.__photos_counter = 0
         self.__forward = b'f'[0] # 102
@@ -30,13 +38,17 @@ class PostureCorrectorTrt(ModelTrt):
         self.__duration = duration 
         self.__CAMERA_POSITION = camera_position
         self.__num_frames = int(self.__duration * fps) 
+        # posture samples the current frame stands for, see monitor_posture
+        self.__samples = 1
+        self.__alert_scheduler = alert_scheduler if alert_scheduler is not None else AlertScheduler()
         self.__neck_buffer = Buffers.PyNeckCircularBuffer(self.__num_frames)
         self.__back_buffer = Buffers.PyBackCircularBuffer(self.__num_frames)
         self.__app = DjangoAppSession(
             host=host,
             port=port,
             email=email,
-            password=password 
+            password=password,
+            photos_folder=photos_folder
         )
     
     @property
@@ -55,6 +67,10 @@ class PostureCorrectorTrt(ModelTrt):
     @property
     def app(self) -> DjangoAppSession:
         return self.__app 
+
+    @property
+    def alert_scheduler(self) -> AlertScheduler:
+        return self.__alert_scheduler
     
     @property
     def frame(self) -> np.ndarray:
@@ -64,33 +80,75 @@ class PostureCorrectorTrt(ModelTrt):
     def frame(self, frame: np.ndarray) -> None:
         self.__frame = frame 
 
-    def monitor_posture(self) -> None:
+    def monitor_posture(self, samples: int=1) -> None:
         '''
         monitors posture of the subject depending on the camera position selected,
         the surveillance is performed in segments of 10 seconds. if the subject
         happens to be in an improper posture during the whole time he/she will 
         be notified.
+
+        :param samples: buffer samples the frame stands for, more than 1 when frames
+                        arrive slower than the fps the buffers were sized for
         '''
+        self.__samples = samples
         # lateral right or left posture correction
         if (self.__CAMERA_POSITION == 1) | (self.__CAMERA_POSITION == 3):
-            self._lateral_neck_corrector()
-            self._lateral_back_corrector()
+            with tracer.span('corrector.geometry'):
+                self._lateral_neck_corrector()
+                self._lateral_back_corrector()
 
-            if self.__back_buffer.maxIncorrectReached():
-                self._send_alert("back")
-            if self.__neck_buffer.maxIncorrectReached():
-                self._send_alert("neck")
+            with tracer.span('corrector.buffers'):
+                back_alert, neck_alert = self._check_buffers()
+            self._raise_alerts(back_alert, neck_alert)
 
         # frontal posture correction
         elif self.__CAMERA_POSITION == 2 : 
-            self._frontal_neck_corrector()
-            self._frontal_back_corrector()
+            with tracer.span('corrector.geometry'):
+                self._frontal_neck_corrector()
+                self._frontal_back_corrector()
                 
             # checking if buffers are full of incorrect postures and notifying user if they are
-            if self.__back_buffer.maxIncorrectReached():
-                self._send_alert("back")
-            if self.__neck_buffer.maxIncorrectReached():
-                self._send_alert("neck")
+            with tracer.span('corrector.buffers'):
+                back_alert, neck_alert = self._check_buffers()
+            self._raise_alerts(back_alert, neck_alert)
+
+    def _check_buffers(self) -> tuple:
+        '''
+        checks whether the buffers are full of an incorrect posture, a buffer emptied without
+        an alert was reset because the user was moving
+
+        :returns: back and neck alerts
+        '''
+        back_alert = self.__back_buffer.maxIncorrectReached()
+        neck_alert = self.__neck_buffer.maxIncorrectReached()
+        if not back_alert and self.__back_buffer.isEmpty():
+            metrics.buffer_resets.inc(buffer='back')
+        if not neck_alert and self.__neck_buffer.isEmpty():
+            metrics.buffer_resets.inc(buffer='neck')
+        return back_alert, neck_alert
+
+    def _raise_alerts(self, back_alert: bool, neck_alert: bool) -> None:
+        '''hands full buffers to the alert scheduler and sends the alerts it has due'''
+        if back_alert:
+            self.__alert_scheduler.raise_alert("back", self.__back_buffer.getIncorrectPosture())
+        if neck_alert:
+            self.__alert_scheduler.raise_alert("neck", self.__neck_buffer.getIncorrectPosture())
+        for alert in self.__alert_scheduler.poll():
+            self._send_alert(alert)
+
+    def _add_neck_posture(self, posture: int) -> None:
+        '''stores the neck posture of the current frame in the buffer, the session timeline and the dwell counters'''
+        for _ in range(self.__samples):
+            self.__neck_buffer.addPosture(posture)
+        self.__app.neck_timeline.push(posture)
+        self.__app.dwell.push_neck(posture)
+
+    def _add_back_posture(self, posture: int) -> None:
+        '''stores the back posture of the current frame in the buffer, the session timeline and the dwell counters'''
+        for _ in range(self.__samples):
+            self.__back_buffer.addPosture(posture)
+        self.__app.back_timeline.push(posture)
+        self.__app.dwell.push_back(posture)
 
     def _frontal_neck_corrector(self) -> None:
         '''computes the neck frontal posture and store it in the neck buffer'''
@@ -105,9 +163,9 @@ class PostureCorrectorTrt(ModelTrt):
 
         # 325 is the angle threshold 35 flipped
         if (50 < right_shoulder_angle) & (left_shoulder_angle < 310):
-            self.__neck_buffer.addPosture(self.__upright)
+            self._add_neck_posture(self.__upright)
         else: 
-            self.__neck_buffer.addPosture(self.__forward)        
+            self._add_neck_posture(self.__forward)        
 
     def _lateral_neck_corrector(self) -> None:
         '''computes the neck lateral posture and store it in the neck buffer'''
@@ -120,9 +178,9 @@ class PostureCorrectorTrt(ModelTrt):
         # Compare the y-coordinates to determine if the subject is sat upright
         # We'll use a range of 9 pixels to allow for some variability in how people sit on chairs
         if (abs(nose_y - left_shoulder_y) < .09) & (abs(nose_y - right_shoulder_y) < .09):
-            self.__neck_buffer.addPosture(self.__forward)        
+            self._add_neck_posture(self.__forward)        
         else:
-            self.__neck_buffer.addPosture(self.__upright) 
+            self._add_neck_posture(self.__upright) 
     
     def _frontal_back_corrector(self) -> None:
         '''computes the back frontal posture and store it in the back buffer'''
@@ -145,9 +203,9 @@ class PostureCorrectorTrt(ModelTrt):
 
         # compare the distances
         if (nose_hip_dist*0.7) < shoulder_hip_dist:
-            self.__back_buffer.addPosture(self.__forward)
+            self._add_back_posture(self.__forward)
         else:
-            self.__back_buffer.addPosture(self.__upright) 
+            self._add_back_posture(self.__upright) 
             
     def _lateral_back_corrector(self) -> None:
         '''computes the back lateral posture and store it in the back buffer'''
@@ -166,11 +224,11 @@ class PostureCorrectorTrt(ModelTrt):
             right_hip_angle = self._angle_calculator(p1=rs, p2=rh, p3=rk)
 
             if 90 < right_hip_angle < 115: 
-                self.__back_buffer.addPosture(self.__upright)
+                self._add_back_posture(self.__upright)
             elif right_hip_angle < 90: 
-                self.__back_buffer.addPosture(self.__forward)
+                self._add_back_posture(self.__forward)
             elif right_hip_angle > 115: 
-                self.__back_buffer.addPosture(self.__reclined)
+                self._add_back_posture(self.__reclined)
             
         # lateral left
         elif self.__CAMERA_POSITION == 3:
@@ -178,46 +236,50 @@ class PostureCorrectorTrt(ModelTrt):
             left_hip_angle = self._angle_calculator(p1=ls, p2=lh, p3=lk)
 
             if 245 < left_hip_angle < 270: 
-                self.__back_buffer.addPosture(self.__upright)
+                self._add_back_posture(self.__upright)
             elif left_hip_angle < 245: 
-                self.__back_buffer.addPosture(self.__reclined)
+                self._add_back_posture(self.__reclined)
             elif left_hip_angle > 270: 
-                self.__back_buffer.addPosture(self.__forward)
+                self._add_back_posture(self.__forward)
 
-    def _send_alert(self, alert_type: str) -> None:
+    @traced('corrector.send_alert')
+    def _send_alert(self, alert: Alert) -> None:
         '''
         triggers the alert on the user interface, and store the incorrect posture
         sustained by the user during the 10 seconds of time.
 
-        :param alert_type: back or neck
+        :param alert: back and/or neck alert released by the alert scheduler
         '''
         print('notifying the user...')
-        # notifying the user
-        self.__app.notify_user(alert_type=alert_type)
-        # incrementing alerts count
-        self.__app.total_alerts = 1
+        # notifying the user, coalesced neck and back alerts share one request and one photo
+        self._notify(",".join(alert.types), alert.level)
         # taking a photo of the incorrect posture
         self._photo(self.__frame)
 
-        # selecting the right buffer
-        if alert_type == "back":
-            captured_incorrect_posture = self.__back_buffer.getIncorrectPosture()
-        elif alert_type == "neck":
-            captured_incorrect_posture = self.__neck_buffer.getIncorrectPosture()
+        for alert_type in alert.types:
+            metrics.alerts.inc(type=alert_type)
+            # incrementing alerts count
+            self.__app.total_alerts = 1
+            captured_incorrect_posture = alert.postures[alert_type]
+
+            # storing incorrect posture to send it to the app through a post requset
+            if alert_type == "back" and captured_incorrect_posture == self.__reclined:
+                self.__app.incorrect_postures =  "reclined back"
+            elif alert_type == "back" and captured_incorrect_posture == self.__forward:
+                self.__app.incorrect_postures = "forward-leaning back"
+            elif alert_type == "neck" and captured_incorrect_posture == self.__forward:
+                self.__app.incorrect_postures =  "forward-leaning neck"
 
-        # storing incorrect posture to send it to the app through a post requset
-        if alert_type == "back" and captured_incorrect_posture == self.__reclined:
-            self.__app.incorrect_postures =  "reclined back"
-        elif alert_type == "back" and captured_incorrect_posture == self.__forward:
-            self.__app.incorrect_postures = "forward-leaning back"
-        elif alert_type == "neck" and captured_incorrect_posture == self.__forward:
-            self.__app.incorrect_postures =  "forward-leaning neck"
+    def _notify(self, alert_type: str, level: int=0) -> None:
+        '''sends the alert to the app, overridden when there is no user to notify'''
+        self.__app.notify_user(alert_type=alert_type, level=level)
 
+    @traced('corrector.photo')
     def _photo(self, frame: np.ndarray) -> None:
         '''
         stores the last video frame when the user's posture is incorrect for 10 seconds
         
         :param frame: video frame
         '''
-        cv2.imwrite("incorrect_postures/incorrect_posture_{}.jpg".format(self.__photos_counter), frame)
+        cv2.imwrite(os.path.join(self.__app.photos_folder, "incorrect_posture_{}.jpg".format(self.__photos_counter)), frame)
         self.__photos_counter += 1
\ No newline at end of file
@@ -0,0 +1,132 @@
+import glob
+import time
+import os
+
+
+class ThermalGovernor:
+    '''
+    * Reads the CPU/GPU temperatures from <root>/sys/class/thermal, the CPU load from <root>/proc/stat
+      and the GPU load from <root>/sys/devices/gpu.0/load, root is / on the device and a fake tree in tests.
+    * The temperature is extrapolated lookahead seconds ahead from its smoothed slope, so the governor
+      reacts before the Nano reaches its throttling point rather than once it's throttled.
+    * pressure is 0 while there is headroom and reaches 1 when the predicted temperature hits hard_limit
+      or the CPU is saturated. ModelScheduler uses it to space out inferences (slowdown) and to move to
+      faster variants, which keeps the sustained throughput steady instead of swinging.
+    * Sensors are read at most once every poll_interval seconds, whatever the number of calls.
+    '''
+    def __init__(self, root: str='/', soft_limit: float=65, hard_limit: float=80, load_limit: float=0.85, lookahead: float=30, max_slowdown: float=3, poll_interval: float=1, zones: tuple=('CPU-therm', 'GPU-therm'), clock=time.monotonic):
+        self.__root = root
+        self.__soft = soft_limit
+        self.__hard = hard_limit
+        self.__load_limit = load_limit
+        self.__lookahead = lookahead
+        self.__max_slowdown = max_slowdown
+        self.__poll_interval = poll_interval
+        self.__clock = clock
+        self.__zones = self._find_zones(zones)
+        self.__polled_at = None
+        self.__cpu_times = None
+        self.__temperature = None
+        self.__slope = 0.0
+        self.__cpu_load = 0.0
+        self.__gpu_load = 0.0
+        self.__pressure = 0.0
+
+    def _path(self, *parts) -> str:
+        return os.path.join(self.__root, *parts)
+
+    def _find_zones(self, names: tuple) -> list:
+        '''temp files of the thermal zones with one of the names, every zone when none of them exists'''
+        zones = {}
+        for zone in sorted(glob.glob(self._path('sys', 'class', 'thermal', 'thermal_zone*'))):
+            try:
+                with open(os.path.join(zone, 'type'), 'r') as f:
+                    zones[os.path.join(zone, 'temp')] = f.read().strip()
+            except OSError:
+                continue
+        selected = [path for path, name in zones.items() if name in names]
+        return selected or list(zones)
+
+    @property
+    def temperature(self) -> float:
+        '''hottest selected zone in degrees celsius, None without thermal zones'''
+        self.poll()
+        return self.__temperature
+
+    @property
+    def cpu_load(self) -> float:
+        self.poll()
+        return self.__cpu_load
+
+    @property
+    def gpu_load(self) -> float:
+        self.poll()
+        return self.__gpu_load
+
+    @property
+    def pressure(self) -> float:
+        self.poll()
+        return self.__pressure
+
+    @property
+    def slowdown(self) -> float:
+        '''factor the interval between inferences is stretched by, from 1 to max_slowdown'''
+        return 1 + min(self.pressure, 1.0) * (self.__max_slowdown - 1)
+
+    def _read_temperature(self) -> float:
+        temperatures = []
+        for path in self.__zones:
+            try:
+                with open(path, 'r') as f:
+                    # millidegrees
+                    temperatures.append(int(f.read().strip()) / 1000)
+            except (OSError, ValueError):
+                continue
+        return max(temperatures) if temperatures else None
+
+    def _read_cpu_load(self) -> float:
+        '''share of non-idle CPU time since the previous poll'''
+        try:
+            with open(self._path('proc', 'stat'), 'r') as f:
+                times = [int(value) for value in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return 0.0
+        # idle and iowait
+        idle, total = times[3] + (times[4] if len(times) > 4 else 0), sum(times)
+        previous, self.__cpu_times = self.__cpu_times, (idle, total)
+        if previous is None or total <= previous[1]:
+            return self.__cpu_load
+        return 1 - (idle - previous[0]) / (total - previous[1])
+
+    def _read_gpu_load(self) -> float:
+        try:
+            with open(self._path('sys', 'devices', 'gpu.0', 'load'), 'r') as f:
+                # per mille
+                return int(f.read().strip()) / 1000
+        except (OSError, ValueError):
+            return 0.0
+
+    def poll(self, force: bool=False) -> None:
+        '''reads the sensors again when poll_interval has passed since the last read'''
+        now = self.__clock()
+        if not force and self.__polled_at is not None and now - self.__polled_at < self.__poll_interval:
+            return
+        elapsed = now - self.__polled_at if self.__polled_at is not None else None
+        self.__polled_at = now
+
+        temperature = self._read_temperature()
+        if temperature is not None and self.__temperature is not None and elapsed:
+            # smoothed degrees per second
+            self.__slope += 0.3 * ((temperature - self.__temperature) / elapsed - self.__slope)
+        self.__temperature = temperature
+        self.__cpu_load = self._read_cpu_load()
+        self.__gpu_load = self._read_gpu_load()
+
+        thermal = 0.0
+        if temperature is not None:
+            # only a rising temperature is extrapolated, a cooling device is judged on its current temperature
+            predicted = temperature + max(self.__slope, 0.0) * self.__lookahead
+            thermal = (predicted - self.__soft) / (self.__hard - self.__soft)
+        # the GPU is meant to be busy with inference, only a saturated CPU starves the loop
+        load = (self.__cpu_load - self.__load_limit) / (1 - self.__load_limit)
+        self.__pressure = max(0.0, thermal, load)
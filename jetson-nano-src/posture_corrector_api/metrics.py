@@ -0,0 +1,257 @@
+from .tracing import tracer
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from collections import deque
+import threading
+import bisect
+import time
+import os
+
+
+# latency buckets in seconds, from a fast TensorRT inference to a blocking request to the app
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in zip(names, values)) + '}'
+
+
+class _Metric:
+    '''
+    * Values are stored per tuple of label values, in the order of labelnames.
+    * A value can also be read from a callable when the metric is rendered, for values owned by
+      something else (another process, the kernel).
+    '''
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, function, **labels) -> None:
+        '''
+        reads the value from a callable every time the metric is rendered
+
+        :param function: callable returning a number
+        '''
+        self._functions[self._key(labels)] = function
+
+    def samples(self) -> list:
+        '''(suffix, label names, label values, value) of every sample'''
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            values[key] = function()
+        return [('', self.labelnames, key, value) for key, value in sorted(values.items())]
+
+    def render(self) -> str:
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} {}'.format(self.name, self.kind)]
+        for suffix, names, values, value in self.samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, _format_labels(names, values), float(value)))
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float=1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    '''cumulative buckets, sum and count per tuple of label values'''
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple=(), buckets: tuple=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # one count per bucket plus +Inf, then the sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def samples(self) -> list:
+        samples = []
+        names = self.labelnames + ('le',)
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), state[:-1]):
+                cumulative += count
+                samples.append(('_bucket', names, key + (bound,), cumulative))
+            samples.append(('_sum', self.labelnames, key, state[-1]))
+            samples.append(('_count', self.labelnames, key, cumulative))
+        return samples
+
+
+class RateMeter:
+    '''events per second over the last window events, ticking is O(1)'''
+    def __init__(self, window: int=64, clock=time.monotonic):
+        self.__ticks = deque(maxlen=window)
+        self.__clock = clock
+
+    def tick(self) -> None:
+        self.__ticks.append(self.__clock())
+
+    def rate(self) -> float:
+        if len(self.__ticks) < 2:
+            return 0.0
+        # stale once nothing has ticked for a while
+        elapsed = max(self.__ticks[-1], self.__clock() - 1) - self.__ticks[0]
+        return (len(self.__ticks) - 1) / elapsed if elapsed > 0 else 0.0
+
+
+class Registry:
+    def __init__(self):
+        self.__metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.__metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        '''every metric in the Prometheus text exposition format'''
+        return '\n'.join(metric.render() for metric in self.__metrics) + '\n'
+
+
+def _rss_bytes() -> int:
+    '''resident set size of this process'''
+    with open('/proc/self/statm', 'r') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _cpu_seconds() -> float:
+    '''user and system CPU time of this process'''
+    times = os.times()
+    return times.user + times.system
+
+
+# metrics of this process
+registry = Registry()
+capture_fps = registry.register(Gauge('posture_capture_fps', 'Frames read from the camera per second.'))
+inference_fps = registry.register(Gauge('posture_inference_fps', 'Frames run through MoveNet and the posture rules per second.'))
+frames_captured = registry.register(Counter('posture_frames_captured_total', 'Frames read from the camera.'))
+frames_inferred = registry.register(Counter('posture_frames_inferred_total', 'Frames run through MoveNet and the posture rules.'))
+frames_dropped = registry.register(Counter('posture_frames_dropped_total', 'Frames read but never analysed.', ('reason',)))
+stage_latency = registry.register(Histogram('posture_stage_latency_seconds', 'Latency of each stage of the monitoring loop.', ('stage',)))
+buffer_resets = registry.register(Counter('posture_buffer_resets_total', 'Posture buffers emptied because the user was moving.', ('buffer',)))
+alerts = registry.register(Counter('posture_alerts_total', 'Alerts sent to the app.', ('type',)))
+outbox_photos = registry.register(Gauge('posture_outbox_photos', 'Photos of incorrect postures waiting to be uploaded.'))
+outbox_postures = registry.register(Gauge('posture_outbox_postures', 'Incorrect postures waiting to be sent with the video.'))
+device_temperature = registry.register(Gauge('posture_device_temperature_celsius', 'Hottest CPU/GPU thermal zone.'))
+cpu_load = registry.register(Gauge('posture_cpu_load_ratio', 'Share of non-idle CPU time.'))
+gpu_load = registry.register(Gauge('posture_gpu_load_ratio', 'GPU load.'))
+governor_pressure = registry.register(Gauge('posture_governor_pressure', 'Thermal/load pressure of the governor, 1 at the throttling point.'))
+process_rss = registry.register(Gauge('process_resident_memory_bytes', 'Resident memory size in bytes.'))
+process_cpu = registry.register(Counter('process_cpu_seconds_total', 'Total user and system CPU time spent in seconds.'))
+process_rss.set_function(_rss_bytes)
+process_cpu.set_function(_cpu_seconds)
+
+capture_meter = RateMeter()
+inference_meter = RateMeter()
+capture_fps.set_function(capture_meter.rate)
+inference_fps.set_function(inference_meter.rate)
+
+
+def frame_captured() -> None:
+    frames_captured.inc()
+    capture_meter.tick()
+
+
+def frame_inferred() -> None:
+    frames_inferred.inc()
+    inference_meter.tick()
+
+
+def watch_session(app) -> None:
+    '''
+    exposes what a DjangoAppSession still has to send to the app
+
+    :param app: DjangoAppSession of the corrector
+    '''
+    outbox_photos.set_function(lambda: len(app.photos()))
+    outbox_postures.set_function(lambda: len(app.incorrect_postures))
+
+
+def watch_governor(governor) -> None:
+    '''
+    exposes the readings of a ThermalGovernor
+
+    :param governor: governor pacing the inferences
+    '''
+    device_temperature.set_function(lambda: governor.temperature or 0.0)
+    cpu_load.set_function(lambda: governor.cpu_load)
+    gpu_load.set_function(lambda: governor.gpu_load)
+    governor_pressure.set_function(lambda: governor.pressure)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer only exists from python 3.7
+    daemon_threads = True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # scrapes would flood the monitoring output
+        pass
+
+
+def start_metrics_server(host: str='0.0.0.0', port: int=9100) -> HTTPServer:
+    '''
+    serves the metrics on http://host:port/metrics from a daemon thread, stage latencies
+    are taken from the tracing spans
+
+    :param host: interface to listen on
+    :param port: port to listen on
+    '''
+    tracer.add_listener(lambda name, duration: stage_latency.observe(duration, stage=name))
+    server = _ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+def configure_metrics(config: dict) -> HTTPServer:
+    '''
+    starts the metrics server with the metrics section of config.yaml
+
+    :param config: enabled, host and port
+    '''
+    config = config or {}
+    if not config.get('enabled', False):
+        return None
+    return start_metrics_server(str(config.get('host', '0.0.0.0')), int(config.get('port', 9100)))
@@ -2,8 +2,12 @@ import tensorrt as trt
 import pycuda.driver as cuda
 import pycuda.autoinit
 import numpy as np 
+import sys
 
-onnx_path = 'movenet_v2.onnx'
+# optional batch size for multi-stream inference: python onnx2trt.py 2
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+# optional model for the other variants of the scheduler: python onnx2trt.py 1 movenet_lightning.onnx
+onnx_path = sys.argv[2] if len(sys.argv) > 2 else 'movenet_v2.onnx'
 
 # set up TensorRT
 TRT_LOGGER = trt.Logger(trt.Logger.WARNING)
@@ -21,10 +25,19 @@ with open(onnx_path, 'rb') as model:
     config.set_flag(trt.BuilderFlag.OBEY_PRECISION_CONSTRAINTS)
     # allocating max memory workspace
     config.max_workspace_size = 1 << 30
+    if batch_size > 1:
+        # the batch dimension of the input is made dynamic and optimised for the number of streams
+        input_tensor = network.get_input(0)
+        input_tensor.shape = (-1,) + tuple(input_tensor.shape[1:])
+        profile = builder.create_optimization_profile()
+        single, batch = (1,) + tuple(input_tensor.shape[1:]), (batch_size,) + tuple(input_tensor.shape[1:])
+        profile.set_shape(input_tensor.name, single, batch, batch)
+        config.add_optimization_profile(profile)
     # build and serialize engine
     serialized_engine = builder.build_serialized_network(network, config)
 
-trt_path = 'movenet_v3.trt'
+name = 'movenet_v3' if len(sys.argv) <= 2 else onnx_path.rsplit('.', 1)[0]
+trt_path = name + '.trt' if batch_size == 1 else '{}_b{}.trt'.format(name, batch_size)
 
 with open(trt_path, 'wb') as f:
     f.write(serialized_engine)
@@ -1,13 +1,14 @@
 from abc import ABC, abstractmethod
 import numpy as np
-import tensorflow as tf
-import onnxruntime as ort
-import tensorrt as trt
-import pycuda.driver as cuda
-import pycuda.autoinit
 import os
 import sys
 
+try:
+    from .tracing import traced
+except ImportError:
+    # imported as a top-level module by the tests
+    from tracing import traced
+
 # setting up module search path for testing purposes
 # Get the path to the directory containing the tests.py script
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -22,6 +23,75 @@ trt_path = os.path.join(current_dir, "models", "movenet_v3.trt")
 onnx_path = os.path.join(current_dir, "models", "movenet_v2.onnx")
 tflite_path = os.path.join(current_dir, "models", "movenet_v1.tflite")
 
+# inference backends are imported by the first model that needs them, processes that
+# never run inference (capture, rendering) don't load TensorFlow Lite or create a CUDA context
+tflite = None
+ort = None
+trt = None
+cuda = None
+
+# ONNX Runtime settings used when config.yaml doesn't set them
+DEFAULT_ONNX_OPTIONS = {
+    'providers': ['TensorrtExecutionProvider', 'CUDAExecutionProvider', 'CPUExecutionProvider'],
+    'intra_op_threads': 0,
+    'inter_op_threads': 0,
+    'execution_mode': 'sequential',
+    'graph_optimization_level': 'all',
+    'enable_cpu_mem_arena': True,
+    'enable_mem_pattern': True,
+    'cache_optimized_model': True,
+}
+onnx_tuned_path = os.path.join(current_dir, "models", "onnx_tuned.yaml")
+
+# TFLite interpreter settings used when config.yaml doesn't set them
+DEFAULT_TFLITE_OPTIONS = {
+    'threads': 0,
+    'xnnpack': True,
+}
+
+
+def load_onnx_options(config_path: str=os.path.join(parent_dir, "config.yaml"), tuned_path: str=onnx_tuned_path) -> dict:
+    '''
+    onnx settings of config.yaml on top of the defaults, with the results of tune_onnx.py on top of
+    both unless config.yaml sets use_tuned to false
+    '''
+    import yaml
+    options = dict(DEFAULT_ONNX_OPTIONS)
+    configured = {}
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as config_file:
+            configured = (yaml.safe_load(config_file) or {}).get('onnx') or {}
+    options.update(configured)
+    if configured.get('use_tuned', True) and os.path.exists(tuned_path):
+        with open(tuned_path, 'r') as tuned_file:
+            options.update(yaml.safe_load(tuned_file) or {})
+    options.pop('use_tuned', None)
+    return options
+
+
+def load_tflite_options(config_path: str=os.path.join(parent_dir, "config.yaml")) -> dict:
+    '''tflite settings of config.yaml on top of the defaults'''
+    import yaml
+    options = dict(DEFAULT_TFLITE_OPTIONS)
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as config_file:
+            options.update((yaml.safe_load(config_file) or {}).get('tflite') or {})
+    return options
+
+
+def _import_tflite() -> tuple:
+    '''
+    the standalone tflite_runtime interpreter when installed, TensorFlow's otherwise
+
+    :returns: Interpreter class and OpResolverType enum, None on versions without op resolver types
+    '''
+    try:
+        from tflite_runtime import interpreter
+        return interpreter.Interpreter, getattr(interpreter, 'OpResolverType', None)
+    except ImportError:
+        import tensorflow as tf
+        return tf.lite.Interpreter, getattr(tf.lite.experimental, 'OpResolverType', None)
+
 
 class MoveNet(ABC):
     keypoints_with_scores = None
@@ -45,21 +115,68 @@ class MoveNet(ABC):
         'right_ankle': None
     }
     
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every implementation of detect is timed as a tracing span
+        if 'detect' in cls.__dict__:
+            cls.detect = traced(cls.__name__ + '.detect')(cls.detect)
+
     @abstractmethod
     def detect(self, input_image: np.ndarray) -> None:
         pass 
 
+    def update_keypoints(self, keypoints_with_scores: np.ndarray) -> None:
+        '''
+        stores a prediction and updates the coordinates of each body part,
+        also used when the keypoints were predicted by another process
+
+        :param keypoints_with_scores: 17 (y, x, score) rows, with or without batch dimensions
+        '''
+        self.keypoints_with_scores = keypoints_with_scores
+        keypoints = keypoints_with_scores.reshape(-1, 3)
+        # updatting dictionary coordinates with (x, y) float32 arrays
+        for idx, part in enumerate(self.parts_coordinates):
+            self.parts_coordinates[part] = keypoints[idx, [1, 0]]
+
 # 'posture_corrector_api/models/movenet_v1.tflite'
 class ModelTflite(MoveNet):
-    def __init__(self):
+    '''
+    * Runs on the standalone tflite_runtime interpreter when it's installed, TensorFlow is only
+      imported as a fallback.
+    * Thread count and the XNNPACK delegate are set with the tflite settings of config.yaml,
+      threads: 0 uses every core.
+    * Frames are written straight into the interpreter's input tensor and the keypoints are read
+      from its output tensor, no intermediate arrays are created per frame.
+    '''
+    def __init__(self, options: dict=None, model_path: str=tflite_path):
+        global tflite
+        if tflite is None:
+            tflite = _import_tflite()
+        Interpreter, OpResolverType = tflite
+        options = load_tflite_options() if options is None else dict(DEFAULT_TFLITE_OPTIONS, **options)
+        self.options = options
+        threads = int(options['threads']) or os.cpu_count()
+        kwargs = {'model_path': model_path, 'num_threads': threads}
+        if OpResolverType is not None:
+            # XNNPACK is the default delegate of the builtin op resolver
+            kwargs['experimental_op_resolver_type'] = (
+                OpResolverType.AUTO if options['xnnpack'] 
+                else OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+            )
         # load the TFLITE model
-        self.interpreter = tf.lite.Interpreter(
-            model_path=tflite_path
-        ) 
+        self.interpreter = Interpreter(**kwargs) 
         self.interpreter.allocate_tensors()
         # Setup input and output 
         self.input_details = self.interpreter.get_input_details()
         self.output_details = self.interpreter.get_output_details()
+        # accessors returning numpy views on the interpreter's own buffers, views are only taken
+        # around invoke since the interpreter may move its buffers
+        self._input = self.interpreter.tensor(self.input_details[0]['index'])
+        self._output = self.interpreter.tensor(self.output_details[0]['index'])
+
+    @property
+    def input_size(self) -> int:
+        return int(self.input_details[0]['shape'][1])
 
     def detect(self, input_image: np.ndarray) -> None:
         '''
@@ -68,39 +185,81 @@ class ModelTflite(MoveNet):
         :param input_image: image converted array
         '''
 
-        # Make predictions 
-        self.interpreter.set_tensor(self.input_details[0]['index'], np.array(input_image))
+        # Make predictions, the frame is cast to the input type while it's copied in place
+        self._input()[...] = np.reshape(input_image, self.input_details[0]['shape'])
         self.interpreter.invoke()
-        self.keypoints_with_scores = self.interpreter.get_tensor(self.output_details[0]['index'])
+        # (1, 1, 17, 3)
+        self.update_keypoints(self._output().copy())
 
-        # updating coordinates
-        # getting key points position after each prediction
-        kpts_x = self.keypoints_with_scores[0, 0, :, 1]
-        kpts_y = self.keypoints_with_scores[0, 0, :, 0]
 
-        # zipping x and y coordinates
-        coordinates = list(zip(kpts_x, kpts_y))
+class ModelOnnx(MoveNet):
+    '''
+    * ONNX Runtime session tuned with the onnx settings of config.yaml, overridden by the
+      results of tune_onnx.py (models/onnx_tuned.yaml) when they exist.
+    * The optimised graph is saved next to the model the first time, later startups load it
+      and skip the graph optimisations.
+    * Inputs and outputs are bound once to preallocated arrays, detect copies the frame in place
+      and the keypoints are written straight into the output array.
+    '''
+    def __init__(self, options: dict=None, model_path: str=onnx_path):
+        global ort
+        import onnxruntime as ort
+        options = load_onnx_options() if options is None else dict(DEFAULT_ONNX_OPTIONS, **options)
+        self.options = options
+        providers = [provider for provider in options['providers'] if provider in ort.get_available_providers()]
 
-        # updatting dictionary coordinates
-        for idx, part in enumerate(self.parts_coordinates):
-            self.parts_coordinates[part] = np.array(list(coordinates[idx]))
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = int(options['intra_op_threads'])
+        session_options.inter_op_num_threads = int(options['inter_op_threads'])
+        session_options.execution_mode = {
+            'sequential': ort.ExecutionMode.ORT_SEQUENTIAL, 
+            'parallel': ort.ExecutionMode.ORT_PARALLEL
+        }[options['execution_mode']]
+        session_options.enable_cpu_mem_arena = bool(options['enable_cpu_mem_arena'])
+        session_options.enable_mem_pattern = bool(options['enable_mem_pattern'])
+        optimization_level = {
+            'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[options['graph_optimization_level']]
 
+        source_path = model_path
+        # graphs compiled by TensorRT can't be serialised, only CPU/CUDA graphs are cached
+        cache = bool(options['cache_optimized_model']) and 'TensorrtExecutionProvider' not in providers
+        cached_path = "{}.{}.{}.opt.onnx".format(
+            os.path.splitext(source_path)[0], ort.__version__, options['graph_optimization_level']
+        )
+        if cache and os.path.exists(cached_path) and os.path.getmtime(cached_path) >= os.path.getmtime(source_path):
+            # already optimised on this machine
+            model_path = cached_path
+            session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        else:
+            session_options.graph_optimization_level = optimization_level
+            if cache:
+                session_options.optimized_model_filepath = cached_path
 
-class ModelOnnx(MoveNet):
-    def __init__(self):
         # Load the ONNX model
-        self.sess = ort.InferenceSession(
-            onnx_path, 
-            providers=[
-                'TensorrtExecutionProvider', 
-                'CUDAExecutionProvider', 
-                'CPUExecutionProvider'
-            ]
-        )
+        self.sess = ort.InferenceSession(model_path, sess_options=session_options, providers=providers)
         # Get the input and output tensor names
         self.input_name = self.sess.get_inputs()[0].name
         self.output_name = self.sess.get_outputs()[0].name
 
+        # binding preallocated buffers once, dynamic dimensions are taken as a single 256x256 image
+        input_shape = [dim if isinstance(dim, int) else default for dim, default in zip(self.sess.get_inputs()[0].shape, (1, 256, 256, 3))]
+        output_shape = [dim if isinstance(dim, int) else default for dim, default in zip(self.sess.get_outputs()[0].shape, (1, 1, 17, 3))]
+        self._input = np.zeros(input_shape, dtype=np.float32)
+        self._output = np.zeros(output_shape, dtype=np.float32)
+        self._binding = self.sess.io_binding()
+        self._binding.bind_cpu_input(self.input_name, self._input)
+        self._binding.bind_output(
+            self.output_name, 'cpu', 0, np.float32, self._output.shape, self._output.ctypes.data
+        )
+
+    @property
+    def input_size(self) -> int:
+        return self._input.shape[1]
+
     def detect(self, input_image: np.ndarray) -> None:
         '''
         making predictions on the 17 body key points and updating coordinates
@@ -108,52 +267,83 @@ class ModelOnnx(MoveNet):
         :param input_image: image converted array
         '''
 
-        # Make predictions 
-        output_data = self.sess.run([self.output_name], {self.input_name: input_image})[0]
-        self.keypoints_with_scores = output_data
+        # Make predictions, the output array is filled in place
+        np.copyto(self._input, np.reshape(input_image, self._input.shape))
+        self.sess.run_with_iobinding(self._binding)
         # (1, 1, 17, 3)
-        # updating coordinates
-        # getting key points position after each prediction
-        kpts_x = self.keypoints_with_scores[0, 0, :, 1]
-        kpts_y = self.keypoints_with_scores[0, 0, :, 0]
-
-        # zipping x and y coordinates
-        coordinates = list(zip(kpts_x, kpts_y))
-
-        # updatting dictionary coordinates
-        for idx, part in enumerate(self.parts_coordinates):
-            self.parts_coordinates[part] = np.array(list(coordinates[idx]))
+        self.update_keypoints(self._output.copy())
 
         
 class ModelTrt(MoveNet):
-    def __init__(self):
+    '''
+    TensorRT engine running MoveNet on the Jetson Nano GPU. With batch_size > 1 the frames of several
+    streams are run in a single inference, which needs an engine built with that batch size
+    (models/onnx2trt.py <batch size>).
+    '''
+    def __init__(self, batch_size: int=1, engine_path: str=trt_path):
+        global trt, cuda
+        import tensorrt as trt
+        import pycuda.driver as cuda
+        # creates the CUDA context of this process
+        import pycuda.autoinit
         # Load the TensorRT model engine
         # Load the serialized engine from file
-        with open(trt_path, 'rb') as f:
+        with open(engine_path, 'rb') as f:
             engine_data = f.read()
         self._runtime = trt.Runtime(trt.Logger(trt.Logger.WARNING))
         self._engine = self._runtime.deserialize_cuda_engine(engine_data)
         # Create a context for inference
         self._context = self._engine.create_execution_context()
         # Allocate device memory for input and output buffers
-        self._input_shape = (1, 256, 256, 3)
-        self._output_shape = (1, 17, 3)
+        self._batch_size = batch_size
+        # the input resolution is the one the engine was built for (256 for Thunder, 192 for Lightning)
+        height, width = self._engine.get_binding_shape(0)[1:3]
+        self._input_shape = (batch_size, height, width, 3)
+        self._output_shape = (batch_size, 17, 3)
+        # engines built with a dynamic batch dimension are told the batch size once
+        if self._engine.get_binding_shape(0)[0] == -1:
+            self._context.set_binding_shape(0, self._input_shape)
+        # host buffer the frames of a batch are gathered in, missing frames are left as zeros
+        self._host_input = np.zeros(self._input_shape, dtype=np.float32)
         self._input_buf = cuda.mem_alloc(int(np.prod(self._input_shape) * np.dtype(np.float32).itemsize))
         self._output_buf = cuda.mem_alloc(int(np.prod(self._output_shape) * np.dtype(np.float32).itemsize))
         # Create a CUDA stream to run inference asynchronously
         self._stream = cuda.Stream()
 
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    @property
+    def input_size(self) -> int:
+        return self._input_shape[1]
+
     def detect(self, input_image: np.ndarray) -> None:
         '''
         making predictions on the 17 body key points and updating coordinates
         
         :param input_image: image converted array
         '''
+        self.update_keypoints(self.detect_batch(input_image))
+
+    def detect_batch(self, input_images: np.ndarray) -> np.ndarray:
+        '''
+        making predictions on up to batch_size images in a single inference
+        
+        :param input_images: (n, 256, 256, 3) float32 images, n <= batch_size
+        :returns: (batch_size, 17, 3) keypoints, one row per image in the same order
+        '''
+        if len(input_images) == self._batch_size and input_images.dtype == np.float32 and input_images.flags['C_CONTIGUOUS']:
+            host_input = input_images
+        else:
+            self._host_input[:len(input_images)] = input_images
+            self._host_input[len(input_images):] = 0
+            host_input = self._host_input
 
         # Copy the input data to the device
         cuda.memcpy_htod_async(
             self._input_buf, 
-            input_image, 
+            host_input, 
             self._stream
         )
         # Run inference
@@ -165,21 +355,12 @@ class ModelTrt(MoveNet):
             stream_handle=self._stream.handle
         )
         # Copy the output data back to the host
-        self.keypoints_with_scores = np.empty(self._output_shape, dtype=np.float32)
+        keypoints_with_scores = np.empty(self._output_shape, dtype=np.float32)
         cuda.memcpy_dtoh_async(
-            self.keypoints_with_scores, 
+            keypoints_with_scores, 
             self._output_buf, 
             self._stream
         )
         # Wait for the CUDA stream to finish
         self._stream.synchronize()
-        # updating coordinates
-        # getting key points position after each prediction
-        kpts_x = self.keypoints_with_scores[0, :, 1]
-        kpts_y = self.keypoints_with_scores[0, :, 0]
-        # zipping x and y coordinates
-        coordinates = list(zip(kpts_x, kpts_y))
-
-        # updatting dictionary coordinates
-        for idx, part in enumerate(self.parts_coordinates):
-            self.parts_coordinates[part] = np.array(list(coordinates[idx]))
+        return keypoints_with_scores
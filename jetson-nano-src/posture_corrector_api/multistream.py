@@ -0,0 +1,100 @@
+from .movenet_models import ModelTrt, trt_path
+from .corrector import PostureCorrectorTrt
+from .sources import open_source
+from .utils import draw_connections, draw_keypoints
+import numpy as np
+import os
+import cv2
+
+
+class MultiStreamMonitor:
+    '''
+    * Monitors several cameras (e.g. lateral and frontal, or two desks) with a single TensorRT engine.
+    * The frames of all streams are stacked and run through one batched inference per iteration.
+    * Each stream keeps its own posture buffers, photos folder and app session through its own PostureCorrectorTrt.
+    '''
+    def __init__(self, streams: list, host: str, port: str, email: str, password: str, fps: int=19, duration: int=10, 
+                 engine_path: str=None):
+        batch_size = len(streams)
+        if engine_path is None:
+            engine_path = trt_path if batch_size == 1 else os.path.join(
+                os.path.dirname(trt_path), "movenet_v3_b{}.trt".format(batch_size)
+            )
+        self.__model = ModelTrt(batch_size=batch_size, engine_path=engine_path)
+        size = self.__model.input_size
+        self.__batch = np.zeros((batch_size, size, size, 3), dtype=np.float32)
+        self.__sources = []
+        self.__correctors = []
+        for idx, stream in enumerate(streams):
+            # next to incorrect_postures/ rather than inside it, monitor.py expects that folder to hold photos only
+            photos_folder = 'incorrect_postures_stream_{}/'.format(idx)
+            os.makedirs(photos_folder, exist_ok=True)
+            self.__sources.append(open_source(stream.get('camera')))
+            self.__correctors.append(PostureCorrectorTrt(
+                host=host, 
+                port=port, 
+                email=email, 
+                password=password, 
+                camera_position=int(stream.get('camera_position', 1)), 
+                fps=fps, 
+                duration=duration, 
+                load_model=False, 
+                photos_folder=photos_folder
+            ))
+
+    @property
+    def correctors(self) -> list:
+        return self.__correctors
+
+    @property
+    def sources(self) -> list:
+        return self.__sources
+
+    def step(self) -> list:
+        '''
+        reads a frame from every stream, runs one batched inference and applies each stream's posture rules
+
+        :returns: the frames read, None for the streams that didn't deliver one
+        '''
+        frames = []
+        for idx, source in enumerate(self.__sources):
+            ret, frame = source.read() if source.isOpened() else (False, None)
+            frames.append(frame if ret else None)
+            if ret:
+                self.__batch[idx] = cv2.resize(frame, (self.__model.input_size, self.__model.input_size))
+        if all(frame is None for frame in frames):
+            return frames
+
+        keypoints = self.__model.detect_batch(self.__batch)
+        for idx, (frame, corrector) in enumerate(zip(frames, self.__correctors)):
+            if frame is None:
+                continue
+            corrector.update_keypoints(keypoints[idx:idx + 1])
+            corrector.frame = frame
+            corrector.monitor_posture()
+        return frames
+
+    def run(self, show: bool=True) -> None:
+        '''monitors every stream until q is pressed or all the sources are closed'''
+        try:
+            while any(source.isOpened() for source in self.__sources):
+                frames = self.step()
+                if all(frame is None for frame in frames):
+                    break
+                if not show:
+                    continue
+                for idx, (frame, corrector) in enumerate(zip(frames, self.__correctors)):
+                    if frame is None:
+                        continue
+                    draw_connections(frame, corrector.keypoints_with_scores, 0.4)
+                    draw_keypoints(frame, corrector.keypoints_with_scores, 0.4)
+                    cv2.putText(frame, f"back posture: {corrector.back_posture}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+                    cv2.putText(frame, f"neck posture: {corrector.neck_posture}", (50, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+                    cv2.imshow('monitor {}'.format(idx), frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            for source in self.__sources:
+                source.release()
+            if show:
+                cv2.destroyAllWindows()
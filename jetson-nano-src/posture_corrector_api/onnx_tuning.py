@@ -0,0 +1,68 @@
+from .movenet_models import ModelOnnx, load_onnx_options, onnx_tuned_path
+import numpy as np
+import itertools
+import yaml
+import time
+import os
+
+
+# settings searched by autotune, everything else comes from config.yaml
+TUNED_KEYS = ('intra_op_threads', 'inter_op_threads', 'execution_mode', 'graph_optimization_level', 'enable_cpu_mem_arena')
+
+
+def benchmark(options: dict, runs: int=50, warmup: int=5) -> float:
+    '''median seconds per inference of a ModelOnnx built with the given options'''
+    model = ModelOnnx(options=options)
+    image = np.random.uniform(0, 255, (1, model.input_size, model.input_size, 3)).astype(np.float32)
+    for _ in range(warmup):
+        model.detect(image)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.detect(image)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def candidates(base: dict) -> list:
+    '''combinations of thread counts, execution modes and memory settings worth trying on this machine'''
+    cores = os.cpu_count() or 1
+    threads = sorted({1, 2, cores // 2, cores} - {0})
+    combinations = []
+    for intra, mode, level, arena in itertools.product(threads, ('sequential', 'parallel'), ('extended', 'all'), (True, False)):
+        # inter-op threads only matter when independent nodes run in parallel
+        for inter in ((1,) if mode == 'sequential' else (1, 2)):
+            combinations.append(dict(
+                base, 
+                intra_op_threads=intra, 
+                inter_op_threads=inter, 
+                execution_mode=mode, 
+                graph_optimization_level=level, 
+                enable_cpu_mem_arena=arena
+            ))
+    return combinations
+
+
+def autotune(runs: int=50, output_path: str=onnx_tuned_path, verbose: bool=True) -> dict:
+    '''
+    benchmarks every candidate setting with the providers of config.yaml and saves the fastest
+    ones to models/onnx_tuned.yaml, which ModelOnnx loads on top of config.yaml
+
+    :param runs: timed inferences per candidate
+    :returns: the fastest settings
+    '''
+    base = load_onnx_options()
+    results = []
+    for options in candidates(base):
+        latency = benchmark(options, runs=runs)
+        results.append((latency, options))
+        if verbose:
+            print('{:7.2f} ms  {}'.format(latency * 1000, {key: options[key] for key in TUNED_KEYS}))
+
+    latency, best = min(results, key=lambda result: result[0])
+    tuned = {key: best[key] for key in TUNED_KEYS}
+    with open(output_path, 'w') as f:
+        yaml.safe_dump(tuned, f, default_flow_style=False)
+    if verbose:
+        print('\nFastest settings ({:.2f} ms per frame) saved to {}'.format(latency * 1000, output_path))
+    return tuned
@@ -0,0 +1,206 @@
+from .movenet_models import ModelTrt, ModelOnnx, ModelTflite
+from .sources import open_source
+from .utils import draw_connections, draw_keypoints
+from . import metrics
+import multiprocessing as mp
+import numpy as np
+import queue
+import cv2
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # python < 3.8 (JetPack 4 ships 3.6): fall back on a shared ctypes array
+    shared_memory = None
+
+
+BACKENDS = {'trt': ModelTrt, 'onnx': ModelOnnx, 'tflite': ModelTflite}
+# number of keypoints and values per keypoint predicted by MoveNet
+KEYPOINTS_SHAPE = (17, 3)
+
+
+class SharedFrameRing:
+    '''
+    * Fixed number of frame and keypoints slots living in shared memory, mapped by every process as numpy views.
+    * Frames are written once by the capture process and then read in place by the others, only slot indices
+      travel through the queues of the control channel.
+    * Uses multiprocessing.shared_memory when available and a shared ctypes array on older pythons.
+    '''
+    def __init__(self, slots: int, frame_shape: tuple):
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        self.__frames_size = slots * int(np.prod(self.frame_shape))
+        self.__size = self.__frames_size + slots * int(np.prod(KEYPOINTS_SHAPE)) * 4
+        self.__owner = True
+        if shared_memory is not None:
+            self.__shm = shared_memory.SharedMemory(create=True, size=self.__size)
+            self.__array = None
+        else:
+            self.__shm = None
+            self.__array = mp.RawArray('B', self.__size)
+        self._map()
+
+    def _map(self) -> None:
+        buffer = self.__shm.buf if self.__shm is not None else self.__array
+        self.frames = np.ndarray((self.slots,) + self.frame_shape, dtype=np.uint8, buffer=buffer)
+        self.keypoints = np.ndarray(
+            (self.slots,) + KEYPOINTS_SHAPE, dtype=np.float32, buffer=buffer, offset=self.__frames_size
+        )
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        del state['frames'], state['keypoints']
+        if self.__shm is not None:
+            # child processes attach to the block by name
+            state['_SharedFrameRing__shm'] = self.__shm.name
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.__owner = False
+        if isinstance(self.__shm, str):
+            self.__shm = shared_memory.SharedMemory(name=self.__shm)
+        self._map()
+
+    def close(self) -> None:
+        '''unmaps the ring, the creating process also frees the memory'''
+        self.frames = self.keypoints = None
+        if self.__shm is not None:
+            self.__shm.close()
+            if self.__owner:
+                self.__shm.unlink()
+
+
+def _capture_worker(ring: SharedFrameRing, camera_config: dict, free_slots, ready_slots, stop, captured, dropped) -> None:
+    '''
+    reads frames straight into free slots and hands them to the inference process,
+    frames read and dropped are counted in shared values read by the metrics of the main process
+    '''
+    cap = open_source(camera_config)
+    try:
+        while cap.isOpened() and not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            captured.value += 1
+            try:
+                slot = free_slots.get(timeout=0.5)
+            except queue.Empty:
+                # every slot is busy downstream, this frame is dropped rather than queued
+                dropped.value += 1
+                continue
+            if frame.shape != ring.frame_shape:
+                frame = cv2.resize(frame, (ring.frame_shape[1], ring.frame_shape[0]))
+            ring.frames[slot] = frame
+            ready_slots.put((slot, cap.timestamp))
+    finally:
+        cap.release()
+        ready_slots.put(None)
+        ring.close()
+
+
+def _inference_worker(ring: SharedFrameRing, backend: str, ready_slots, done_slots) -> None:
+    '''runs MoveNet on the frames of the ring and writes the keypoints next to them'''
+    try:
+        # loaded inside the try so a missing model or a CUDA error still signs off to the main process
+        model = BACKENDS[backend]()
+        input_size = model.input_size
+        while True:
+            item = ready_slots.get()
+            if item is None:
+                break
+            slot, timestamp = item
+            img = cv2.resize(ring.frames[slot], (input_size, input_size))
+            img = np.expand_dims(img.astype(np.float32), axis=0)
+            model.detect(img)
+            ring.keypoints[slot] = np.reshape(model.keypoints_with_scores, KEYPOINTS_SHAPE)
+            done_slots.put((slot, timestamp))
+    finally:
+        done_slots.put(None)
+        ring.close()
+
+
+def _process_slot(corrector, ring: SharedFrameRing, slot: int, show: bool) -> None:
+    '''applies the posture rules to one slot and renders it, the frame is used in place'''
+    frame = ring.frames[slot]
+    corrector.update_keypoints(ring.keypoints[slot].copy())
+    # the frame is set before the rules run so an alert photographs the current frame
+    corrector.frame = frame
+    corrector.monitor_posture()
+    if show:
+        draw_connections(frame, corrector.keypoints_with_scores, 0.4)
+        draw_keypoints(frame, corrector.keypoints_with_scores, 0.4)
+        cv2.putText(frame, f"back posture: {corrector.back_posture}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+        cv2.putText(frame, f"neck posture: {corrector.neck_posture}", (50, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+        cv2.imshow('monitor', frame)
+    # live skeleton on the monitoring page when the channel is open
+    corrector.app.send_keypoints(corrector.keypoints_with_scores)
+    # the slot is about to be reused by the capture process
+    corrector.frame = None
+
+
+def run_pipeline(corrector, camera_config: dict, backend: str='trt', slots: int=4, show: bool=True) -> None:
+    '''
+    * Runs capture and inference in their own processes while this process applies the posture rules,
+      draws the overlay and talks to the app, so each stage gets its own core and interpreter.
+    * Processes are spawned rather than forked so that only the inference process creates a CUDA context.
+    * Frames are inferred as fast as the inference process goes: ModelScheduler and ThermalGovernor pacing
+      only apply to the single-process loop of monitor.py. Keypoints are still forwarded on the app channel.
+    * Stops when a worker dies without signing off instead of waiting for it forever.
+
+    :param corrector: PostureCorrectorTrt created with load_model=False
+    :param camera_config: camera section of config.yaml
+    :param backend: trt, onnx or tflite
+    :param slots: number of frames in flight between the stages
+    '''
+    camera_config = dict(camera_config or {})
+    frame_shape = (int(camera_config.get('height', 480)), int(camera_config.get('width', 640)), 3)
+    context = mp.get_context('spawn')
+    ring = SharedFrameRing(slots, frame_shape)
+    free_slots, ready_slots, done_slots = context.Queue(), context.Queue(), context.Queue()
+    stop = context.Event()
+    # only written by the capture process
+    captured, dropped = context.Value('L', 0, lock=False), context.Value('L', 0, lock=False)
+    metrics.frames_captured.set_function(lambda: captured.value)
+    metrics.frames_dropped.set_function(lambda: dropped.value, reason='no_free_slot')
+    for slot in range(slots):
+        free_slots.put(slot)
+
+    workers = [
+        context.Process(target=_capture_worker, args=(ring, camera_config, free_slots, ready_slots, stop, captured, dropped), daemon=True),
+        context.Process(target=_inference_worker, args=(ring, backend, ready_slots, done_slots), daemon=True),
+    ]
+    capture, inference = workers
+    for worker in workers:
+        worker.start()
+
+    capture_ended = False
+    try:
+        while True:
+            try:
+                item = done_slots.get(timeout=1)
+            except queue.Empty:
+                if not inference.is_alive():
+                    break
+                if not capture.is_alive() and not capture_ended:
+                    # a capture process that crashed never sent its end marker, the inference process gets it here
+                    ready_slots.put(None)
+                    capture_ended = True
+                continue
+            if item is None:
+                break
+            slot, _ = item
+            _process_slot(corrector, ring, slot, show)
+            free_slots.put(slot)
+            metrics.frame_inferred()
+            if show and cv2.waitKey(1) & 0xFF == ord('q'):
+                stop.set()
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        if show:
+            cv2.destroyAllWindows()
+        ring.close()
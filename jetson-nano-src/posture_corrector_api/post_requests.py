@@ -1,12 +1,16 @@
+from .timeline import PostureTimeline, PostureDwell
+from .tracing import traced
+from .channel import DeviceChannel
 import numpy as np 
 import requests 
+import base64
 import json
 import time
 import os 
 
 
 class DjangoAppSession:
-    def __init__(self, host: str, port: str, email: str, password: str):
+    def __init__(self, host: str, port: str, email: str, password: str, photos_folder: str='incorrect_postures/'):
         self.__port = port
         self.__host = host 
         self.__email = email
@@ -14,6 +18,18 @@ class DjangoAppSession:
         self.__incorrect_postures = []
         self.__start_time = int(time.time())
         self.__total_alerts = 0
+        # each monitored stream keeps its photos in its own folder
+        self.__photos_folder = photos_folder
+        # run-length encoded postures of every frame, sent with the video data
+        self.__neck_timeline = PostureTimeline()
+        self.__back_timeline = PostureTimeline()
+        # encoded timelines, closed by end_session when the monitoring loop stops
+        self.__timelines = None
+        self.__posture_seconds = None
+        # seconds spent in each posture, from which the app computes the exact posture score
+        self.__dwell = PostureDwell()
+        # persistent websocket to the app, opened by open_channel
+        self.__channel = None
 
     # Getters
     @property
@@ -23,6 +39,26 @@ class DjangoAppSession:
     @property
     def total_alerts(self) -> int:
         return self.__total_alerts
+
+    @property
+    def photos_folder(self) -> str:
+        return self.__photos_folder
+
+    @property
+    def neck_timeline(self) -> PostureTimeline:
+        return self.__neck_timeline
+
+    @property
+    def back_timeline(self) -> PostureTimeline:
+        return self.__back_timeline
+
+    @property
+    def dwell(self) -> PostureDwell:
+        return self.__dwell
+
+    @property
+    def channel(self) -> DeviceChannel:
+        return self.__channel
     
     # Setters
     @incorrect_postures.setter
@@ -33,46 +69,104 @@ class DjangoAppSession:
     def total_alerts(self, value: int) -> None:
         self.__total_alerts += value
  
-    def notify_user(self, alert_type: str) -> None:
-        '''sending a notification to the user to straighten up through a post request'''
+    def open_channel(self, heartbeat_interval: float=10, keypoints_fps: float=10) -> DeviceChannel:
+        '''
+        opens the persistent websocket used for alerts and live keypoints, connected in the background
 
+        :param heartbeat_interval: seconds between two heartbeats
+        :param keypoints_fps: keypoints sent per second to the monitoring page, 0 sends none
+        '''
+        if self.__channel is None:
+            self.__channel = DeviceChannel(self.__host, self.__port, self.__email, self.__password, heartbeat_interval=heartbeat_interval, keypoints_fps=keypoints_fps)
+            self.__channel.start()
+        return self.__channel
+
+    def close_channel(self) -> None:
+        if self.__channel is not None:
+            self.__channel.close()
+            self.__channel = None
+
+    def send_keypoints(self, keypoints_with_scores: np.ndarray) -> bool:
+        '''forwards the keypoints of a frame to the monitoring page while the channel is connected'''
+        if self.__channel is None:
+            return False
+        return self.__channel.send_keypoints(keypoints_with_scores)
+
+    @traced('app.notify_user')
+    def notify_user(self, alert_type: str, level: int=0) -> None:
+        '''
+        sending a notification to the user to straighten up, through the channel when it's connected
+        and through a post request otherwise
+
+        :param alert_type: back, neck or both as "back,neck"
+        :param level: escalation level, raised when the same posture keeps coming back
+        '''
+
+        if self.__channel is not None and self.__channel.send_alert(alert_type, level):
+            return
+        
         # django app url
         url = 'http://' + self.__host + ':'+ self.__port + '/main/my-endpoint/'
         data = {
             'email':self.__email,
             'password':self.__password,
             'alert':alert_type, 
+            'level':level,
             }
         response = requests.post(url, data=data)
         print(response.json()['status'])
 
+    def photos(self) -> list:
+        '''paths of the photos waiting in the photos folder, subfolders and hidden files such as .gitkeep are left out'''
+        folder_path = self.__photos_folder
+        if not os.path.isdir(folder_path):
+            return []
+        return [
+            os.path.join(folder_path, filename) for filename in sorted(os.listdir(folder_path)) 
+            if not filename.startswith('.') and os.path.isfile(os.path.join(folder_path, filename))
+        ]
+
+    @traced('app.upload_photos')
     def upload_photos(self) -> str:
         '''uploads photos of incorrect postures detected during the monitoring video'''
         
-        folder_path = 'incorrect_postures/'
-        if len(os.listdir(folder_path)) == 0: return "No incorrect postures"
+        photos = self.photos()
+        if len(photos) == 0: return "No incorrect postures"
 
         responses = []
         url = 'http://' + self.__host + ':'+ self.__port + '/main/user-incorrect-postures/'
         data = {
             'email': self.__email,
-            'password': self.__password
+            'password': self.__password,
+            # lets the app merge near-identical photos taken during this video
+            'start_time': self.__start_time
         } 
 
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            if os.path.isfile(file_path):
-                with open(file_path, 'rb') as f:
-                    files = {'image': f}
-                    response = requests.post(url, data=data, files=files)
-                    responses.append(response.text)
+        for file_path in photos:
+            with open(file_path, 'rb') as f:
+                files = {'image': f}
+                response = requests.post(url, data=data, files=files)
+                responses.append(response.text)
         responses = np.unique(np.array(responses))
 
         if len(responses) == 1: return responses[0]            
 
+    def end_session(self) -> None:
+        '''
+        closes the timelines and the dwell counters when the monitoring loop stops, at the same time as
+        end_time is taken, so the photo uploads that follow aren't counted as time spent in the last posture
+        '''
+        if self.__timelines is None:
+            self.__timelines = (self.__neck_timeline.close(), self.__back_timeline.close())
+            self.__posture_seconds = self.__dwell.close()
+
+    @traced('app.update_database')
     def update_database(self, end_time: int) -> str:
         '''sends a user's posture data to the django app so that it could be stored in the database'''
 
+        # sessions not ended by the caller are ended now
+        self.end_session()
+        neck_timeline, back_timeline = self.__timelines
         url = 'http://' + self.__host + ':'+ self.__port + '/main/video-data/'
         if len(self.__incorrect_postures) == 0:
             self.__incorrect_postures.append('No Incorrect Postures')
@@ -83,18 +177,17 @@ class DjangoAppSession:
             'end_time': end_time, 
             'total_alerts': self.__total_alerts,
             'incorrect_postures':json.dumps(self.__incorrect_postures),
+            # binary timelines are base64 encoded to travel as form fields
+            'neck_timeline': base64.b64encode(neck_timeline).decode(),
+            'back_timeline': base64.b64encode(back_timeline).decode(),
+            'posture_seconds': json.dumps(self.__posture_seconds),
+            'poor_posture_seconds': round(self.__dwell.poor_posture_seconds, 3),
             }
         response = requests.post(url, data=data)
         return response.json()['status']
 
-    @staticmethod
-    def clean_folder() -> None:
+    def clean_folder(self) -> None:
         '''deletes all images captured and sent as they are stored in the app's db'''
 
-        folder_path = 'incorrect_postures/'
-        # get all image files names in folder
-        files = os.listdir(folder_path)
-
-        for file in files:
-            file_path = os.path.join(folder_path, file)
+        for file_path in self.photos():
             os.remove(file_path)
\ No newline at end of file
@@ -0,0 +1,198 @@
+from .movenet_models import ModelOnnx, ModelTflite, onnx_path, tflite_path
+from .analysis import OfflineCorrector
+from .timeline import PostureTimeline
+import numpy as np
+import struct
+import json
+import time
+import os
+import cv2
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# keypoints the FP32 model is less confident about are left out of the error
+KEYPOINT_CONFIDENCE = 0.3
+
+
+def load_frames(paths: list, max_frames: int=300, input_size: int=256) -> np.ndarray:
+    '''
+    our own recorded frames, preprocessed like monitor.py, from image folders, image files or videos
+
+    :param paths: folders, images or video files
+    :param max_frames: frames kept, spread evenly over videos
+    '''
+    frames = []
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path))
+        else:
+            files.append(path)
+    for path in files:
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append(frame)
+            continue
+        cap = cv2.VideoCapture(path)
+        num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, num_frames // max_frames)
+        for index in range(0, num_frames, step):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        cap.release()
+    if len(frames) > max_frames:
+        frames = [frames[int(i)] for i in np.linspace(0, len(frames) - 1, max_frames)]
+    return np.stack([cv2.resize(frame, (input_size, input_size)).astype(np.float32) for frame in frames])
+
+
+class FramesReader:
+    '''onnxruntime CalibrationDataReader feeding our frames one at a time'''
+    def __init__(self, input_name: str, frames: np.ndarray):
+        self.__inputs = iter([{input_name: frame[np.newaxis]} for frame in frames])
+
+    def get_next(self) -> dict:
+        return next(self.__inputs, None)
+
+
+def quantise_onnx(frames: np.ndarray, output_dir: str) -> dict:
+    '''dynamically and statically quantised INT8 variants of movenet_v2.onnx, the latter calibrated on our frames'''
+    from onnxruntime.quantization import quantize_dynamic, quantize_static, QuantType, QuantFormat
+    import onnxruntime as ort
+
+    variants = {}
+    dynamic_path = os.path.join(output_dir, 'movenet_v2.int8_dynamic.onnx')
+    quantize_dynamic(onnx_path, dynamic_path, weight_type=QuantType.QUInt8)
+    variants['onnx int8 dynamic'] = dynamic_path
+
+    input_name = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    static_path = os.path.join(output_dir, 'movenet_v2.int8_static.onnx')
+    quantize_static(
+        onnx_path, 
+        static_path, 
+        FramesReader(input_name, frames), 
+        quant_format=QuantFormat.QDQ, 
+        activation_type=QuantType.QUInt8, 
+        weight_type=QuantType.QInt8
+    )
+    variants['onnx int8 static'] = static_path
+    return variants
+
+
+def quantise_tflite(saved_model: str, frames: np.ndarray, output_dir: str) -> dict:
+    '''
+    dynamic range and full integer TFLite variants. A .tflite file can't be requantised,
+    so these are converted from the SavedModel movenet_v1.tflite was exported from.
+    Inputs and outputs stay float32 so ModelTflite runs them unchanged.
+    '''
+    import tensorflow as tf
+
+    variants = {}
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    dynamic_path = os.path.join(output_dir, 'movenet_v1.int8_dynamic.tflite')
+    with open(dynamic_path, 'wb') as f:
+        f.write(converter.convert())
+    variants['tflite int8 dynamic'] = dynamic_path
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: ([frame[np.newaxis]] for frame in frames)
+    static_path = os.path.join(output_dir, 'movenet_v1.int8_static.tflite')
+    with open(static_path, 'wb') as f:
+        f.write(converter.convert())
+    variants['tflite int8 static'] = static_path
+    return variants
+
+
+def _predict(model, frames: np.ndarray) -> tuple:
+    '''keypoints of every frame and the median latency of the model'''
+    keypoints = []
+    timings = []
+    for frame in frames:
+        start = time.perf_counter()
+        model.detect(frame[np.newaxis])
+        timings.append(time.perf_counter() - start)
+        keypoints.append(np.reshape(model.keypoints_with_scores, (17, 3)).copy())
+    return np.stack(keypoints), float(np.median(timings))
+
+
+def _postures(keypoints: np.ndarray, camera_position: int) -> np.ndarray:
+    '''neck and back posture codes the posture rules give to every frame'''
+    corrector = OfflineCorrector(camera_position=camera_position, fps=1)
+    # one frame per second of the clock, runs map straight back to frame indices
+    position = [0]
+    for timeline in (corrector.app.neck_timeline, corrector.app.back_timeline):
+        timeline.set_clock(lambda: position[0])
+    for index, frame_keypoints in enumerate(keypoints):
+        position[0] = index
+        corrector.update_keypoints(frame_keypoints)
+        corrector.monitor_posture()
+    codes = np.zeros((2, len(keypoints)), dtype=np.uint8)
+    for row, timeline in enumerate((corrector.app.neck_timeline, corrector.app.back_timeline)):
+        for code, start, duration in struct.iter_unpack(PostureTimeline.RUN_FORMAT, timeline.close(len(keypoints) * 1000)):
+            codes[row, start // 1000:(start + duration) // 1000] = code
+    return codes
+
+
+def compare(reference: tuple, candidate: tuple, camera_position: int) -> dict:
+    '''keypoint error and posture agreement of a variant against the FP32 model'''
+    reference_keypoints, reference_latency = reference
+    keypoints, latency = candidate
+    confident = reference_keypoints[:, :, 2] > KEYPOINT_CONFIDENCE
+    # distance in normalised image coordinates between matching keypoints
+    errors = np.linalg.norm(keypoints[:, :, :2] - reference_keypoints[:, :, :2], axis=2)[confident]
+    agreement = (_postures(keypoints, camera_position) == _postures(reference_keypoints, camera_position)).mean(axis=1)
+    return {
+        'latency_ms': round(latency * 1000, 2),
+        'speedup': round(reference_latency / latency, 2) if latency else None,
+        'keypoint_error_mean': round(float(errors.mean()), 4) if errors.size else None,
+        'keypoint_error_p95': round(float(np.percentile(errors, 95)), 4) if errors.size else None,
+        'neck_agreement': round(float(agreement[0]), 4),
+        'back_agreement': round(float(agreement[1]), 4),
+    }
+
+
+def build_report(frames: np.ndarray, variants: dict, camera_position: int=1) -> dict:
+    '''
+    runs the FP32 models and every quantised variant on the frames and compares them
+
+    :param variants: name -> model path, .onnx or .tflite
+    '''
+    cpu_only = {'providers': ['CPUExecutionProvider']}
+    references = {'onnx': _predict(ModelOnnx(options=cpu_only, model_path=onnx_path), frames)}
+    if any(path.endswith('.tflite') for path in variants.values()):
+        references['tflite'] = _predict(ModelTflite(model_path=tflite_path), frames)
+
+    report = {'onnx fp32': compare(references['onnx'], references['onnx'], camera_position)}
+    if 'tflite' in references:
+        report['tflite fp32'] = compare(references['tflite'], references['tflite'], camera_position)
+    for name, path in variants.items():
+        if path.endswith('.onnx'):
+            candidate = _predict(ModelOnnx(options=cpu_only, model_path=path), frames)
+            report[name] = compare(references['onnx'], candidate, camera_position)
+        else:
+            candidate = _predict(ModelTflite(model_path=path), frames)
+            report[name] = compare(references['tflite'], candidate, camera_position)
+    return report
+
+
+def format_report(report: dict) -> str:
+    '''markdown table of a report, in the style of the README performance table'''
+    lines = [
+        '| Model | Latency (ms) | Speedup | Keypoint Error (mean / p95) | Neck Agreement | Back Agreement |',
+        '| ----- | ------------ | ------- | --------------------------- | -------------- | -------------- |',
+    ]
+    for name, row in report.items():
+        lines.append('| {} | {} | {}x | {} / {} | {:.1%} | {:.1%} |'.format(
+            name, row['latency_ms'], row['speedup'], row['keypoint_error_mean'], row['keypoint_error_p95'], 
+            row['neck_agreement'], row['back_agreement']
+        ))
+    return '\n'.join(lines)
+
+
+def save_report(report: dict, path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,157 @@
+from .movenet_models import MoveNet, parent_dir
+from .pipeline import BACKENDS
+import numpy as np
+import time
+import os
+import cv2
+
+
+# constructor argument taking the model file of each backend
+PATH_ARGUMENTS = {'trt': 'engine_path', 'onnx': 'model_path', 'tflite': 'model_path'}
+# weight of the latest frame in the latency average
+LATENCY_SMOOTHING = 0.1
+
+
+def load_variant(variant: dict) -> MoveNet:
+    '''
+    loads one MoveNet variant of the scheduler section of config.yaml
+
+    :param variant: backend (trt, onnx or tflite) and an optional path relative to jetson-nano-src
+    '''
+    kwargs = {}
+    if variant.get('path'):
+        kwargs[PATH_ARGUMENTS[variant['backend']]] = os.path.join(parent_dir, variant['path'])
+    return BACKENDS[variant['backend']](**kwargs)
+
+
+class ModelScheduler(MoveNet):
+    '''
+    * Holds several MoveNet variants ordered from the most accurate to the fastest (e.g. Thunder 256, Lightning 192
+      and their quantised forms) and runs the one that fits the frame budget of the target fps.
+    * The latency of every detection is averaged, the scheduler moves to a faster variant once the average stays above
+      high_watermark of the budget for patience frames, and back to a more accurate one once it stays below low_watermark.
+    * A variant the scheduler had to leave is only retried after a backoff that doubles every time, so a throttled
+      device doesn't flap between two variants.
+    * Variants are loaded the first time they're scheduled and kept loaded.
+    * pace() spreads detections over time at the target fps: frames arriving early are skipped and a late frame
+      stands for every sample it missed, so the posture buffers always cover the same window of time.
+    * With a ThermalGovernor, detections are spaced out by its slowdown as the device heats up, and a pressure
+      of 1 counts as being over budget so a faster variant is scheduled before the Nano throttles itself.
+    '''
+    def __init__(self, variants: list, target_fps: float=19, high_watermark: float=0.9, low_watermark: float=0.6, patience: int=30, max_backoff: int=3600, governor=None, clock=time.monotonic):
+        if not variants:
+            raise ValueError('the scheduler needs at least one model variant')
+        self.__variants = variants
+        self.__models = [None] * len(variants)
+        self.__latencies = [None] * len(variants)
+        self.__backoffs = [patience] * len(variants)
+        self.__retry_at = [0] * len(variants)
+        self.__target_fps = target_fps
+        self.__budget = 1 / target_fps
+        self.__high = high_watermark * self.__budget
+        self.__low = low_watermark * self.__budget
+        self.__patience = patience
+        self.__max_backoff = max_backoff
+        self.__governor = governor
+        self.__clock = clock
+        self.__frames = 0
+        self.__next_sample = None
+        self.__last_detection = None
+        self.__switches = []
+        self._switch(0)
+
+    @property
+    def current(self) -> str:
+        variant = self.__variants[self.__index]
+        return variant.get('name', variant['backend'])
+
+    @property
+    def input_size(self) -> int:
+        return self.__model.input_size
+
+    @property
+    def latency(self) -> float:
+        '''average latency of the current variant in seconds'''
+        return self.__latencies[self.__index]
+
+    @property
+    def switches(self) -> list:
+        '''(frame, variant name) of every switch'''
+        return self.__switches
+
+    def _switch(self, index: int) -> None:
+        if self.__models[index] is None:
+            self.__models[index] = load_variant(self.__variants[index])
+        self.__index = index
+        self.__model = self.__models[index]
+        self.__over = 0
+        self.__under = 0
+        self.__since_switch = 0
+        self.__switches.append((self.__frames, self.current))
+
+    def pace(self) -> int:
+        '''
+        number of posture samples the current frame stands for at the target fps,
+        0 when it arrives before the next sample is due
+        '''
+        now = self.__clock()
+        if self.__next_sample is None:
+            self.__next_sample = now
+        if now < self.__next_sample:
+            return 0
+        if self.__governor is not None and self.__last_detection is not None:
+            # a hot device runs fewer detections, each standing for more samples
+            if now - self.__last_detection < self.__budget * self.__governor.slowdown:
+                return 0
+        self.__last_detection = now
+        samples = 1 + int((now - self.__next_sample) * self.__target_fps)
+        if samples > self.__target_fps:
+            # after a stall of more than a second the window restarts rather than repeating one frame
+            self.__next_sample = now + self.__budget
+            return 1
+        self.__next_sample += samples * self.__budget
+        return samples
+
+    def detect(self, input_image: np.ndarray) -> None:
+        '''
+        making predictions on the 17 body key points with the current variant and updating coordinates
+        
+        :param input_image: image converted array, resized when its size isn't the one of the current variant
+        '''
+        size = self.__model.input_size
+        if input_image.shape[1] != size or input_image.shape[2] != size:
+            input_image = np.expand_dims(cv2.resize(input_image[0], (size, size)), axis=0)
+        start = self.__clock()
+        self.__model.detect(input_image)
+        self._record(self.__clock() - start)
+        self.update_keypoints(self.__model.keypoints_with_scores)
+
+    def _record(self, latency: float) -> None:
+        '''updates the latency average of the current variant and switches variant when needed'''
+        self.__frames += 1
+        self.__since_switch += 1
+        average = self.__latencies[self.__index]
+        average = latency if average is None else average + LATENCY_SMOOTHING * (latency - average)
+        self.__latencies[self.__index] = average
+
+        pressure = self.__governor.pressure if self.__governor is not None else 0.0
+        if average > self.__high or pressure >= 1:
+            self.__over += 1
+            self.__under = 0
+        elif average < self.__low and pressure == 0:
+            self.__under += 1
+            self.__over = 0
+        else:
+            self.__over = 0
+            self.__under = 0
+        # every variant runs at least patience frames before being judged
+        if self.__since_switch < self.__patience:
+            return
+
+        if self.__over >= self.__patience and self.__index < len(self.__variants) - 1:
+            # the slower variant waits longer before every new attempt
+            self.__retry_at[self.__index] = self.__frames + self.__backoffs[self.__index]
+            self.__backoffs[self.__index] = min(self.__backoffs[self.__index] * 2, self.__max_backoff)
+            self._switch(self.__index + 1)
+        elif self.__under >= self.__patience and self.__index > 0 and self.__frames >= self.__retry_at[self.__index - 1]:
+            self._switch(self.__index - 1)
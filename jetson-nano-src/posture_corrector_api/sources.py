@@ -0,0 +1,164 @@
+from abc import ABC, abstractmethod
+import numpy as np
+import time
+import cv2
+
+
+class FrameSource(ABC):
+    '''
+    * Common interface of everything frames can be read from, mirroring cv2.VideoCapture (isOpened, read, release).
+    * Every read records the monotonic timestamp of the frame and how long the capture took,
+      so the pipeline can be benchmarked the same way whatever the input.
+    '''
+    def __init__(self):
+        self.timestamp = None
+        self.latency = 0.0
+        self.frames_read = 0
+
+    @abstractmethod
+    def _grab(self) -> tuple:
+        pass
+
+    @abstractmethod
+    def isOpened(self) -> bool:
+        pass
+
+    def release(self) -> None:
+        pass
+
+    def read(self) -> tuple:
+        '''returns (ret, frame) like cv2.VideoCapture.read and updates timestamp and latency'''
+        start = time.monotonic()
+        ret, frame = self._grab()
+        self.timestamp = time.monotonic()
+        self.latency = self.timestamp - start
+        if ret:
+            self.frames_read += 1
+        return ret, frame
+
+
+class _CaptureSource(FrameSource):
+    '''frame source backed by a cv2.VideoCapture'''
+    def __init__(self, capture: cv2.VideoCapture):
+        super(_CaptureSource, self).__init__()
+        self._capture = capture
+
+    def _grab(self) -> tuple:
+        return self._capture.read()
+
+    def isOpened(self) -> bool:
+        return self._capture.isOpened()
+
+    def release(self) -> None:
+        self._capture.release()
+
+
+class CsiCamera(_CaptureSource):
+    '''
+    Raspberry Pi camera module on the Jetson Nano CSI port through GStreamer.
+    The appsink only keeps the newest frame (drop, max-buffers=1) and doesn't sync on the clock,
+    so a slow frame loop always reads the current posture instead of a queue of stale frames.
+    '''
+    def __init__(self, width: int=640, height: int=480, fps: int=21, flip_method: int=2, sensor_id: int=0):
+        pipeline = (
+            f"nvarguscamerasrc sensor-id={sensor_id} ! video/x-raw(memory:NVMM),width=3280,height=2464,format=NV12,framerate={fps}/1 "
+            f"! nvvidconv flip-method={flip_method} ! video/x-raw, width=(int){width}, height=(int){height}, format=(string)BGRx "
+            f"! videoconvert ! video/x-raw, format=(string)BGR "
+            f"! appsink drop=true max-buffers=1 sync=false"
+        )
+        super(CsiCamera, self).__init__(cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER))
+
+
+class V4l2Camera(_CaptureSource):
+    '''USB webcam through V4L2, with the driver queue reduced to a single buffer'''
+    def __init__(self, device: int=0, width: int=640, height: int=480, fps: int=30):
+        capture = cv2.VideoCapture(device, cv2.CAP_V4L2)
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        capture.set(cv2.CAP_PROP_FPS, fps)
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        super(V4l2Camera, self).__init__(capture)
+
+
+class VideoFile(_CaptureSource):
+    '''
+    recorded video, read as fast as possible or paced at its own frame rate
+
+    :param realtime: sleeps between frames to replay the video at its recorded speed
+    '''
+    def __init__(self, path: str, realtime: bool=False):
+        super(VideoFile, self).__init__(cv2.VideoCapture(path))
+        fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self.__interval = 1 / fps if realtime and fps > 0 else 0
+        self.__next = None
+
+    def _grab(self) -> tuple:
+        if self.__interval:
+            now = time.monotonic()
+            if self.__next is not None and now < self.__next:
+                time.sleep(self.__next - now)
+            self.__next = max(now, self.__next or now) + self.__interval
+        return self._capture.read()
+
+
+class SyntheticSource(FrameSource):
+    '''
+    generated frames, lets the whole pipeline run on any Linux box without a camera
+
+    :param fps: frame rate frames are paced at, 0 produces them as fast as they are read
+    :param num_frames: frames produced before the source closes, 0 never closes
+    '''
+    def __init__(self, width: int=640, height: int=480, fps: int=21, num_frames: int=0):
+        super(SyntheticSource, self).__init__()
+        self.__interval = 1 / fps if fps > 0 else 0
+        self.__num_frames = num_frames
+        self.__next = None
+        self.__opened = True
+        # a gradient scrolled a little on every frame, cheap to produce and never twice the same frame
+        self.__gradient = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+
+    def _grab(self) -> tuple:
+        if self.__num_frames and self.frames_read >= self.__num_frames:
+            self.__opened = False
+            return False, None
+        if self.__interval:
+            now = time.monotonic()
+            if self.__next is not None and now < self.__next:
+                time.sleep(self.__next - now)
+            self.__next = max(now, self.__next or now) + self.__interval
+        channel = np.roll(self.__gradient, self.frames_read * 4, axis=1)
+        return True, np.dstack((channel, channel[::-1], np.flip(channel, axis=1)))
+
+    def isOpened(self) -> bool:
+        return self.__opened
+
+    def release(self) -> None:
+        self.__opened = False
+
+
+def open_source(config: dict) -> FrameSource:
+    '''
+    creates the frame source described by the camera section of config.yaml
+
+    :param config: camera settings, source being one of csi, v4l2, file or synthetic
+    '''
+    config = config or {}
+    source = config.get('source', 'csi')
+    width = int(config.get('width', 640))
+    height = int(config.get('height', 480))
+    fps = int(config.get('fps', 21))
+    if source == 'csi':
+        return CsiCamera(
+            width=width, 
+            height=height, 
+            fps=fps, 
+            flip_method=int(config.get('flip_method', 2)), 
+            sensor_id=int(config.get('sensor_id', 0))
+        )
+    if source == 'v4l2':
+        return V4l2Camera(device=int(config.get('device', 0)), width=width, height=height, fps=fps)
+    if source == 'file':
+        return VideoFile(config['path'], realtime=bool(config.get('realtime', False)))
+    if source == 'synthetic':
+        return SyntheticSource(width=width, height=height, fps=fps, num_frames=int(config.get('num_frames', 0)))
+    raise ValueError(f'Unknown camera source: {source}')
@@ -1,6 +1,5 @@
-from test_imports import cpp_functions, Buffers 
+from test_imports import cpp_functions, Buffers, AlertScheduler
 import numpy as np
-import time 
 
 
 class GenericCorrector:
@@ -17,6 +16,8 @@ class GenericCorrector:
         self.__CAMERA_POSITION = camera_position
         self.__neck_buffer = Buffers.PyNeckCircularBuffer(self.__num_frames)
         self.__back_buffer = Buffers.PyBackCircularBuffer(self.__num_frames)
+        # 5 seconds between alerts of the same type, without pausing capture and inference
+        self.__alerts = AlertScheduler(cooldowns={'neck': 5, 'back': 5}, min_cooldown=5)
 
     @property
     def neck_posture(self) -> str:
@@ -44,15 +45,9 @@ class GenericCorrector:
             self._lateral_neck_corrector(parts_coordinates)
             self._lateral_back_corrector(parts_coordinates)
             if self.__back_buffer.maxIncorrectReached():
-                print("notify user here and now!")
-                print(self.__back_buffer.getIncorrectPosture())
-                print('back-alert')
-                time.sleep(5)
+                self.__alerts.raise_alert('back', self.__back_buffer.getIncorrectPosture())
             if self.__neck_buffer.maxIncorrectReached():
-                print("notify user here and now!")
-                print(self.__neck_buffer.getIncorrectPosture())
-                print('neck-alert')
-                time.sleep(5)
+                self.__alerts.raise_alert('neck', self.__neck_buffer.getIncorrectPosture())
 
         elif self.__CAMERA_POSITION == 2 : 
             
@@ -60,13 +55,14 @@ class GenericCorrector:
             self._frontal_back_corrector(parts_coordinates)
             # checking if 10 seconds were spent in a poor posture
             if self.__back_buffer.maxIncorrectReached():
-                print("notify user here and now!")
-                print(self.__back_buffer.getIncorrectPosture)
-                time.sleep(5)
+                self.__alerts.raise_alert('back', self.__back_buffer.getIncorrectPosture())
             if self.__neck_buffer.maxIncorrectReached():
-                print("notify user here and now!")
-                print(self.__neck_buffer.getIncorrectPosture())
-                time.sleep(5)
+                self.__alerts.raise_alert('neck', self.__neck_buffer.getIncorrectPosture())
+
+        for alert in self.__alerts.poll():
+            print("notify user here and now!")
+            print(alert.postures)
+            print('-'.join(alert.types) + '-alert')
             
     def _frontal_neck_corrector(self, parts_coordinates: dict) -> None:
         '''checks correct neck posture returns 0 for incorrect and 1 for correct posture'''
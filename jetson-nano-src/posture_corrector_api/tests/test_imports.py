@@ -12,7 +12,9 @@ sys.path.append(parent_dir)
 
 # imports
 from movenet_models import ModelTrt, ModelOnnx, ModelTflite
-from utils import draw_connections, draw_keypoints
+from utils import draw_connections, draw_keypoints, resize_with_pad
 from exceptions import CameraException
+from sources import open_source
 from optimised_computations import cpp_functions 
-from optimised_buffers import Buffers 
+from optimised_buffers import Buffers
+from alerts import AlertScheduler 
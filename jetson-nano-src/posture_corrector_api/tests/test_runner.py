@@ -1,23 +1,24 @@
 from test_imports import(
     CameraException,
+    open_source,
     draw_connections, 
-    draw_keypoints
+    draw_keypoints,
+    resize_with_pad
 )
 from test_correctors import (
     TestCorrectorTrt, 
     TestCorrectorOnnx, 
     TestCorrectorTflite,
 )
-import tensorflow as tf
 import numpy as np
 import cv2
 
 
 def processing_tflite(frame: np.ndarray) -> np.ndarray: 
     # Reshape image
-    img = frame.copy()
-    img = tf.image.resize_with_pad(np.expand_dims(img, axis=0), 256,256)
-    input_image = tf.cast(img, dtype=tf.float32)
+    img = resize_with_pad(frame, 256)
+    # Add batch dimension to input image
+    input_image = np.expand_dims(img, axis=0)
     return input_image
 
 
@@ -39,6 +40,7 @@ def processing_trt(frame: np.ndarray) -> np.ndarray:
 
 
 option = "Please choose one of the following options:\n\t1 ---> TFLITE\n\t2 ---> ONNX\n\t3 ---> TRT\nYour choice: "
+option3 = "\nPlease choose a frame source:\n\t1 ---> CSI camera\n\t2 ---> USB webcam (V4L2)\n\t3 ---> Video file\n\t4 ---> Synthetic frames\nYour choice: "
 option2 = "\nPlease choose a camera angle:\n\t1 ---> Lateral right\n\t2 ---> Frontal\n\t3 ---> Lateral Left\nYour choice: "
 
 def main():
@@ -71,17 +73,24 @@ def main():
             duration=10
         )     
 
-    # Open the CS2 camera and start capturing frames
-    try:
-        cap = cv2.VideoCapture("nvarguscamerasrc ! video/x-raw(memory:NVMM),width=3280,height=2464,format=NV12,framerate=21/1 \
-                                ! nvvidconv flip-method=2 ! video/x-raw, width=(int)640, height=(int)480, format=(string)BGRx \
-                            ! videoconvert ! video/x-raw, format=(string)BGR ! appsink")
-    except:
+    # Open the selected frame source and start capturing frames
+    source_choice = int(input(option3))
+    if source_choice == 1:
+        cap = open_source({'source': 'csi'})
+    elif source_choice == 2:
+        cap = open_source({'source': 'v4l2', 'device': 0})
+    elif source_choice == 3:
+        cap = open_source({'source': 'file', 'path': input('Video path: ')})
+    else:
+        cap = open_source({'source': 'synthetic'})
+    if not cap.isOpened():
         raise CameraException('No camera module detected in your device. Please Make sure your camera is connected.')
     
     frames_count = 0
     while cap.isOpened():
         ret, frame = cap.read()
+        if not ret:
+            break
 
         if version_choice == 1:
             input_image = processing_tflite(frame)
@@ -0,0 +1,135 @@
+import struct
+import time
+
+
+class PostureTimeline:
+    '''
+    * Records the posture adopted on every frame as a run-length encoded stream of (code, start, duration).
+    * A run is only closed when the posture changes, so pushing a frame is O(1) and the stream stays tiny.
+    * Times are in milliseconds from the start of the monitoring video, measured with a monotonic clock.
+    * Each run is packed as 9 bytes: posture code (uint8), start (uint32) and duration (uint32), little-endian.
+    '''
+    RUN_FORMAT = '<BII'
+
+    def __init__(self, start: float=None, clock=time.monotonic):
+        self.__clock = clock
+        self.__start = clock() if start is None else start
+        self.__runs = bytearray()
+        self.__code = None
+        self.__run_start = 0
+
+    def _now(self) -> int:
+        return int((self.__clock() - self.__start) * 1000)
+
+    def set_clock(self, clock) -> None:
+        '''
+        replaces the clock, e.g. by the position in a recorded video, before any posture is pushed
+
+        :param clock: callable returning seconds
+        '''
+        self.__clock = clock
+        self.__start = clock()
+
+    def push(self, code: int, timestamp: int=None) -> None:
+        '''
+        stores the posture of the current frame
+        
+        :param code: posture code, b'f'[0], b'u'[0] or b'r'[0]
+        :param timestamp: milliseconds since the start, defaults to now
+        '''
+        if code == self.__code:
+            return
+        timestamp = self._now() if timestamp is None else timestamp
+        self._close_run(timestamp)
+        self.__code = code
+        self.__run_start = timestamp
+
+    def _close_run(self, timestamp: int) -> None:
+        if self.__code is not None and timestamp > self.__run_start:
+            self.__runs += struct.pack(self.RUN_FORMAT, self.__code, self.__run_start, timestamp - self.__run_start)
+
+    def close(self, timestamp: int=None) -> bytes:
+        '''ends the current run at the end of the video and returns the encoded stream'''
+        timestamp = self._now() if timestamp is None else timestamp
+        self._close_run(timestamp)
+        self.__code = None
+        return bytes(self.__runs)
+
+    @property
+    def runs(self) -> list:
+        return list(struct.iter_unpack(self.RUN_FORMAT, self.__runs))
+
+
+class PostureDwell:
+    '''
+    * Running number of seconds spent in each neck and back posture, and with the neck or the back incorrect.
+    * Every push charges the time since the previous push to the postures held until then: O(1), no allocation,
+      the counters are ready as soon as the video ends.
+    * Time lost to buffer resets and in between alerts is counted like any other frame.
+    '''
+    NECK_POSTURES = {b'f'[0]: 'forward-leaning neck', b'u'[0]: 'upright neck'}
+    BACK_POSTURES = {b'f'[0]: 'forward-leaning back', b'u'[0]: 'upright back', b'r'[0]: 'reclined back'}
+    INCORRECT_CODES = (b'f'[0], b'r'[0])
+
+    def __init__(self, clock=time.monotonic):
+        self.__clock = clock
+        self.__last = None
+        self.__neck = None
+        self.__back = None
+        self.__neck_seconds = dict.fromkeys(self.NECK_POSTURES, 0.0)
+        self.__back_seconds = dict.fromkeys(self.BACK_POSTURES, 0.0)
+        self.__poor_seconds = 0.0
+
+    def set_clock(self, clock) -> None:
+        '''
+        replaces the clock, e.g. by the position in a recorded video, before any posture is pushed
+
+        :param clock: callable returning seconds
+        '''
+        self.__clock = clock
+
+    def _advance(self) -> None:
+        now = self.__clock()
+        if self.__last is not None:
+            elapsed = now - self.__last
+            if self.__neck is not None:
+                self.__neck_seconds[self.__neck] += elapsed
+            if self.__back is not None:
+                self.__back_seconds[self.__back] += elapsed
+            if self.__neck in self.INCORRECT_CODES or self.__back in self.INCORRECT_CODES:
+                self.__poor_seconds += elapsed
+        self.__last = now
+
+    def push_neck(self, code: int) -> None:
+        '''
+        stores the neck posture of the current frame
+        
+        :param code: posture code, b'f'[0] or b'u'[0]
+        '''
+        self._advance()
+        self.__neck = code
+
+    def push_back(self, code: int) -> None:
+        '''
+        stores the back posture of the current frame
+        
+        :param code: posture code, b'f'[0], b'u'[0] or b'r'[0]
+        '''
+        self._advance()
+        self.__back = code
+
+    @property
+    def poor_posture_seconds(self) -> float:
+        '''seconds during which the neck or the back was incorrect, overlaps are only counted once'''
+        return self.__poor_seconds
+
+    def close(self) -> dict:
+        '''charges the time up to now to the current postures and returns the seconds spent in each posture'''
+        self._advance()
+        seconds = {}
+        for counters, names in ((self.__neck_seconds, self.NECK_POSTURES), (self.__back_seconds, self.BACK_POSTURES)):
+            for code, value in counters.items():
+                if value > 0:
+                    seconds[names[code]] = round(value, 3)
+        return seconds
+
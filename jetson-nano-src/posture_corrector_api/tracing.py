@@ -0,0 +1,201 @@
+import numpy as np
+import functools
+import threading
+import itertools
+import atexit
+import signal
+import json
+import time
+import os
+
+
+class _NullSpan:
+    '''span handed out while tracing is disabled, entering and leaving it does nothing'''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('_tracer', '_name', '_start')
+
+    def __init__(self, tracer, name: str):
+        self._tracer = tracer
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._tracer.record(self._name, self._start, time.perf_counter())
+
+
+class Tracer:
+    '''
+    * Records named timing spans of the monitoring loop into a ring buffer preallocated with numpy,
+      the oldest spans are overwritten once it's full.
+    * Span names are interned, a span is stored as 4 numbers: start, duration, name id and thread.
+    * dump writes the spans as Chrome trace JSON, opened by chrome://tracing and ui.perfetto.dev.
+    * Listeners (e.g. the metrics histograms) receive the name and duration of every span, even with
+      the ring disabled.
+    * While disabled and without listeners, span returns a shared no-op context manager and nothing is recorded.
+    '''
+    def __init__(self, capacity: int=65536):
+        self.enabled = False
+        # spans are measured when the ring is enabled or someone listens
+        self.active = False
+        self.__capacity = 0
+        self.__names = {}
+        self.__listeners = []
+        self.__allocate(capacity)
+
+    def __allocate(self, capacity: int) -> None:
+        self.__capacity = capacity
+        self.__starts = np.zeros(capacity, dtype=np.float64)
+        self.__durations = np.zeros(capacity, dtype=np.float64)
+        self.__name_ids = np.zeros(capacity, dtype=np.int32)
+        self.__threads = np.zeros(capacity, dtype=np.int64)
+        # next() on a count is atomic under the GIL, threads never get the same slot
+        self.__counter = itertools.count()
+        self.__recorded = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    def enable(self, capacity: int=None) -> None:
+        '''
+        starts recording, optionally with a ring of another size
+
+        :param capacity: number of spans kept
+        '''
+        if capacity is not None and capacity != self.__capacity:
+            self.__allocate(capacity)
+        self.enabled = True
+        self.active = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.active = bool(self.__listeners)
+
+    def add_listener(self, listener) -> None:
+        '''
+        calls listener(name, duration) with every span from now on
+
+        :param listener: callable taking the span name and its duration in seconds
+        '''
+        self.__listeners.append(listener)
+        self.active = True
+
+    def span(self, name: str):
+        '''
+        context manager timing the code it wraps
+
+        :param name: span name shown in the trace viewer
+        '''
+        if not self.active:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name: str, start: float, end: float) -> None:
+        '''stores a span measured with time.perf_counter'''
+        for listener in self.__listeners:
+            listener(name, end - start)
+        if not self.enabled:
+            return
+        name_id = self.__names.get(name)
+        if name_id is None:
+            name_id = self.__names.setdefault(name, len(self.__names))
+        index = next(self.__counter)
+        slot = index % self.__capacity
+        self.__starts[slot] = start
+        self.__durations[slot] = end - start
+        self.__name_ids[slot] = name_id
+        self.__threads[slot] = threading.get_ident()
+        self.__recorded = index + 1
+
+    def events(self) -> list:
+        '''recorded spans as Chrome trace complete events, oldest first'''
+        count = min(self.__recorded, self.__capacity)
+        first = self.__recorded - count
+        slots = [(first + i) % self.__capacity for i in range(count)]
+        names = {name_id: name for name, name_id in self.__names.items()}
+        # small thread ids are easier to read in the viewer
+        threads = {}
+        pid = os.getpid()
+        events = []
+        for slot in slots:
+            thread = threads.setdefault(int(self.__threads[slot]), len(threads))
+            events.append({
+                'name': names[int(self.__name_ids[slot])],
+                'ph': 'X',
+                'ts': round(self.__starts[slot] * 1e6, 3),
+                'dur': round(self.__durations[slot] * 1e6, 3),
+                'pid': pid,
+                'tid': thread,
+            })
+        return events
+
+    def dump(self, path: str) -> str:
+        '''
+        writes the recorded spans as Chrome trace / Perfetto JSON
+
+        :param path: output file, {pid} is replaced by the process id
+        :returns: path of the file written
+        '''
+        path = path.format(pid=os.getpid())
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}, f)
+        return path
+
+    def clear(self) -> None:
+        self.__allocate(self.__capacity)
+
+
+# tracer shared by the whole process
+tracer = Tracer()
+
+
+def traced(name: str):
+    '''
+    decorator timing every call of a function as a span
+
+    :param name: span name shown in the trace viewer
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.active:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(name, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+
+def configure_tracing(config: dict) -> None:
+    '''
+    enables tracing with the tracing section of config.yaml, the spans are dumped when the program exits
+    and whenever the process receives SIGUSR1 (kill -USR1 <pid>)
+
+    :param config: enabled, capacity and path
+    '''
+    config = config or {}
+    if not config.get('enabled', False):
+        return
+    path = config.get('path', 'trace_{pid}.json')
+    tracer.enable(int(config.get('capacity', tracer.capacity)))
+    atexit.register(tracer.dump, path)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: print('trace written to ' + tracer.dump(path)))
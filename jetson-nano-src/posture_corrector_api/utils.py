@@ -10,6 +10,24 @@ def load_config(file_path: str) -> None:
     return config
 
 
+def resize_with_pad(frame: np.ndarray, size: int) -> np.ndarray:
+    '''
+    resizes a frame to size x size keeping its aspect ratio, the borders are padded with zeros
+    (numpy equivalent of tf.image.resize_with_pad)
+
+    :param frame: video frame in the form of an array
+    :param size: width and height of the result
+    '''
+    height, width = frame.shape[:2]
+    scale = size / max(height, width)
+    resized_height, resized_width = int(round(height * scale)), int(round(width * scale))
+    resized = cv2.resize(frame, (resized_width, resized_height))
+    padded = np.zeros((size, size) + frame.shape[2:], dtype=np.float32)
+    top, left = (size - resized_height) // 2, (size - resized_width) // 2
+    padded[top:top + resized_height, left:left + resized_width] = resized
+    return padded
+
+
 def authenticate_user(host: str, port:str, email: str, password: str) -> str:
     '''
     checks if the user credential are correct before launching the program
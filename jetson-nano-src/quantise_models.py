@@ -0,0 +1,28 @@
+from posture_corrector_api.quantisation import load_frames, quantise_onnx, quantise_tflite, build_report, format_report, save_report
+import argparse
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds INT8 MoveNet variants for CPU-only devices and compares them to FP32.')
+    parser.add_argument('frames', nargs='+', help='recorded frames: image folders, images or videos')
+    parser.add_argument('--saved-model', help='SavedModel movenet_v1.tflite was exported from, enables the TFLite variants')
+    parser.add_argument('--output-dir', default=os.path.join('posture_corrector_api', 'models'))
+    parser.add_argument('--max-frames', type=int, default=300)
+    parser.add_argument('--camera-position', type=int, default=1, choices=[1, 2, 3])
+    parser.add_argument('--report', default='quantisation_report.json')
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, max_frames=args.max_frames)
+    print('Calibrating on {} frames...'.format(len(frames)))
+    variants = quantise_onnx(frames, args.output_dir)
+    if args.saved_model:
+        variants.update(quantise_tflite(args.saved_model, frames, args.output_dir))
+
+    report = build_report(frames, variants, camera_position=args.camera_position)
+    save_report(report, args.report)
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
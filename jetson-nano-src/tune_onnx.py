@@ -0,0 +1,13 @@
+from posture_corrector_api.onnx_tuning import autotune
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Searches the fastest ONNX Runtime settings for MoveNet on this machine.')
+    parser.add_argument('--runs', type=int, default=50, help='timed inferences per setting')
+    args = parser.parse_args()
+    autotune(runs=args.runs)
+
+
+if __name__ == '__main__':
+    main()